@@ -0,0 +1,56 @@
+"""Credit holds: reservations against a group's balance
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "004"
+down_revision: Union[str, None] = "003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "credit_holds",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("group_id", sa.UUID(), nullable=False),
+        sa.Column("amount", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("ACTIVE", "SETTLED", "RELEASED", "EXPIRED", name="holdstatus"),
+            nullable=False,
+        ),
+        sa.Column("reference", sa.String(255), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("resolved_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("ledger_entry_id", sa.UUID(), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(["group_id"], ["groups.id"]),
+        sa.ForeignKeyConstraint(["ledger_entry_id"], ["ledger.id"]),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("reference"),
+    )
+    # Only active holds are ever summed; keep the index small.
+    op.create_index(
+        "ix_credit_holds_group_active",
+        "credit_holds",
+        ["group_id", "expires_at"],
+        postgresql_where=sa.text("status = 'ACTIVE'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_credit_holds_group_active", table_name="credit_holds")
+    op.drop_table("credit_holds")
+    op.execute("DROP TYPE IF EXISTS holdstatus")
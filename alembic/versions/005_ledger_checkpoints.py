@@ -0,0 +1,45 @@
+"""Ledger checkpoints: immutable balance snapshots per group
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "005"
+down_revision: Union[str, None] = "004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ledger_checkpoints",
+        sa.Column("id", sa.UUID(), nullable=False),
+        sa.Column("group_id", sa.UUID(), nullable=False),
+        sa.Column("as_of", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("balance", sa.BigInteger(), nullable=False),
+        sa.Column("entry_count", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+        sa.ForeignKeyConstraint(["group_id"], ["groups.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_ledger_checkpoints_group_as_of",
+        "ledger_checkpoints",
+        ["group_id", "as_of"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_ledger_checkpoints_group_as_of", table_name="ledger_checkpoints")
+    op.drop_table("ledger_checkpoints")
@@ -0,0 +1,83 @@
+"""Budget spend counters, backfilled from usage_events
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "006"
+down_revision: Union[str, None] = "005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+BACKFILL = """
+WITH spend AS (
+    SELECT u.agent_id, a.agent_group_id, ag.workspace_id, ws.org_id,
+           u.created_at, u.credits_charged
+    FROM usage_events u
+    JOIN agents a ON a.id = u.agent_id
+    JOIN agent_groups ag ON ag.id = a.agent_group_id
+    JOIN workspaces ws ON ws.id = ag.workspace_id
+    WHERE u.status = 'SUCCESS' AND u.credits_charged > 0
+), levels AS (
+    SELECT 'AGENT' AS level, agent_id AS target_id, created_at, credits_charged FROM spend
+    UNION ALL
+    SELECT 'AGENT_GROUP', agent_group_id, created_at, credits_charged FROM spend
+    UNION ALL
+    SELECT 'WORKSPACE', workspace_id, created_at, credits_charged FROM spend
+    UNION ALL
+    SELECT 'ORG', org_id, created_at, credits_charged FROM spend
+), periods AS (
+    SELECT level, target_id, 'DAILY' AS period,
+           date_trunc('day', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS period_start,
+           credits_charged
+    FROM levels
+    UNION ALL
+    SELECT level, target_id, 'MONTHLY',
+           date_trunc('month', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           credits_charged
+    FROM levels
+    UNION ALL
+    SELECT level, target_id, 'TOTAL', TIMESTAMPTZ '1970-01-01 00:00:00+00', credits_charged
+    FROM levels
+)
+INSERT INTO budget_spend_counters
+    (level, target_id, period, period_start, spent_credits, updated_at)
+SELECT level::budgetlevel, target_id, period::budgetperiod, period_start,
+       SUM(credits_charged), now()
+FROM periods
+GROUP BY level, target_id, period, period_start
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "budget_spend_counters",
+        sa.Column(
+            "level",
+            sa.Enum("ORG", "WORKSPACE", "AGENT_GROUP", "AGENT", name="budgetlevel"),
+            nullable=False,
+        ),
+        sa.Column("target_id", sa.UUID(), nullable=False),
+        sa.Column(
+            "period",
+            postgresql.ENUM(name="budgetperiod", create_type=False),
+            nullable=False,
+        ),
+        sa.Column("period_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("spent_credits", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("level", "target_id", "period", "period_start"),
+    )
+    op.execute(BACKFILL)
+
+
+def downgrade() -> None:
+    op.drop_table("budget_spend_counters")
+    op.execute("DROP TYPE IF EXISTS budgetlevel")
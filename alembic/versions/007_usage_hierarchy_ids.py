@@ -0,0 +1,89 @@
+"""Denormalize org/workspace/agent_group ids onto usage_events
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-16
+
+The backfill and index builds run outside the migration transaction
+(autocommit blocks): rows are updated in committed batches and indexes are
+built CONCURRENTLY, so usage_events stays writable throughout.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "007"
+down_revision: Union[str, None] = "006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 10_000
+
+BACKFILL_BATCH = sa.text(
+    """
+    UPDATE usage_events u
+    SET agent_group_id = a.agent_group_id,
+        workspace_id = ag.workspace_id,
+        org_id = ws.org_id
+    FROM agents a
+    JOIN agent_groups ag ON ag.id = a.agent_group_id
+    JOIN workspaces ws ON ws.id = ag.workspace_id
+    WHERE a.id = u.agent_id
+      AND u.id IN (
+          SELECT id FROM usage_events
+          WHERE agent_id IS NOT NULL AND org_id IS NULL
+          LIMIT :batch_size
+      )
+    """
+)
+
+INDEXES = [
+    ("ix_usage_org_status_created", "org_id"),
+    ("ix_usage_workspace_status_created", "workspace_id"),
+    ("ix_usage_agent_group_status_created", "agent_group_id"),
+    ("ix_usage_agent_status_created", "agent_id"),
+]
+
+
+def upgrade() -> None:
+    op.add_column("usage_events", sa.Column("agent_group_id", sa.UUID(), nullable=True))
+    op.add_column("usage_events", sa.Column("workspace_id", sa.UUID(), nullable=True))
+    op.add_column("usage_events", sa.Column("org_id", sa.UUID(), nullable=True))
+    op.create_foreign_key(
+        "fk_usage_agent_group_id", "usage_events", "agent_groups", ["agent_group_id"], ["id"]
+    )
+    op.create_foreign_key(
+        "fk_usage_workspace_id", "usage_events", "workspaces", ["workspace_id"], ["id"]
+    )
+    op.create_foreign_key(
+        "fk_usage_org_id", "usage_events", "organizations", ["org_id"], ["id"]
+    )
+
+    with op.get_context().autocommit_block():
+        conn = op.get_bind()
+        while conn.execute(BACKFILL_BATCH, {"batch_size": BATCH_SIZE}).rowcount:
+            pass
+
+        for name, column in INDEXES:
+            op.create_index(
+                name,
+                "usage_events",
+                [column, "status", "created_at"],
+                postgresql_include=["credits_charged"],
+                postgresql_concurrently=True,
+            )
+        # Superseded by ix_usage_agent_status_created (same leading column)
+        op.drop_index("ix_usage_agent_id", "usage_events", postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    op.create_index("ix_usage_agent_id", "usage_events", ["agent_id"])
+    for name, _ in INDEXES:
+        op.drop_index(name, "usage_events")
+    op.drop_constraint("fk_usage_org_id", "usage_events", type_="foreignkey")
+    op.drop_constraint("fk_usage_workspace_id", "usage_events", type_="foreignkey")
+    op.drop_constraint("fk_usage_agent_group_id", "usage_events", type_="foreignkey")
+    op.drop_column("usage_events", "org_id")
+    op.drop_column("usage_events", "workspace_id")
+    op.drop_column("usage_events", "agent_group_id")
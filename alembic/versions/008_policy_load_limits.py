@@ -0,0 +1,27 @@
+"""Policy tokens-per-minute and concurrent-request limits
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("policies", sa.Column("tpm_limit", sa.Integer(), nullable=True))
+    op.add_column(
+        "policies", sa.Column("max_concurrent_requests", sa.Integer(), nullable=True)
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("policies", "max_concurrent_requests")
+    op.drop_column("policies", "tpm_limit")
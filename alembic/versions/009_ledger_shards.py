@@ -0,0 +1,70 @@
+"""Ledger shards: optional sub-accounts per billing group
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-16
+
+Existing rows land in shard 0 (server default), so unsharded groups are
+unchanged. The ledger index is built CONCURRENTLY in an autocommit block.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "009"
+down_revision: Union[str, None] = "008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "groups",
+        sa.Column("ledger_shards", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.add_column(
+        "ledger",
+        sa.Column("shard", sa.SmallInteger(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "credit_holds",
+        sa.Column("shard", sa.SmallInteger(), server_default="0", nullable=False),
+    )
+    op.add_column("ledger_checkpoints", sa.Column("shard", sa.SmallInteger(), nullable=True))
+    op.drop_index("ix_ledger_checkpoints_group_as_of", table_name="ledger_checkpoints")
+    op.create_index(
+        "ix_ledger_checkpoints_group_shard_as_of",
+        "ledger_checkpoints",
+        ["group_id", "shard", "as_of"],
+        unique=True,
+        postgresql_nulls_not_distinct=True,
+    )
+
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE transactiontype ADD VALUE IF NOT EXISTS 'SHARD_TRANSFER'")
+        op.create_index(
+            "ix_ledger_group_shard_created",
+            "ledger",
+            ["group_id", "shard", "created_at"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    # PostgreSQL cannot drop an enum value; SHARD_TRANSFER stays in the type.
+    op.drop_index("ix_ledger_group_shard_created", table_name="ledger")
+    op.drop_index(
+        "ix_ledger_checkpoints_group_shard_as_of", table_name="ledger_checkpoints"
+    )
+    op.execute("DELETE FROM ledger_checkpoints WHERE shard IS NOT NULL")
+    op.create_index(
+        "ix_ledger_checkpoints_group_as_of",
+        "ledger_checkpoints",
+        ["group_id", "as_of"],
+        unique=True,
+    )
+    op.drop_column("ledger_checkpoints", "shard")
+    op.drop_column("credit_holds", "shard")
+    op.drop_column("ledger", "shard")
+    op.drop_column("groups", "ledger_shards")
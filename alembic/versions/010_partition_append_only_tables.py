@@ -0,0 +1,166 @@
+"""Partition ledger, usage_events and audit_logs by month on created_at
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-16
+
+Each table is rebuilt as a declaratively range-partitioned table: monthly
+partitions (<table>_yYYYYmMM, UTC months) from the oldest row through three
+months ahead, plus <table>_default. Existing rows are copied inside the
+migration transaction, so run it in a maintenance window; afterwards
+`python -m scripts.maintenance partitions create` keeps future months ahead.
+
+The primary keys become (id, created_at), as PostgreSQL requires of the
+partition key. Two constraints cannot survive that and are replaced:
+- ledger.idempotency_key UNIQUE -> ledger_idempotency_keys (one row per key)
+- credit_holds.ledger_entry_id FK -> dropped (holds do not carry the
+  entry's created_at)
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "010"
+down_revision: Union[str, None] = "009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+# table -> (indexes as (name, columns, include), foreign keys as (name, column, target))
+TABLES = {
+    "ledger": (
+        [
+            ("ix_ledger_group_id", ["group_id"], None),
+            ("ix_ledger_group_created", ["group_id", "created_at"], None),
+            ("ix_ledger_group_shard_created", ["group_id", "shard", "created_at"], None),
+        ],
+        [("ledger_group_id_fkey", "group_id", "groups")],
+    ),
+    "usage_events": (
+        [
+            ("ix_usage_group_user", ["group_id", "user_id"], None),
+            ("ix_usage_group_created", ["group_id", "created_at"], None),
+            ("ix_usage_org_status_created", ["org_id", "status", "created_at"], ["credits_charged"]),
+            (
+                "ix_usage_workspace_status_created",
+                ["workspace_id", "status", "created_at"],
+                ["credits_charged"],
+            ),
+            (
+                "ix_usage_agent_group_status_created",
+                ["agent_group_id", "status", "created_at"],
+                ["credits_charged"],
+            ),
+            (
+                "ix_usage_agent_status_created",
+                ["agent_id", "status", "created_at"],
+                ["credits_charged"],
+            ),
+        ],
+        [
+            ("usage_events_group_id_fkey", "group_id", "groups"),
+            ("usage_events_user_id_fkey", "user_id", "users"),
+            ("fk_usage_agent_id", "agent_id", "agents"),
+            ("fk_usage_agent_group_id", "agent_group_id", "agent_groups"),
+            ("fk_usage_workspace_id", "workspace_id", "workspaces"),
+            ("fk_usage_org_id", "org_id", "organizations"),
+        ],
+    ),
+    "audit_logs": (
+        [
+            ("ix_audit_org_id", ["org_id"], None),
+            ("ix_audit_created_at", ["created_at"], None),
+            ("ix_audit_event_type", ["event_type"], None),
+        ],
+        [
+            ("audit_logs_actor_user_id_fkey", "actor_user_id", "users"),
+            ("audit_logs_actor_agent_id_fkey", "actor_agent_id", "agents"),
+        ],
+    ),
+}
+
+# One partition per month from the oldest row (or now) to MONTHS_AHEAD out.
+CREATE_PARTITIONS = """
+DO $$
+DECLARE
+    first_month date := date_trunc(
+        'month', coalesce((SELECT min(created_at) FROM {old}), now()) AT TIME ZONE 'UTC'
+    )::date;
+    last_month date := (date_trunc('month', now() AT TIME ZONE 'UTC')
+                        + interval '{months_ahead} months')::date;
+    m date := first_month;
+BEGIN
+    WHILE m <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+            '{table}_' || to_char(m, '"y"YYYY"m"MM'),
+            to_char(m, 'YYYY-MM-DD') || ' 00:00:00+00',
+            to_char(m + interval '1 month', 'YYYY-MM-DD') || ' 00:00:00+00'
+        );
+        m := m + interval '1 month';
+    END LOOP;
+END $$
+"""
+
+
+def _create_indexes_and_fks(table: str) -> None:
+    indexes, foreign_keys = TABLES[table]
+    for name, columns, include in indexes:
+        op.create_index(name, table, columns, postgresql_include=include or [])
+    for name, column, target in foreign_keys:
+        op.create_foreign_key(name, table, target, [column], ["id"])
+
+
+def upgrade() -> None:
+    op.drop_constraint("credit_holds_ledger_entry_id_fkey", "credit_holds", type_="foreignkey")
+
+    for table in TABLES:
+        old = f"{table}_unpartitioned"
+        op.rename_table(table, old)
+        op.execute(
+            f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) "
+            "PARTITION BY RANGE (created_at)"
+        )
+        op.execute(CREATE_PARTITIONS.format(table=table, old=old, months_ahead=MONTHS_AHEAD))
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+        # Dropped before the new constraints so their names are free again
+        op.drop_table(old)
+        op.create_primary_key(f"{table}_pkey", table, ["id", "created_at"])
+        _create_indexes_and_fks(table)
+
+    op.create_table(
+        "ledger_idempotency_keys",
+        sa.Column("idempotency_key", sa.String(255), nullable=False),
+        sa.Column("ledger_entry_id", sa.UUID(), nullable=False),
+        sa.Column("entry_created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["ledger_entry_id", "entry_created_at"], ["ledger.id", "ledger.created_at"]
+        ),
+        sa.PrimaryKeyConstraint("idempotency_key"),
+    )
+    op.execute(
+        "INSERT INTO ledger_idempotency_keys (idempotency_key, ledger_entry_id, entry_created_at) "
+        "SELECT idempotency_key, id, created_at FROM ledger WHERE idempotency_key IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("ledger_idempotency_keys")
+
+    for table in TABLES:
+        old = f"{table}_partitioned"
+        op.rename_table(table, old)
+        op.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS)")
+        op.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+        # Drops every partition with it
+        op.drop_table(old)
+        op.create_primary_key(f"{table}_pkey", table, ["id"])
+        _create_indexes_and_fks(table)
+
+    op.create_unique_constraint("ledger_idempotency_key_key", "ledger", ["idempotency_key"])
+    op.create_foreign_key(
+        "credit_holds_ledger_entry_id_fkey", "credit_holds", "ledger", ["ledger_entry_id"], ["id"]
+    )
@@ -0,0 +1,67 @@
+"""Hourly and daily usage rollups with a high-water mark
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-16
+
+The tables start empty, with no high-water mark, so analytics keep reading
+raw usage_events until the first `python -m scripts.maintenance rollup`.
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "011"
+down_revision: Union[str, None] = "010"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ROLLUP_TABLES = ("usage_rollups_hourly", "usage_rollups_daily")
+
+
+def upgrade() -> None:
+    for table in ROLLUP_TABLES:
+        op.create_table(
+            table,
+            sa.Column("group_id", sa.UUID(), nullable=False),
+            sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("user_id", sa.UUID(), nullable=False),
+            sa.Column("org_id", sa.UUID(), nullable=False),
+            sa.Column("workspace_id", sa.UUID(), nullable=False),
+            sa.Column("agent_group_id", sa.UUID(), nullable=False),
+            sa.Column("agent_id", sa.UUID(), nullable=False),
+            sa.Column("provider", sa.String(64), nullable=False),
+            sa.Column("model", sa.String(128), nullable=False),
+            sa.Column(
+                "status",
+                postgresql.ENUM(name="usagestatus", create_type=False),
+                nullable=False,
+            ),
+            sa.Column("request_count", sa.BigInteger(), nullable=False),
+            sa.Column("input_tokens", sa.BigInteger(), nullable=False),
+            sa.Column("output_tokens", sa.BigInteger(), nullable=False),
+            sa.Column("total_tokens", sa.BigInteger(), nullable=False),
+            sa.Column("cost_usd", sa.Numeric(24, 8), nullable=False),
+            sa.Column("credits_charged", sa.BigInteger(), nullable=False),
+            sa.Column("latency_ms_sum", sa.BigInteger(), nullable=False),
+            sa.Column("latency_count", sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint(
+                "group_id", "bucket_start", "user_id", "org_id", "workspace_id",
+                "agent_group_id", "agent_id", "provider", "model", "status",
+            ),
+        )
+    op.create_table(
+        "usage_rollup_state",
+        sa.Column("name", sa.String(64), nullable=False),
+        sa.Column("high_water_mark", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("usage_rollup_state")
+    for table in ROLLUP_TABLES:
+        op.drop_table(table)
@@ -0,0 +1,24 @@
+"""Index hourly usage rollups by org for spend forecasts
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "012"
+down_revision: Union[str, None] = "011"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_usage_rollups_hourly_org_bucket", "usage_rollups_hourly", ["org_id", "bucket_start"]
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_usage_rollups_hourly_org_bucket", table_name="usage_rollups_hourly")
@@ -0,0 +1,31 @@
+"""Hourly heavy-hitter summaries per billing group
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-16
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "013"
+down_revision: Union[str, None] = "012"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "heavy_hitter_slots",
+        sa.Column("group_id", sa.UUID(), nullable=False),
+        sa.Column("dimension", sa.String(16), nullable=False),
+        sa.Column("slot_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("summary", sa.JSON(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("group_id", "dimension", "slot_start"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("heavy_hitter_slots")
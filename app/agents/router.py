@@ -1,6 +1,6 @@
 import uuid
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 
 from app.agents import service as agent_service
 from app.agents.schemas import (
@@ -11,7 +11,9 @@ from app.agents.schemas import (
     ApiKeyResponse,
 )
 from app.core.dependencies import CurrentUser, DbSession
+from app.core.pagination import page_items
 from app.core.tenancy import require_owned_agent, require_owned_agent_group
+from app.gateway.context import invalidate_agent_contexts
 
 router = APIRouter(prefix="/agent-groups/{agent_group_id}/agents", tags=["agents"])
 key_router = APIRouter(prefix="/agents/{agent_id}/keys", tags=["api-keys"])
@@ -26,9 +28,17 @@ async def create_agent(agent_group_id: uuid.UUID, body: AgentCreate, user: Curre
 
 
 @router.get("", response_model=list[AgentResponse])
-async def list_agents(agent_group_id: uuid.UUID, user: CurrentUser, db: DbSession):
+async def list_agents(
+    agent_group_id: uuid.UUID,
+    user: CurrentUser,
+    db: DbSession,
+    response: Response,
+    limit: int | None = None,
+    cursor: str | None = None,
+):
     await require_owned_agent_group(db, agent_group_id=agent_group_id, user_id=user.id)
-    return await agent_service.list_agents_for_group(db, agent_group_id)
+    page = await agent_service.list_agents_for_group(db, agent_group_id, limit, cursor)
+    return page_items(page, response)
 
 
 @key_router.post("", response_model=ApiKeyCreated, status_code=201)
@@ -48,18 +58,28 @@ async def create_api_key(agent_id: uuid.UUID, body: ApiKeyCreate, user: CurrentU
 
 
 @key_router.get("", response_model=list[ApiKeyResponse])
-async def list_api_keys(agent_id: uuid.UUID, user: CurrentUser, db: DbSession):
+async def list_api_keys(
+    agent_id: uuid.UUID,
+    user: CurrentUser,
+    db: DbSession,
+    response: Response,
+    limit: int | None = None,
+    cursor: str | None = None,
+):
     await require_owned_agent(db, agent_id=agent_id, user_id=user.id)
-    return await agent_service.list_api_keys(db, agent_id=agent_id)
+    page = await agent_service.list_api_keys(db, agent_id=agent_id, limit=limit, cursor=cursor)
+    return page_items(page, response)
 
 
 @key_router.delete("/{key_id}", status_code=204)
 async def revoke_api_key(agent_id: uuid.UUID, key_id: uuid.UUID, user: CurrentUser, db: DbSession):
     await require_owned_agent(db, agent_id=agent_id, user_id=user.id)
-    async with db.begin():
-        await agent_service.revoke_api_key(
-            db,
-            key_id,
-            reason="revoked by user",
-            agent_id=agent_id,
-        )
+    key = await agent_service.revoke_api_key(
+        db,
+        key_id,
+        reason="revoked by user",
+        agent_id=agent_id,
+    )
+    await db.commit()
+    # Committed — drop the cached gateway snapshot so the key stops working now.
+    invalidate_agent_contexts(key_hash=key.key_hash)
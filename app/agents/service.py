@@ -14,6 +14,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.agents.models import Agent, AgentStatus, ApiKey
 from app.core.exceptions import AppError
+from app.core.pagination import Page, paginate
 
 
 def _generate_platform_key() -> str:
@@ -68,6 +69,11 @@ async def revoke_api_key(
     reason: str | None = None,
     agent_id: uuid.UUID | None = None,
 ) -> ApiKey:
+    """
+    Deactivate a key. After committing, the caller must call
+    invalidate_agent_contexts(key_hash=key.key_hash). Invalidating before the
+    commit lets a concurrent request cache the still-active row again.
+    """
     result = await db.execute(select(ApiKey).where(ApiKey.id == api_key_id))
     key = result.scalar_one_or_none()
     if key is None:
@@ -80,13 +86,15 @@ async def revoke_api_key(
     return key
 
 
-async def list_api_keys(db: AsyncSession, agent_id: uuid.UUID) -> list[ApiKey]:
-    result = await db.execute(
-        select(ApiKey)
-        .where(ApiKey.agent_id == agent_id)
-        .order_by(ApiKey.created_at.desc())
+async def list_api_keys(
+    db: AsyncSession,
+    agent_id: uuid.UUID,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> Page[ApiKey]:
+    return await paginate(
+        db, select(ApiKey).where(ApiKey.agent_id == agent_id), ApiKey, limit=limit, cursor=cursor
     )
-    return list(result.scalars().all())
 
 
 async def get_agent(db: AsyncSession, agent_id: uuid.UUID) -> Agent | None:
@@ -94,11 +102,21 @@ async def get_agent(db: AsyncSession, agent_id: uuid.UUID) -> Agent | None:
     return result.scalar_one_or_none()
 
 
-async def list_agents_for_group(db: AsyncSession, agent_group_id: uuid.UUID) -> list[Agent]:
-    result = await db.execute(
-        select(Agent).where(Agent.agent_group_id == agent_group_id).order_by(Agent.created_at)
+async def list_agents_for_group(
+    db: AsyncSession,
+    agent_group_id: uuid.UUID,
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> Page[Agent]:
+    # Oldest first
+    return await paginate(
+        db,
+        select(Agent).where(Agent.agent_group_id == agent_group_id),
+        Agent,
+        limit=limit,
+        cursor=cursor,
+        descending=False,
     )
-    return list(result.scalars().all())
 
 
 async def create_agent(
@@ -114,6 +132,8 @@ async def create_agent(
 
 
 async def disable_agent(db: AsyncSession, agent_id: uuid.UUID, reason: str = "budget_exhausted") -> None:
+    """Set the agent's status. After committing, the caller must call
+    invalidate_agent_contexts(agent_id=agent_id), as with revoke_api_key."""
     result = await db.execute(select(Agent).where(Agent.id == agent_id))
     agent = result.scalar_one_or_none()
     if agent:
@@ -3,15 +3,16 @@ import uuid
 from sqlalchemy import ForeignKey, Index, JSON, String, Text, Uuid
 from sqlalchemy.orm import Mapped, mapped_column
 
-from app.db.base import Base, TimestampMixin, UUIDMixin
+from app.db.base import Base, PartitionedTimestampMixin, UUIDMixin
 
 
-class AuditLog(UUIDMixin, TimestampMixin, Base):
+class AuditLog(UUIDMixin, PartitionedTimestampMixin, Base):
     """Immutable audit trail for security-relevant events."""
     __tablename__ = "audit_logs"
     __table_args__ = (
         Index("ix_audit_org_id", "org_id"),
         Index("ix_audit_created_at", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
     org_id: Mapped[uuid.UUID] = mapped_column(Uuid, nullable=False)
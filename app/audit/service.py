@@ -7,8 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.audit.models import AuditLog
 
 
-async def log_event(
-    db: AsyncSession,
+def build_audit_event(
     org_id: uuid.UUID,
     event_type: str,
     *,
@@ -19,7 +18,8 @@ async def log_event(
     description: str | None = None,
     metadata: dict[str, Any] | None = None,
 ) -> AuditLog:
-    entry = AuditLog(
+    """A new, not yet added audit entry (for callers that insert it themselves)."""
+    return AuditLog(
         org_id=org_id,
         actor_user_id=actor_user_id,
         actor_agent_id=actor_agent_id,
@@ -29,6 +29,30 @@ async def log_event(
         description=description,
         metadata_=metadata,
     )
+
+
+async def log_event(
+    db: AsyncSession,
+    org_id: uuid.UUID,
+    event_type: str,
+    *,
+    actor_user_id: uuid.UUID | None = None,
+    actor_agent_id: uuid.UUID | None = None,
+    resource_type: str | None = None,
+    resource_id: str | None = None,
+    description: str | None = None,
+    metadata: dict[str, Any] | None = None,
+) -> AuditLog:
+    entry = build_audit_event(
+        org_id,
+        event_type,
+        actor_user_id=actor_user_id,
+        actor_agent_id=actor_agent_id,
+        resource_type=resource_type,
+        resource_id=resource_id,
+        description=description,
+        metadata=metadata,
+    )
     db.add(entry)
     await db.flush()
     return entry
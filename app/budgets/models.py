@@ -1,7 +1,8 @@
 import enum
 import uuid
+from datetime import datetime
 
-from sqlalchemy import BigInteger, Boolean, CheckConstraint, Enum, ForeignKey, Uuid
+from sqlalchemy import BigInteger, Boolean, CheckConstraint, DateTime, Enum, ForeignKey, Uuid
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.base import Base, TimestampMixin, UUIDMixin
@@ -13,6 +14,13 @@ class BudgetPeriod(str, enum.Enum):
     TOTAL = "TOTAL"  # Lifetime cap
 
 
+class BudgetLevel(str, enum.Enum):
+    ORG = "ORG"
+    WORKSPACE = "WORKSPACE"
+    AGENT_GROUP = "AGENT_GROUP"
+    AGENT = "AGENT"
+
+
 class Budget(UUIDMixin, TimestampMixin, Base):
     """
     Credit budget caps at any level of the hierarchy.
@@ -49,3 +57,22 @@ class Budget(UUIDMixin, TimestampMixin, Base):
     # Auto-disable the entity when budget is exhausted
     auto_disable: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
     is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
+
+
+class BudgetSpendCounter(Base):
+    """
+    Credits spent by one hierarchy target in one budget period.
+
+    Incremented in the same transaction as the ledger deduction, so budget
+    checks are primary-key reads instead of SUMs over usage_events.
+    TOTAL counters use the epoch as their period_start.
+    """
+    __tablename__ = "budget_spend_counters"
+
+    level: Mapped[BudgetLevel] = mapped_column(Enum(BudgetLevel), primary_key=True)
+    # No FK: the target lives in one of four tables depending on level
+    target_id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True)
+    period: Mapped[BudgetPeriod] = mapped_column(Enum(BudgetPeriod), primary_key=True)
+    period_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    spent_credits: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
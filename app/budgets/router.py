@@ -1,12 +1,13 @@
 import uuid
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 
 from app.budgets import service as budget_service
 from app.budgets.models import Budget
 from app.budgets.schemas import BudgetCreate, BudgetResponse
 from app.core.dependencies import CurrentUser, DbSession
 from app.core.exceptions import AppError
+from app.core.pagination import page_items
 from app.core.tenancy import (
     require_owned_agent,
     require_owned_agent_group,
@@ -51,10 +52,13 @@ async def create_budget(body: BudgetCreate, user: CurrentUser, db: DbSession):
 async def list_budgets(
     user: CurrentUser,
     db: DbSession,
+    response: Response,
     org_id: uuid.UUID | None = None,
     workspace_id: uuid.UUID | None = None,
     agent_group_id: uuid.UUID | None = None,
     agent_id: uuid.UUID | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
 ):
     target_count = sum(
         1
@@ -79,11 +83,13 @@ async def list_budgets(
     elif agent_id is not None:
         await require_owned_agent(db, agent_id=agent_id, user_id=user.id)
 
-    budgets = await budget_service.list_budgets_for_target(
+    page = await budget_service.list_budgets_for_target(
         db,
         org_id=org_id,
         workspace_id=workspace_id,
         agent_group_id=agent_group_id,
         agent_id=agent_id,
+        limit=limit,
+        cursor=cursor,
     )
-    return [BudgetResponse.model_validate(b) for b in budgets]
+    return [BudgetResponse.model_validate(b) for b in page_items(page, response)]
@@ -2,75 +2,332 @@
 
 Hierarchy: Org → Workspace → AgentGroup → Agent.
 All levels are checked; any exceeded level blocks the request.
+
+Spend per (level, target, period, period start) is kept in
+budget_spend_counters, bumped by record_spend() in the same transaction as
+the ledger deduction. A budget check is therefore one budgets query plus one
+primary-key lookup of the matching counters. rebuild_spend_counters()
+repopulates the table from usage_events.
+
+With BUDGET_SPEND_COUNTERS=false, spend is instead computed straight from
+usage_events by get_hierarchy_spend(): a single statement with a conditional
+SUM per (level, period) over the denormalized hierarchy ids, so latency does
+not grow with the number of budgets.
 """
 import uuid
-from datetime import datetime, timezone
+from collections import defaultdict
+from collections.abc import Collection
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import func, select
+from sqlalchemy import and_, delete, func, or_, select, true, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.budgets.models import Budget, BudgetPeriod
+from app.budgets.models import Budget, BudgetLevel, BudgetPeriod, BudgetSpendCounter
+from app.config import settings
 from app.core.exceptions import AppError
+from app.core.pagination import Page, paginate
 from app.db.session import async_session_factory
 from app.usage.models import UsageEvent, UsageStatus
 
+# period_start of every TOTAL (all-time) counter
+TOTAL_PERIOD_START = datetime(1970, 1, 1, tzinfo=timezone.utc)
 
-def _period_start(period: BudgetPeriod) -> datetime | None:
-    """Return the start of the current period, or None for TOTAL (all time)."""
-    now = datetime.now(timezone.utc)
+CounterKey = tuple[BudgetLevel, uuid.UUID, BudgetPeriod, datetime]
+
+# Denormalized hierarchy id of each level on usage_events
+_LEVEL_COLUMNS = {
+    BudgetLevel.ORG: UsageEvent.org_id,
+    BudgetLevel.WORKSPACE: UsageEvent.workspace_id,
+    BudgetLevel.AGENT_GROUP: UsageEvent.agent_group_id,
+    BudgetLevel.AGENT: UsageEvent.agent_id,
+}
+
+
+def _period_start(period: BudgetPeriod, now: datetime | None = None) -> datetime:
+    """Return the start of the period containing now (epoch for TOTAL)."""
+    now = now or datetime.now(timezone.utc)
     if period == BudgetPeriod.DAILY:
         return now.replace(hour=0, minute=0, second=0, microsecond=0)
     elif period == BudgetPeriod.MONTHLY:
         return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     else:  # TOTAL
-        return None
+        return TOTAL_PERIOD_START
+
+
+def _period_end(period: BudgetPeriod, start: datetime) -> datetime | None:
+    """When the period starting at `start` resets (never for TOTAL)."""
+    if period == BudgetPeriod.DAILY:
+        return start + timedelta(days=1)
+    if period == BudgetPeriod.MONTHLY:
+        return (start + timedelta(days=32)).replace(day=1)
+    return None
+
+
+def _budget_target(budget: Budget) -> tuple[BudgetLevel, uuid.UUID]:
+    if budget.org_id is not None:
+        return BudgetLevel.ORG, budget.org_id
+    if budget.workspace_id is not None:
+        return BudgetLevel.WORKSPACE, budget.workspace_id
+    if budget.agent_group_id is not None:
+        return BudgetLevel.AGENT_GROUP, budget.agent_group_id
+    return BudgetLevel.AGENT, budget.agent_id
+
+
+def _counter_keys(
+    *,
+    org_id: uuid.UUID,
+    workspace_id: uuid.UUID,
+    agent_group_id: uuid.UUID,
+    agent_id: uuid.UUID,
+    at: datetime,
+) -> list[CounterKey]:
+    targets = [
+        (BudgetLevel.ORG, org_id),
+        (BudgetLevel.WORKSPACE, workspace_id),
+        (BudgetLevel.AGENT_GROUP, agent_group_id),
+        (BudgetLevel.AGENT, agent_id),
+    ]
+    return [
+        (level, target_id, period, _period_start(period, at))
+        for level, target_id in targets
+        for period in BudgetPeriod
+    ]
+
+
+async def _upsert_counters(db: AsyncSession, increments: dict[CounterKey, int]) -> None:
+    """Add to spent_credits for each key (creating missing rows) in one statement."""
+    if not increments:
+        return
+    now = datetime.now(timezone.utc)
+    # Sorted so concurrent writers lock counter rows in the same order
+    rows = [
+        {
+            "level": level,
+            "target_id": target_id,
+            "period": period,
+            "period_start": period_start,
+            "spent_credits": credits,
+            "updated_at": now,
+        }
+        for (level, target_id, period, period_start), credits in sorted(
+            increments.items(), key=lambda item: tuple(map(str, item[0]))
+        )
+    ]
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(BudgetSpendCounter).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["level", "target_id", "period", "period_start"],
+        set_={
+            "spent_credits": BudgetSpendCounter.spent_credits + stmt.excluded.spent_credits,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    await db.execute(stmt)
 
 
-async def _sum_usage_for_period(
+async def record_spend(
     db: AsyncSession,
     *,
-    org_id: uuid.UUID | None = None,
-    workspace_id: uuid.UUID | None = None,
-    agent_group_id: uuid.UUID | None = None,
-    agent_id: uuid.UUID | None = None,
-    since: datetime | None,
-) -> int:
-    """Sum credits_charged for successful events scoped to a hierarchy level."""
-    # We need to join through the hierarchy to filter by level
-    # For simplicity, filter usage_events by agent_id when available,
-    # then join up the tree otherwise via subqueries.
+    org_id: uuid.UUID,
+    workspace_id: uuid.UUID,
+    agent_group_id: uuid.UUID,
+    agent_id: uuid.UUID,
+    credits: int,
+    at: datetime | None = None,
+) -> None:
+    """
+    Add charged credits to every level's DAILY, MONTHLY and TOTAL counter.
+    Call inside the transaction that deducts the credits.
+    """
+    if credits <= 0:
+        return
+    keys = _counter_keys(
+        org_id=org_id,
+        workspace_id=workspace_id,
+        agent_group_id=agent_group_id,
+        agent_id=agent_id,
+        at=at or datetime.now(timezone.utc),
+    )
+    await _upsert_counters(db, {key: credits for key in keys})
 
-    from app.agents.models import Agent
-    from app.agent_groups.models import AgentGroup
-    from app.workspaces.models import Workspace
 
-    q = select(func.coalesce(func.sum(UsageEvent.credits_charged), 0)).where(
-        UsageEvent.status == UsageStatus.SUCCESS
+async def get_period_spend(
+    db: AsyncSession, keys: list[CounterKey]
+) -> dict[CounterKey, int]:
+    """Primary-key lookup of several counters in one round trip (missing → 0)."""
+    if not keys:
+        return {}
+    result = await db.execute(
+        select(
+            BudgetSpendCounter.level,
+            BudgetSpendCounter.target_id,
+            BudgetSpendCounter.period,
+            BudgetSpendCounter.period_start,
+            BudgetSpendCounter.spent_credits,
+        ).where(
+            tuple_(
+                BudgetSpendCounter.level,
+                BudgetSpendCounter.target_id,
+                BudgetSpendCounter.period,
+                BudgetSpendCounter.period_start,
+            ).in_(keys)
+        )
     )
+    # Matched without period_start (SQLite hands it back naive); the IN list
+    # holds a single period_start per (level, target, period).
+    found = {
+        (level, target_id, period): spent
+        for level, target_id, period, _, spent in result.all()
+    }
+    return {key: found.get(key[:3], 0) for key in keys}
 
-    if since is not None:
-        q = q.where(UsageEvent.created_at >= since)
 
-    if agent_id is not None:
-        q = q.where(UsageEvent.agent_id == agent_id)
-    elif agent_group_id is not None:
-        # All agents in this agent_group
-        agent_ids_sq = select(Agent.id).where(Agent.agent_group_id == agent_group_id).scalar_subquery()
-        q = q.where(UsageEvent.agent_id.in_(agent_ids_sq))
-    elif workspace_id is not None:
-        # All agents in all agent_groups in this workspace
-        group_ids_sq = select(AgentGroup.id).where(AgentGroup.workspace_id == workspace_id).scalar_subquery()
-        agent_ids_sq = select(Agent.id).where(Agent.agent_group_id.in_(group_ids_sq)).scalar_subquery()
-        q = q.where(UsageEvent.agent_id.in_(agent_ids_sq))
-    elif org_id is not None:
-        # All agents in org (via workspace → agent_group → agent)
-        ws_ids_sq = select(Workspace.id).where(Workspace.org_id == org_id).scalar_subquery()
-        group_ids_sq = select(AgentGroup.id).where(AgentGroup.workspace_id.in_(ws_ids_sq)).scalar_subquery()
-        agent_ids_sq = select(Agent.id).where(Agent.agent_group_id.in_(group_ids_sq)).scalar_subquery()
-        q = q.where(UsageEvent.agent_id.in_(agent_ids_sq))
+async def get_hierarchy_spend(
+    db: AsyncSession,
+    *,
+    org_id: uuid.UUID,
+    workspace_id: uuid.UUID,
+    agent_group_id: uuid.UUID,
+    agent_id: uuid.UUID,
+    at: datetime | None = None,
+    periods: Collection[BudgetPeriod] | None = None,
+) -> dict[CounterKey, int]:
+    """
+    Current spend for every level × period (or only `periods`) from
+    usage_events, in a single statement: one aggregate row per level, each
+    computing all windows with SUM(...) FILTER (WHERE created_at >= start).
+    Every level filters on its own denormalized id, so each is an index-only
+    scan of (<level>_id, status, created_at) INCLUDE (credits_charged).
+    Without TOTAL the scan is also bounded below by the earliest window
+    start, which prunes usage_events to the partitions of the current month.
+    """
+    periods = list(BudgetPeriod) if periods is None else [p for p in BudgetPeriod if p in periods]
+    keys = [
+        key
+        for key in _counter_keys(
+            org_id=org_id,
+            workspace_id=workspace_id,
+            agent_group_id=agent_group_id,
+            agent_id=agent_id,
+            at=at or datetime.now(timezone.utc),
+        )
+        if key[2] in periods
+    ]
+    if not keys:
+        return {}
 
-    result = await db.execute(q)
-    return int(result.scalar() or 0)
+    subqueries = []
+    for level, column in _LEVEL_COLUMNS.items():
+        level_keys = [key for key in keys if key[0] == level]
+        windows = []
+        for _, _, period, period_start in level_keys:
+            total = func.sum(UsageEvent.credits_charged)
+            if period != BudgetPeriod.TOTAL:
+                total = total.filter(UsageEvent.created_at >= period_start)
+            windows.append(func.coalesce(total, 0).label(period.value.lower()))
+        conditions = [column == level_keys[0][1], UsageEvent.status == UsageStatus.SUCCESS]
+        if BudgetPeriod.TOTAL not in periods:
+            conditions.append(UsageEvent.created_at >= min(key[3] for key in level_keys))
+        subqueries.append(
+            select(*windows).where(*conditions).subquery(f"{level.value.lower()}_spend")
+        )
+
+    from_clause = subqueries[0]
+    for subquery in subqueries[1:]:
+        from_clause = from_clause.join(subquery, true())
+    result = await db.execute(
+        select(
+            *(subquery.c[period.value.lower()] for subquery in subqueries for period in periods)
+        ).select_from(from_clause)
+    )
+    return {key: int(value) for key, value in zip(keys, result.one())}
+
+
+async def get_budget_spend(
+    db: AsyncSession, budgets: list[Budget], now: datetime | None = None
+) -> dict[uuid.UUID, int]:
+    """
+    Current-period spend of each budget's target, keyed by budget id. Reads
+    the spend counters, or with BUDGET_SPEND_COUNTERS=false sums
+    usage_events with one filtered SUM per distinct counter key.
+    """
+    now = now or datetime.now(timezone.utc)
+    budget_keys = {
+        budget.id: (*_budget_target(budget), budget.period, _period_start(budget.period, now))
+        for budget in budgets
+    }
+    keys = list(set(budget_keys.values()))
+    if not keys:
+        return {}
+    if settings.budget_spend_counters:
+        spend = await get_period_spend(db, keys)
+    else:
+        windows = []
+        for level, target_id, period, period_start in keys:
+            condition = _LEVEL_COLUMNS[level] == target_id
+            if period != BudgetPeriod.TOTAL:
+                condition = and_(condition, UsageEvent.created_at >= period_start)
+            windows.append(func.coalesce(func.sum(UsageEvent.credits_charged).filter(condition), 0))
+        result = await db.execute(
+            select(*windows).where(
+                UsageEvent.status == UsageStatus.SUCCESS,
+                or_(*(_LEVEL_COLUMNS[level] == target_id for level, target_id, _, _ in keys)),
+            )
+        )
+        spend = {key: int(value) for key, value in zip(keys, result.one())}
+    return {budget_id: spend[key] for budget_id, key in budget_keys.items()}
+
+
+async def rebuild_spend_counters(db: AsyncSession, batch_size: int = 1000) -> int:
+    """
+    Recompute every counter from successful usage_events. Returns the number
+    of counter rows written.
+
+    Replaces the table contents inside the caller's transaction. Spend settled
+    concurrently may be counted twice or not at all, so run it while gateway
+    traffic is drained.
+    """
+    from app.agent_groups.models import AgentGroup
+    from app.agents.models import Agent
+    from app.workspaces.models import Workspace
+
+    # Resolve the hierarchy through the agent rather than the denormalized
+    # ids, so events written before they existed are counted too.
+    totals: dict[CounterKey, int] = defaultdict(int)
+    stream = await db.stream(
+        select(
+            Workspace.org_id,
+            AgentGroup.workspace_id,
+            Agent.agent_group_id,
+            UsageEvent.agent_id,
+            UsageEvent.created_at,
+            UsageEvent.credits_charged,
+        )
+        .join(Agent, Agent.id == UsageEvent.agent_id)
+        .join(AgentGroup, AgentGroup.id == Agent.agent_group_id)
+        .join(Workspace, Workspace.id == AgentGroup.workspace_id)
+        .where(UsageEvent.status == UsageStatus.SUCCESS, UsageEvent.credits_charged > 0)
+        .execution_options(yield_per=batch_size)
+    )
+    async for org_id, workspace_id, agent_group_id, agent_id, created_at, credits in stream:
+        if created_at.tzinfo is None:  # SQLite returns naive UTC
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        for key in _counter_keys(
+            org_id=org_id,
+            workspace_id=workspace_id,
+            agent_group_id=agent_group_id,
+            agent_id=agent_id,
+            at=created_at,
+        ):
+            totals[key] += credits
+
+    await db.execute(delete(BudgetSpendCounter))
+    items = list(totals.items())
+    for i in range(0, len(items), batch_size):
+        await _upsert_counters(db, dict(items[i : i + batch_size]))
+    return len(items)
 
 
 async def _auto_disable_target(
@@ -81,6 +338,7 @@ async def _auto_disable_target(
     """Persist budget-based disable in its own transaction."""
     from app.agent_groups.models import AgentGroup
     from app.agents.models import Agent, AgentStatus
+    from app.gateway.context import invalidate_agent_contexts
     from app.orgs.models import Organization
     from app.workspaces.models import Workspace
 
@@ -90,30 +348,31 @@ async def _auto_disable_target(
                 agent = await write_db.get(Agent, budget.agent_id)
                 if agent is not None:
                     agent.status = AgentStatus.BUDGET_EXHAUSTED
-                return
-
-            if budget.agent_group_id is not None:
+                disabled = {"agent_id": budget.agent_id}
+            elif budget.agent_group_id is not None:
                 agent_group = await write_db.get(AgentGroup, budget.agent_group_id)
                 if agent_group is not None:
                     agent_group.is_active = False
-                return
-
-            if budget.workspace_id is not None:
+                disabled = {"agent_group_id": budget.agent_group_id}
+            elif budget.workspace_id is not None:
                 workspace = await write_db.get(Workspace, budget.workspace_id)
                 if workspace is not None:
                     workspace.is_active = False
-                return
-
-            if budget.org_id is not None:
+                disabled = {"workspace_id": budget.workspace_id}
+            elif budget.org_id is not None:
                 org = await write_db.get(Organization, budget.org_id)
                 if org is not None:
                     org.is_active = False
-                return
+                disabled = {"org_id": budget.org_id}
+            else:
+                # Defensive fallback; target should always be set due schema/DB constraints.
+                agent = await write_db.get(Agent, fallback_agent_id)
+                if agent is not None:
+                    agent.status = AgentStatus.BUDGET_EXHAUSTED
+                disabled = {"agent_id": fallback_agent_id}
 
-            # Defensive fallback; target should always be set due schema/DB constraints.
-            agent = await write_db.get(Agent, fallback_agent_id)
-            if agent is not None:
-                agent.status = AgentStatus.BUDGET_EXHAUSTED
+    # Committed — drop cached gateway snapshots so the disable applies immediately.
+    invalidate_agent_contexts(**disabled)
 
 
 async def check_budgets(
@@ -141,16 +400,29 @@ async def check_budgets(
     )
     budgets = list(budgets_result.scalars().all())
 
-    for budget in budgets:
-        since = _period_start(budget.period)
-        current_spend = await _sum_usage_for_period(
+    if not budgets:
+        return
+
+    now = datetime.now(timezone.utc)
+    budget_keys = {
+        budget.id: (*_budget_target(budget), budget.period, _period_start(budget.period, now))
+        for budget in budgets
+    }
+    if settings.budget_spend_counters:
+        spend = await get_period_spend(db, list(set(budget_keys.values())))
+    else:
+        spend = await get_hierarchy_spend(
             db,
-            org_id=budget.org_id,
-            workspace_id=budget.workspace_id,
-            agent_group_id=budget.agent_group_id,
-            agent_id=budget.agent_id,
-            since=since,
+            org_id=org_id,
+            workspace_id=workspace_id,
+            agent_group_id=agent_group_id,
+            agent_id=agent_id,
+            at=now,
+            periods={budget.period for budget in budgets},
         )
+
+    for budget in budgets:
+        current_spend = spend[budget_keys[budget.id]]
         if current_spend + required_credits > budget.limit_credits:
             level = (
                 "organization" if budget.org_id
@@ -180,7 +452,9 @@ async def list_budgets_for_target(
     workspace_id: uuid.UUID | None = None,
     agent_group_id: uuid.UUID | None = None,
     agent_id: uuid.UUID | None = None,
-) -> list[Budget]:
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> Page[Budget]:
     q = select(Budget)
     if org_id is not None:
         q = q.where(Budget.org_id == org_id)
@@ -191,8 +465,6 @@ async def list_budgets_for_target(
     elif agent_id is not None:
         q = q.where(Budget.agent_id == agent_id)
     else:
-        return []
+        return Page([])
 
-    q = q.order_by(Budget.created_at.desc())
-    result = await db.execute(q)
-    return list(result.scalars().all())
+    return await paginate(db, q, Budget, limit=limit, cursor=cursor)
@@ -20,17 +20,114 @@ class Settings(BaseSettings):
     openai_base_url: str = "https://api.openai.com/v1"
     anthropic_api_key: str = ""
 
+    # Upstream provider HTTP clients. BYOK clients are pooled per
+    # (provider, credential) and the least recently used is closed once the
+    # pool is full. HTTP/2 additionally requires the optional `h2` package.
+    provider_max_connections: int = 100
+    provider_max_keepalive_connections: int = 20
+    provider_keepalive_expiry_seconds: float = 30.0
+    provider_http2: bool = False
+    byok_provider_pool_size: int = 256
+
     # Fernet key for encrypting provider credentials at rest.
     # Generate with: python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
     # Must be a 32-byte URL-safe base64-encoded key.
     credential_encryption_key: str = ""
 
+    # Decrypted BYOK keys cached per (org, provider); keep the TTL short.
+    credential_cache_size: int = 10_000
+    credential_cache_ttl_seconds: float = 60.0
+
     # 1 USD = 100 credits (credits are integer cents)
     credits_per_usd: int = 100
 
+    # Gateway credit reservations: a hold not settled or released within this
+    # window stops counting against the balance (abandoned request).
+    credit_hold_ttl_seconds: float = 600.0
+
+    # Ledger checkpoints cover entries older than this lag, so transactions
+    # still in flight (created_at set, not yet committed) are never skipped.
+    ledger_checkpoint_lag_seconds: float = 300.0
+    # Only write a new checkpoint once the uncovered tail has this many rows.
+    ledger_checkpoint_min_entries: int = 1000
+    # Group.ledger_shards is cached per process; set_shard_count updates the
+    # local entry, other workers pick the change up within this TTL.
+    ledger_shard_count_cache_ttl_seconds: float = 30.0
+    # Group commit: concurrent deductions for one group within this window
+    # settle in a single transaction (see ledger.service.DeductionBatcher).
+    ledger_batch_window_ms: float = 5.0
+    ledger_batch_max_size: int = 100
+
+    # ledger, usage_events and audit_logs are partitioned by month; the
+    # maintenance job keeps this many future partitions in place.
+    partition_months_ahead: int = 3
+    # usage_events / audit_logs partitions entirely older than this many months
+    # are detached by `maintenance partitions detach` (0 = keep everything).
+    partition_retention_months: int = 0
+
+    # Write-behind for gateway usage events and audit logs: inserted in batches
+    # after the settlement commits instead of inside it (see app.db.write_behind).
+    # Rows still buffered when a worker dies are lost.
+    write_behind_enabled: bool = False
+    write_behind_flush_ms: float = 50.0
+    write_behind_max_batch: int = 500
+    # put() blocks once this many rows are waiting (backpressure)
+    write_behind_max_pending: int = 10_000
+
+    # Usage rollups (app.usage.rollups) cover events created more than this
+    # long ago; newer ones are read raw. Must exceed the longest delay between
+    # an event's created_at and its commit, or the event is never counted.
+    usage_rollup_lag_seconds: int = 120
+
+    # Spend forecasts (GET /orgs/{org_id}/forecast): EWMA of hourly spend over
+    # the last forecast_window_hours complete hours, cached per org.
+    forecast_window_hours: int = 48
+    forecast_half_life_hours: float = 6.0
+    forecast_cache_size: int = 1024
+    forecast_cache_ttl_seconds: float = 60.0
+
+    # Approximate top users/agents/models per billing group (app.usage.heavy_hitters):
+    # one Space-Saving summary of this many counters per group, dimension and
+    # hour, merged into heavy_hitter_slots every heavy_hitter_flush_seconds.
+    heavy_hitter_capacity: int = 100
+    heavy_hitter_retention_hours: int = 168
+    heavy_hitter_flush_seconds: float = 10.0
+
+    # Columnar exports (app.exports): rows per server-side cursor fetch, which
+    # is also one Arrow record batch / Parquet row group.
+    export_chunk_rows: int = 50_000
+
+    # Budget checks read spend counters maintained at settlement. Set to false
+    # to compute spend from usage_events instead (one aggregate query).
+    budget_spend_counters: bool = True
+
+    # Policy rpm_limit is enforced through Redis when redis_url is set (shared
+    # across workers); with an empty redis_url each process limits on its own.
+    rate_limit_redis_timeout_seconds: float = 0.25
+    # A max_concurrent_requests slot not released within this window (worker
+    # crashed mid-request) is freed automatically.
+    rate_limit_lease_seconds: float = 900.0
+
     db_pool_size: int = 20
     db_max_overflow: int = 10
 
+    # Gateway: in-process cache of API key → agent → hierarchy snapshots.
+    # The TTL bounds staleness across worker processes; 0 disables the cache.
+    gateway_context_cache_size: int = 10_000
+    gateway_context_cache_ttl_seconds: float = 30.0
+
+    # Compiled effective policies, per agent. Policy changes made through the
+    # API invalidate immediately; the TTL covers changes made by other processes.
+    policy_cache_size: int = 10_000
+    policy_cache_ttl_seconds: float = 60.0
+
+    # Memoized token counts of repeated system prompts (gateway pre-checks).
+    token_estimate_cache_size: int = 2048
+    token_estimate_cache_ttl_seconds: float = 3600.0
+
+    # In-memory pricing table: how often to check the DB for changed rules.
+    pricing_refresh_interval_seconds: float = 30.0
+
     def get_fernet_key(self) -> bytes:
         """Return a valid Fernet key, generating a default if not set (dev only)."""
         if self.credential_encryption_key:
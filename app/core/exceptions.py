@@ -1,7 +1,16 @@
+import math
+
+
 class AppError(Exception):
-    def __init__(self, message: str, status_code: int = 400):
+    def __init__(
+        self,
+        message: str,
+        status_code: int = 400,
+        headers: dict[str, str] | None = None,
+    ):
         self.message = message
         self.status_code = status_code
+        self.headers = headers
         super().__init__(message)
 
 
@@ -20,6 +29,17 @@ class SpendLimitExceededError(AppError):
         super().__init__(message, status_code=429)
 
 
+class RateLimitExceededError(AppError):
+    def __init__(self, message: str, retry_after: float):
+        # Retry-After takes whole seconds; round up so clients never retry early.
+        super().__init__(
+            message,
+            status_code=429,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        self.retry_after = retry_after
+
+
 class NotFoundError(AppError):
     def __init__(self, entity: str, id: str):
         super().__init__(f"{entity} not found: {id}", status_code=404)
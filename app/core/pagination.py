@@ -0,0 +1,104 @@
+"""Keyset (cursor) pagination on (created_at, id).
+
+A page is "the next `limit` rows after the last one the client saw", so the
+database seeks straight to it through the (…, created_at) index instead of
+reading and discarding OFFSET rows: page 1000 costs the same as page 1.
+Cursors are opaque to clients (base64 of the last row's created_at and id)
+and stay valid while rows are inserted or deleted around them.
+
+Endpoints that return a bare list take optional `limit`/`cursor` query
+parameters and report the next cursor in the X-Next-Cursor header.
+"""
+import base64
+import binascii
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Generic, TypeVar
+
+from fastapi import Response
+from sqlalchemy import Select, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.exceptions import AppError
+
+T = TypeVar("T")
+
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+@dataclass(frozen=True)
+class Page(Generic[T]):
+    items: list[T]
+    next_cursor: str | None = None  # None = last page
+
+
+def encode_cursor(created_at: datetime, id: uuid.UUID) -> str:
+    if created_at.tzinfo is None:  # SQLite returns naive UTC
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    raw = f"{created_at.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id = raw.split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise AppError("Invalid pagination cursor", status_code=400)
+
+
+def check_page_size(limit: int) -> int:
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise AppError(f"limit must be between 1 and {MAX_PAGE_SIZE}", status_code=400)
+    return limit
+
+
+async def paginate(
+    db: AsyncSession,
+    stmt: Select,
+    model: Any,
+    *,
+    limit: int | None,
+    cursor: str | None = None,
+    descending: bool = True,
+) -> Page:
+    """
+    Run `stmt` (a select of `model`, without ORDER BY) ordered by
+    (created_at, id) and return the page after `cursor`. With limit=None
+    every remaining row is returned in one page.
+    """
+    created_at, id = model.created_at, model.id
+    if cursor is not None:
+        after_at, after_id = decode_cursor(cursor)
+        if descending:
+            # The leading created_at bound is what the index seeks on
+            stmt = stmt.where(
+                created_at <= after_at,
+                or_(created_at < after_at, and_(created_at == after_at, id < after_id)),
+            )
+        else:
+            stmt = stmt.where(
+                created_at >= after_at,
+                or_(created_at > after_at, and_(created_at == after_at, id > after_id)),
+            )
+    order = (created_at.desc(), id.desc()) if descending else (created_at.asc(), id.asc())
+    stmt = stmt.order_by(*order)
+    if limit is not None:
+        stmt = stmt.limit(check_page_size(limit) + 1)
+
+    result = await db.execute(stmt)
+    items = list(result.scalars().all())
+    if limit is None or len(items) <= limit:
+        return Page(items)
+    items = items[:limit]
+    return Page(items, encode_cursor(items[-1].created_at, items[-1].id))
+
+
+def page_items(page: Page[T], response: Response) -> list[T]:
+    """The items of `page` for a list endpoint; the next cursor goes in a header."""
+    if page.next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = page.next_cursor
+    return page.items
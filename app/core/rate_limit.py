@@ -0,0 +1,361 @@
+"""Sliding-window rate limiting: requests, tokens and in-flight requests.
+
+The Redis limiter keeps per-key state in Redis and checks and updates it in
+a single Lua script per call, so every worker process shares one window and
+concurrent requests cannot both take the last slot:
+
+* requests — a sorted set of timestamps (exact sliding window log);
+* tokens — current and previous fixed buckets, the previous one weighted by
+  how much of it still overlaps the window (O(1) regardless of volume);
+* in-flight requests — a sorted set of leases scored by expiry, so a worker
+  that dies mid-request cannot hold a slot forever.
+
+Timestamps come from the Redis server clock (``TIME``) so skew between app
+hosts does not widen the windows.
+
+When ``settings.redis_url`` is empty, or Redis is unreachable, an in-process
+limiter with the same semantics is used instead. It only sees the current
+process, so with N workers the effective limit is up to N times higher.
+"""
+import logging
+import time
+import uuid
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_LUA_NOW = """
+local t = redis.call('TIME')
+local now_ms = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+"""
+
+# Requests: sliding window log. KEYS[1] = key; ARGV = limit, window_ms, unique member
+_SLIDING_WINDOW_LUA = _LUA_NOW + """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local window_ms = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now_ms - window_ms)
+local count = redis.call('ZCARD', key)
+if count < limit then
+    redis.call('ZADD', key, now_ms, ARGV[3])
+    redis.call('PEXPIRE', key, window_ms)
+    return {1, limit - count - 1, 0}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+local retry_ms = window_ms
+if oldest[2] then
+    retry_ms = tonumber(oldest[2]) + window_ms - now_ms
+end
+return {0, 0, retry_ms}
+"""
+
+# Tokens: sliding window counter (current bucket + linearly decaying previous
+# bucket), O(1) per key. KEYS[1] = key; ARGV = tokens, limit, window_ms.
+# A negative limit applies the delta unconditionally (usage correction).
+_TOKEN_WINDOW_LUA = _LUA_NOW + """
+local key = KEYS[1]
+local tokens = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local window_ms = tonumber(ARGV[3])
+local bucket = now_ms - (now_ms % window_ms)
+local state = redis.call('HMGET', key, 'bucket', 'cur', 'prev')
+local start = tonumber(state[1]) or bucket
+local cur = tonumber(state[2]) or 0
+local prev = tonumber(state[3]) or 0
+if start ~= bucket then
+    if bucket - start == window_ms then prev = cur else prev = 0 end
+    cur = 0
+end
+local weighted_prev = prev * (1 - (now_ms - bucket) / window_ms)
+local used = weighted_prev + cur
+if limit >= 0 and used + tokens > limit then
+    local need = used + tokens - limit
+    local retry_ms = bucket + window_ms - now_ms
+    if prev > 0 and need <= weighted_prev then
+        retry_ms = math.ceil(need / prev * window_ms)
+    end
+    return {0, 0, retry_ms}
+end
+cur = math.max(0, cur + tokens)
+redis.call('HSET', key, 'bucket', bucket, 'cur', cur, 'prev', prev)
+redis.call('PEXPIRE', key, window_ms * 2)
+return {1, math.max(0, math.floor(limit - used - tokens)), 0}
+"""
+
+# In-flight requests: one lease per request, scored by expiry so leases of
+# crashed workers age out. KEYS[1] = key; ARGV = limit, lease_ms, lease id
+_SLOTS_LUA = _LUA_NOW + """
+local key = KEYS[1]
+local limit = tonumber(ARGV[1])
+local lease_ms = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now_ms)
+local count = redis.call('ZCARD', key)
+if count >= limit then
+    return {0, 0, 0}
+end
+redis.call('ZADD', key, now_ms + lease_ms, ARGV[3])
+redis.call('PEXPIRE', key, lease_ms)
+return {1, limit - count - 1, 0}
+"""
+
+# Skip Redis for this long after a failure instead of paying a timeout per request.
+REDIS_RETRY_SECONDS = 5.0
+# Suggested retry delay when all concurrency slots are taken.
+SLOT_RETRY_SECONDS = 1.0
+
+
+@dataclass(frozen=True, slots=True)
+class RateLimitDecision:
+    allowed: bool
+    remaining: int
+    retry_after: float  # seconds until a slot frees up; 0 when allowed
+
+
+class RateLimiter(Protocol):
+    async def acquire(self, key: str, limit: int) -> RateLimitDecision: ...
+
+    async def acquire_tokens(self, key: str, tokens: int, limit: int) -> RateLimitDecision: ...
+
+    async def adjust_tokens(self, key: str, delta: int) -> None: ...
+
+    async def acquire_slot(self, key: str, limit: int, lease_id: str) -> RateLimitDecision: ...
+
+    async def release_slot(self, key: str, lease_id: str) -> None: ...
+
+    async def close(self) -> None: ...
+
+
+class InMemoryRateLimiter:
+    """Per-process equivalent of the Redis scripts, on the same algorithms."""
+
+    # Drop idle keys every this many acquisitions so the dicts stay bounded.
+    SWEEP_EVERY = 1024
+
+    def __init__(
+        self,
+        window_seconds: float = 60.0,
+        lease_seconds: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.lease_seconds = (
+            settings.rate_limit_lease_seconds if lease_seconds is None else lease_seconds
+        )
+        self._clock = clock
+        self._windows: dict[str, deque[float]] = {}
+        # key -> [bucket_start, tokens in bucket, tokens in previous bucket]
+        self._token_windows: dict[str, list[float]] = {}
+        # key -> {lease_id: expires_at}
+        self._slots: dict[str, dict[str, float]] = {}
+        self._calls = 0
+
+    # No awaits in any method below: each check-and-update is atomic on the
+    # event loop.
+
+    def _tick(self) -> float:
+        now = self._clock()
+        self._calls += 1
+        if self._calls % self.SWEEP_EVERY == 0:
+            self._sweep(now)
+        return now
+
+    async def acquire(self, key: str, limit: int) -> RateLimitDecision:
+        now = self._tick()
+        window = self._windows.setdefault(key, deque())
+        cutoff = now - self.window_seconds
+        while window and window[0] <= cutoff:
+            window.popleft()
+
+        if len(window) < limit:
+            window.append(now)
+            return RateLimitDecision(True, limit - len(window), 0.0)
+        retry_after = window[0] + self.window_seconds - now if window else self.window_seconds
+        return RateLimitDecision(False, 0, retry_after)
+
+    def _token_state(self, key: str, now: float) -> tuple[list[float], float, float]:
+        """Roll the key's buckets forward; return (state, bucket_start, weighted_prev)."""
+        bucket = now - (now % self.window_seconds)
+        state = self._token_windows.setdefault(key, [bucket, 0.0, 0.0])
+        if state[0] != bucket:
+            state[2] = state[1] if bucket - state[0] == self.window_seconds else 0.0
+            state[1] = 0.0
+            state[0] = bucket
+        weighted_prev = state[2] * (1 - (now - bucket) / self.window_seconds)
+        return state, bucket, weighted_prev
+
+    async def acquire_tokens(self, key: str, tokens: int, limit: int) -> RateLimitDecision:
+        now = self._tick()
+        state, bucket, weighted_prev = self._token_state(key, now)
+        used = weighted_prev + state[1]
+        if used + tokens > limit:
+            need = used + tokens - limit
+            retry_after = bucket + self.window_seconds - now
+            if state[2] > 0 and need <= weighted_prev:
+                retry_after = need / state[2] * self.window_seconds
+            return RateLimitDecision(False, 0, retry_after)
+        state[1] += tokens
+        return RateLimitDecision(True, max(0, int(limit - used - tokens)), 0.0)
+
+    async def adjust_tokens(self, key: str, delta: int) -> None:
+        state, _, _ = self._token_state(key, self._tick())
+        state[1] = max(0.0, state[1] + delta)
+
+    async def acquire_slot(self, key: str, limit: int, lease_id: str) -> RateLimitDecision:
+        now = self._tick()
+        leases = self._slots.setdefault(key, {})
+        for expired in [lid for lid, expires_at in leases.items() if expires_at <= now]:
+            del leases[expired]
+        if len(leases) >= limit:
+            return RateLimitDecision(False, 0, SLOT_RETRY_SECONDS)
+        leases[lease_id] = now + self.lease_seconds
+        return RateLimitDecision(True, limit - len(leases), 0.0)
+
+    async def release_slot(self, key: str, lease_id: str) -> None:
+        leases = self._slots.get(key)
+        if leases is not None:
+            leases.pop(lease_id, None)
+
+    def _sweep(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        for key in [k for k, w in self._windows.items() if not w or w[-1] <= cutoff]:
+            del self._windows[key]
+        stale_bucket = now - (now % self.window_seconds) - self.window_seconds
+        for key in [k for k, st in self._token_windows.items() if st[0] < stale_bucket]:
+            del self._token_windows[key]
+        for key in [
+            k for k, leases in self._slots.items()
+            if all(expires_at <= now for expires_at in leases.values())
+        ]:
+            del self._slots[key]
+
+    def clear(self) -> None:
+        self._windows.clear()
+        self._token_windows.clear()
+        self._slots.clear()
+
+    async def close(self) -> None:
+        self.clear()
+
+
+class RedisRateLimiter:
+    """The same limits shared by all processes through Redis."""
+
+    def __init__(
+        self,
+        client: Redis,
+        window_seconds: float = 60.0,
+        lease_seconds: float | None = None,
+        key_prefix: str = "ratelimit:",
+        fallback: InMemoryRateLimiter | None = None,
+    ) -> None:
+        self.client = client
+        self.window_seconds = window_seconds
+        self.lease_seconds = (
+            settings.rate_limit_lease_seconds if lease_seconds is None else lease_seconds
+        )
+        self.key_prefix = key_prefix
+        self.fallback = fallback or InMemoryRateLimiter(window_seconds, self.lease_seconds)
+        self._requests = client.register_script(_SLIDING_WINDOW_LUA)
+        self._tokens = client.register_script(_TOKEN_WINDOW_LUA)
+        self._slots = client.register_script(_SLOTS_LUA)
+        self._skip_redis_until = 0.0
+
+    async def _run(
+        self,
+        script: Callable[..., Awaitable[Any]],
+        key: str,
+        args: list[Any],
+    ) -> RateLimitDecision | None:
+        """Run one script; None means Redis is unavailable and the caller falls back."""
+        if time.monotonic() < self._skip_redis_until:
+            return None
+        try:
+            allowed, remaining, retry_ms = await script(
+                keys=[self.key_prefix + key], args=args
+            )
+        except (RedisError, OSError):
+            logger.warning(
+                "Redis rate limiter unavailable; using in-process limits for %.0fs",
+                REDIS_RETRY_SECONDS,
+                exc_info=True,
+            )
+            self._skip_redis_until = time.monotonic() + REDIS_RETRY_SECONDS
+            return None
+        return RateLimitDecision(bool(allowed), int(remaining), int(retry_ms) / 1000)
+
+    @property
+    def _window_ms(self) -> int:
+        return int(self.window_seconds * 1000)
+
+    async def acquire(self, key: str, limit: int) -> RateLimitDecision:
+        decision = await self._run(
+            self._requests, key, [limit, self._window_ms, uuid.uuid4().hex]
+        )
+        return decision or await self.fallback.acquire(key, limit)
+
+    async def acquire_tokens(self, key: str, tokens: int, limit: int) -> RateLimitDecision:
+        decision = await self._run(self._tokens, key, [tokens, limit, self._window_ms])
+        return decision or await self.fallback.acquire_tokens(key, tokens, limit)
+
+    async def adjust_tokens(self, key: str, delta: int) -> None:
+        if await self._run(self._tokens, key, [delta, -1, self._window_ms]) is None:
+            await self.fallback.adjust_tokens(key, delta)
+
+    async def acquire_slot(self, key: str, limit: int, lease_id: str) -> RateLimitDecision:
+        decision = await self._run(
+            self._slots, key, [limit, int(self.lease_seconds * 1000), lease_id]
+        )
+        if decision is None:
+            return await self.fallback.acquire_slot(key, limit, lease_id)
+        if not decision.allowed:
+            return RateLimitDecision(False, 0, SLOT_RETRY_SECONDS)
+        return decision
+
+    async def release_slot(self, key: str, lease_id: str) -> None:
+        # Dropping from both is harmless and covers a lease taken during an outage.
+        await self.fallback.release_slot(key, lease_id)
+        if time.monotonic() < self._skip_redis_until:
+            return
+        try:
+            await self.client.zrem(self.key_prefix + key, lease_id)
+        except (RedisError, OSError):
+            # The lease expires on its own after lease_seconds.
+            logger.warning("Could not release rate limit slot %s", key, exc_info=True)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+_limiter: RateLimiter | None = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Process-wide limiter: Redis when configured, else in-process."""
+    global _limiter
+    if _limiter is None:
+        if settings.redis_url:
+            client = Redis.from_url(
+                settings.redis_url,
+                socket_connect_timeout=settings.rate_limit_redis_timeout_seconds,
+                socket_timeout=settings.rate_limit_redis_timeout_seconds,
+            )
+            _limiter = RedisRateLimiter(client)
+        else:
+            _limiter = InMemoryRateLimiter()
+    return _limiter
+
+
+async def close_rate_limiter() -> None:
+    global _limiter
+    if _limiter is not None:
+        await _limiter.close()
+        _limiter = None
+
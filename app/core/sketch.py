@@ -0,0 +1,114 @@
+"""Space-Saving summary: approximate heavy hitters in bounded memory.
+
+Tracks weighted counts of at most `capacity` items (Metwally et al., with
+weights). When a new item arrives and the summary is full, it takes over the
+counter of the current minimum item, inheriting that count as its error.
+For every kept item:
+
+    true weight <= count <= true weight + error,   error <= total / capacity
+
+and any item not kept has a true weight of at most min_count(). Summaries
+are mergeable (Agarwal et al.), so per-process or per-hour summaries can be
+combined with the same bounds relative to the combined total.
+"""
+import heapq
+from dataclasses import dataclass
+from typing import Any
+
+
+@dataclass(frozen=True)
+class HeavyHitter:
+    key: str
+    count: int  # overestimate of the true weight
+    error: int  # count - error is a lower bound
+
+
+class SpaceSaving:
+    def __init__(self, capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        self._counters: dict[str, list[int]] = {}  # key -> [count, error]
+        # Lazy min-heap of (count, key); entries whose count is stale are skipped
+        self._heap: list[tuple[int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def _push(self, key: str) -> None:
+        heapq.heappush(self._heap, (self._counters[key][0], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, k) for k, (count, _) in self._counters.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> tuple[str, int]:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            counter = self._counters.get(key)
+            if counter is not None and counter[0] == count:
+                del self._counters[key]
+                return key, count
+
+    def add(self, key: str, weight: int = 1) -> None:
+        if weight <= 0:
+            return
+        self.total += weight
+        counter = self._counters.get(key)
+        if counter is not None:
+            counter[0] += weight
+        elif len(self._counters) < self.capacity:
+            self._counters[key] = [weight, 0]
+        else:
+            _, floor = self._pop_min()
+            self._counters[key] = [floor + weight, floor]
+        self._push(key)
+
+    def min_count(self) -> int:
+        """Upper bound on the weight of any item not in the summary."""
+        if len(self._counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self._counters.values())
+
+    def top(self, n: int | None = None) -> list[HeavyHitter]:
+        ranked = sorted(self._counters.items(), key=lambda item: (-item[1][0], item[0]))
+        return [HeavyHitter(key, count, error) for key, (count, error) in ranked[:n]]
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """A new summary of both streams, with the larger of the two capacities."""
+        merged = SpaceSaving(max(self.capacity, other.capacity))
+        merged.total = self.total + other.total
+        floors = (self.min_count(), other.min_count())
+        combined: dict[str, list[int]] = {}
+        for summary in (self, other):
+            for key, (count, error) in summary._counters.items():
+                counter = combined.setdefault(key, [0, 0])
+                counter[0] += count
+                counter[1] += error
+        for key, counter in combined.items():
+            # An item missing from one side may have weighed up to its floor there
+            for summary, floor in ((self, floors[0]), (other, floors[1])):
+                if key not in summary._counters:
+                    counter[0] += floor
+                    counter[1] += floor
+        kept = sorted(combined.items(), key=lambda item: (-item[1][0], item[0]))
+        merged._counters = dict(kept[: merged.capacity])
+        merged._heap = [(count, key) for key, (count, _) in merged._counters.items()]
+        heapq.heapify(merged._heap)
+        return merged
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "total": self.total,
+            "items": [[key, count, error] for key, (count, error) in self._counters.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "SpaceSaving":
+        summary = cls(data["capacity"])
+        summary.total = data["total"]
+        summary._counters = {key: [count, error] for key, count, error in data["items"]}
+        summary._heap = [(count, key) for key, (count, _) in summary._counters.items()]
+        heapq.heapify(summary._heap)
+        return summary
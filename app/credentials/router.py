@@ -13,15 +13,17 @@ router = APIRouter(prefix="/orgs/{org_id}/credentials", tags=["credentials"])
 @router.post("", response_model=CredentialResponse, status_code=201)
 async def add_credential(org_id: uuid.UUID, body: CredentialCreate, user: CurrentUser, db: DbSession):
     await require_owned_org(db, org_id=org_id, user_id=user.id)
-    async with db.begin():
-        cred = await cred_service.add_credential(
-            db,
-            org_id=org_id,
-            provider=body.provider,
-            plaintext_api_key=body.api_key,
-            label=body.label,
-            mode=body.mode,
-        )
+    cred = await cred_service.add_credential(
+        db,
+        org_id=org_id,
+        provider=body.provider,
+        plaintext_api_key=body.api_key,
+        label=body.label,
+        mode=body.mode,
+    )
+    await db.commit()
+    # Committed — drop the cached key (or cached "none") so the gateway sees it.
+    cred_service.invalidate_credential(org_id, cred.provider)
     return cred
 
 
@@ -29,3 +31,16 @@ async def add_credential(org_id: uuid.UUID, body: CredentialCreate, user: Curren
 async def list_credentials(org_id: uuid.UUID, user: CurrentUser, db: DbSession):
     await require_owned_org(db, org_id=org_id, user_id=user.id)
     return await cred_service.list_credentials(db, org_id=org_id)
+
+
+@router.delete("/{credential_id}", status_code=204)
+async def deactivate_credential(
+    org_id: uuid.UUID, credential_id: uuid.UUID, user: CurrentUser, db: DbSession
+):
+    await require_owned_org(db, org_id=org_id, user_id=user.id)
+    cred = await cred_service.deactivate_credential(
+        db, org_id=org_id, credential_id=credential_id
+    )
+    await db.commit()
+    # Committed — drop the cached key so the gateway stops using it now.
+    cred_service.invalidate_credential(org_id, cred.provider)
@@ -1,4 +1,13 @@
-"""Provider credential management — Fernet-encrypted BYOK keys."""
+"""Provider credential management — Fernet-encrypted BYOK keys.
+
+Decrypted keys are cached per (org, provider) for a short TTL, including
+"no credential" results, so the gateway skips the session checkout, query
+and decrypt on most requests. Callers that add or deactivate a credential
+drop the entry (invalidate_credential) once their transaction has
+committed; dropping it earlier lets a concurrent lookup re-cache the old
+key for the whole TTL.
+"""
+import functools
 import uuid
 
 from cryptography.fernet import Fernet
@@ -6,9 +15,18 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
+from app.core.cache import MISSING, TTLCache
+from app.core.exceptions import NotFoundError
 from app.credentials.models import CredentialMode, ProviderCredential
+from app.db.session import async_session_factory
+
+_credential_cache: TTLCache[tuple[uuid.UUID, str], str | None] = TTLCache(
+    maxsize=settings.credential_cache_size,
+    ttl_seconds=settings.credential_cache_ttl_seconds,
+)
 
 
+@functools.cache
 def _fernet() -> Fernet:
     return Fernet(settings.get_fernet_key())
 
@@ -29,6 +47,7 @@ async def add_credential(
     label: str | None = None,
     mode: CredentialMode = CredentialMode.BYOK,
 ) -> ProviderCredential:
+    """Store an encrypted key. Call invalidate_credential after committing."""
     encrypted = encrypt_key(plaintext_api_key)
     cred = ProviderCredential(
         org_id=org_id,
@@ -43,10 +62,32 @@ async def add_credential(
     return cred
 
 
+async def deactivate_credential(
+    db: AsyncSession, org_id: uuid.UUID, credential_id: uuid.UUID
+) -> ProviderCredential:
+    """Deactivate a credential. Call invalidate_credential after committing."""
+    result = await db.execute(
+        select(ProviderCredential).where(
+            ProviderCredential.id == credential_id,
+            ProviderCredential.org_id == org_id,
+        )
+    )
+    cred = result.scalar_one_or_none()
+    if cred is None:
+        raise NotFoundError("ProviderCredential", str(credential_id))
+    cred.is_active = False
+    await db.flush()
+    return cred
+
+
 async def get_active_credential(
     db: AsyncSession, org_id: uuid.UUID, provider: str
 ) -> str | None:
     """Return decrypted API key for the org+provider, or None if not configured."""
+    cached = _credential_cache.get((org_id, provider))
+    if cached is not MISSING:
+        return cached
+
     result = await db.execute(
         select(ProviderCredential).where(
             ProviderCredential.org_id == org_id,
@@ -55,9 +96,26 @@ async def get_active_credential(
         )
     )
     cred = result.scalar_one_or_none()
-    if cred is None:
-        return None
-    return decrypt_key(cred.encrypted_api_key)
+    plaintext = None if cred is None else decrypt_key(cred.encrypted_api_key)
+    _credential_cache.set((org_id, provider), plaintext)
+    return plaintext
+
+
+async def resolve_credential(org_id: uuid.UUID, provider: str) -> str | None:
+    """Cached lookup that only checks out a session on a cache miss."""
+    cached = _credential_cache.get((org_id, provider))
+    if cached is not MISSING:
+        return cached
+    async with async_session_factory() as db:
+        return await get_active_credential(db, org_id, provider)
+
+
+def invalidate_credential(org_id: uuid.UUID, provider: str) -> None:
+    _credential_cache.pop((org_id, provider))
+
+
+def clear_credential_cache() -> None:
+    _credential_cache.clear()
 
 
 async def list_credentials(
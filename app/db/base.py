@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime, timezone
 
 from sqlalchemy import DateTime, Uuid, func
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.orm import DeclarativeBase, Mapped, declared_attr, mapped_column
 
 
 class Base(DeclarativeBase):
@@ -21,3 +21,23 @@ class TimestampMixin:
         server_default=func.now(),
         default=lambda: datetime.now(timezone.utc),
     )
+
+
+class PartitionedTimestampMixin:
+    """
+    For append-only tables range-partitioned by month on created_at
+    (see app.db.partitions). PostgreSQL requires the partition key in the
+    primary key, so the table key is (id, created_at); the ORM still
+    identifies rows by id alone. Combine with UUIDMixin and add
+    {"postgresql_partition_by": "RANGE (created_at)"} to __table_args__.
+    """
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        primary_key=True,
+        server_default=func.now(),
+        default=lambda: datetime.now(timezone.utc),
+    )
+
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict:
+        return {"primary_key": [cls.__table__.c.id]}
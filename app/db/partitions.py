@@ -0,0 +1,152 @@
+"""Monthly range partitions of the append-only tables (PostgreSQL only).
+
+ledger, usage_events and audit_logs are partitioned by created_at with one
+partition per calendar month (UTC), named <table>_yYYYYmMM, plus a
+<table>_default partition for rows outside every range. Migration 010 sets
+this up; `python -m scripts.maintenance partitions` keeps future months
+created and detaches expired ones.
+
+Rows in a default partition mean the maintenance job fell behind:
+PostgreSQL refuses to create a partition whose range overlaps rows already
+in the default one, so those rows must be moved out by hand first.
+"""
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+
+PARTITIONED_TABLES = ("ledger", "usage_events", "audit_logs")
+# Balances are SUMs over the whole ledger, so its partitions never expire.
+RETENTION_TABLES = ("usage_events", "audit_logs")
+
+_PARTITION_NAME = re.compile(r"^(?P<table>\w+)_y(?P<year>\d{4})m(?P<month>\d{2})$")
+
+
+@dataclass(frozen=True)
+class Partition:
+    table: str
+    name: str
+    start: datetime  # inclusive
+    end: datetime  # exclusive
+
+
+def month_start(at: datetime) -> datetime:
+    at = at.astimezone(timezone.utc) if at.tzinfo else at.replace(tzinfo=timezone.utc)
+    return datetime(at.year, at.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_for(table: str, at: datetime) -> Partition:
+    start = month_start(at)
+    return Partition(
+        table=table,
+        name=f"{table}_y{start.year:04d}m{start.month:02d}",
+        start=start,
+        end=add_months(start, 1),
+    )
+
+
+def _require_postgres(db: AsyncSession) -> None:
+    if db.bind.dialect.name != "postgresql":
+        raise RuntimeError("Table partitioning requires PostgreSQL")
+
+
+async def list_partitions(db: AsyncSession, table: str) -> list[Partition]:
+    """Attached monthly partitions of `table`, oldest first (default excluded)."""
+    _require_postgres(db)
+    result = await db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass)"
+        ),
+        {"table": table},
+    )
+    partitions = []
+    for name in result.scalars():
+        match = _PARTITION_NAME.match(name)
+        if match is None or match["table"] != table:
+            continue
+        at = datetime(int(match["year"]), int(match["month"]), 1, tzinfo=timezone.utc)
+        partitions.append(partition_for(table, at))
+    return sorted(partitions, key=lambda p: p.start)
+
+
+async def create_partitions(
+    db: AsyncSession, months_ahead: int | None = None, now: datetime | None = None
+) -> list[Partition]:
+    """
+    Make sure every partitioned table has partitions for the current month
+    and the next `months_ahead` months. Returns the partitions created.
+    """
+    if months_ahead is None:
+        months_ahead = settings.partition_months_ahead
+    current = month_start(now or datetime.now(timezone.utc))
+    created = []
+    for table in PARTITIONED_TABLES:
+        existing = {p.start for p in await list_partitions(db, table)}
+        for offset in range(months_ahead + 1):
+            partition = partition_for(table, add_months(current, offset))
+            if partition.start in existing:
+                continue
+            await db.execute(
+                text(
+                    f'CREATE TABLE "{partition.name}" PARTITION OF "{table}" '
+                    f"FOR VALUES FROM ('{partition.start.isoformat()}') "
+                    f"TO ('{partition.end.isoformat()}')"
+                )
+            )
+            created.append(partition)
+    return created
+
+
+async def detach_expired_partitions(
+    db: AsyncSession,
+    retention_months: int,
+    archive_schema: str | None = None,
+    now: datetime | None = None,
+) -> list[Partition]:
+    """
+    Detach usage_events and audit_logs partitions whose whole month is more
+    than `retention_months` before the current one. Detached partitions stay
+    as plain tables (moved to `archive_schema` if given) so they can be
+    dumped and dropped at leisure. Returns the partitions detached.
+    """
+    if retention_months < 1:
+        raise ValueError("retention_months must be at least 1")
+    _require_postgres(db)
+    cutoff = add_months(month_start(now or datetime.now(timezone.utc)), -retention_months)
+    if archive_schema is not None:
+        await db.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{archive_schema}"'))
+    detached = []
+    for table in RETENTION_TABLES:
+        for partition in await list_partitions(db, table):
+            if partition.end > cutoff:
+                break
+            await db.execute(
+                text(f'ALTER TABLE "{table}" DETACH PARTITION "{partition.name}"')
+            )
+            if archive_schema is not None:
+                await db.execute(
+                    text(f'ALTER TABLE "{partition.name}" SET SCHEMA "{archive_schema}"')
+                )
+            detached.append(partition)
+    return detached
+
+
+async def default_partition_rows(db: AsyncSession) -> dict[str, int]:
+    """Rows sitting in each table's default partition (should all be 0)."""
+    _require_postgres(db)
+    counts = {}
+    for table in PARTITIONED_TABLES:
+        result = await db.execute(text(f'SELECT count(*) FROM "{table}_default"'))
+        counts[table] = int(result.scalar_one())
+    return counts
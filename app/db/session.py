@@ -1,4 +1,9 @@
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from app.config import settings
 
@@ -12,3 +17,28 @@ engine = create_async_engine(
 async_session_factory = async_sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
+
+
+@dataclass
+class StatementCount:
+    statements: int = 0
+
+
+@contextmanager
+def count_statements(bind: AsyncEngine | None = None) -> Iterator[StatementCount]:
+    """Count SQL statements sent to the database while the block runs.
+
+    Counts are engine-wide, so use this in tests or benchmarks rather than
+    under concurrent production load.
+    """
+    sync_engine = (bind or engine).sync_engine
+    counter = StatementCount()
+
+    def _on_execute(*_args: object) -> None:
+        counter.statements += 1
+
+    event.listen(sync_engine, "before_cursor_execute", _on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", _on_execute)
@@ -0,0 +1,155 @@
+"""Write-behind buffer for append-only rows (usage events, audit logs).
+
+With WRITE_BEHIND_ENABLED the gateway hands these rows to the buffer after
+its settlement transaction commits, instead of inserting them inside it. A
+background task writes them every WRITE_BEHIND_FLUSH_MS (or as soon as
+WRITE_BEHIND_MAX_BATCH rows are waiting) in one transaction, where rows of
+one class go out as a single multi-row INSERT.
+
+Memory is bounded: once WRITE_BEHIND_MAX_PENDING rows are waiting, put()
+blocks until the writer catches up, which pushes back on request handling
+instead of growing the queue. Rows still buffered when the process dies are
+lost, so only rows that are not part of the financial record belong here;
+ledger entries are always written synchronously.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import settings
+from app.db import session as db_session
+from app.db.base import Base
+
+logger = logging.getLogger(__name__)
+
+WRITE_ATTEMPTS = 3
+RETRY_BACKOFF_SECONDS = 0.5
+
+
+class WriteBehindBuffer:
+    """Bounded queue of rows written in batches by one background task."""
+
+    def __init__(
+        self,
+        enabled: bool | None = None,
+        flush_interval_seconds: float | None = None,
+        max_batch: int | None = None,
+        max_pending: int | None = None,
+        session_factory: async_sessionmaker[AsyncSession] | None = None,
+    ) -> None:
+        self.enabled = settings.write_behind_enabled if enabled is None else enabled
+        self.flush_interval_seconds = (
+            settings.write_behind_flush_ms / 1000
+            if flush_interval_seconds is None
+            else flush_interval_seconds
+        )
+        self.max_batch = settings.write_behind_max_batch if max_batch is None else max_batch
+        self.max_pending = (
+            settings.write_behind_max_pending if max_pending is None else max_pending
+        )
+        # None = app.db.session.async_session_factory, resolved per batch
+        self.session_factory = session_factory
+        # Created on first use, inside the running event loop
+        self._queue: asyncio.Queue[Base] | None = None
+        self._wake: asyncio.Event | None = None
+        self._writer: asyncio.Task | None = None
+        self._urgent = 0  # flush() calls in progress: skip the batching delay
+
+    async def put(self, *rows: Base) -> None:
+        """Queue rows for insertion; waits while the buffer is full."""
+        queue = self._start()
+        for row in rows:
+            if getattr(row, "created_at", None) is None:
+                row.created_at = datetime.now(timezone.utc)  # when it happened, not when written
+            await queue.put(row)
+            if self._batch_ready(queue):
+                self._wake.set()
+
+    def _batch_ready(self, queue: asyncio.Queue[Base]) -> bool:
+        # +1: the row the writer already took. A full queue counts as ready
+        # so blocked put() calls are not left waiting out the interval.
+        return queue.qsize() + 1 >= min(self.max_batch, self.max_pending)
+
+    def _start(self) -> asyncio.Queue[Base]:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._wake = asyncio.Event()
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._run())
+        return self._queue
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            if not self._urgent and not self._batch_ready(queue):
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.flush_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._write(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    def _sessions(self) -> async_sessionmaker[AsyncSession]:
+        return self.session_factory or db_session.async_session_factory
+
+    async def _insert(self, rows: list[Base]) -> None:
+        async with self._sessions()() as db:
+            async with db.begin():
+                db.add_all(rows)
+
+    async def _write(self, batch: list[Base]) -> None:
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                await self._insert(batch)
+                return
+            except IntegrityError:
+                break  # a bad row: isolate it below
+            except Exception:
+                logger.warning(
+                    "Write-behind insert of %d rows failed (attempt %d/%d)",
+                    len(batch), attempt, WRITE_ATTEMPTS, exc_info=True,
+                )
+                if attempt < WRITE_ATTEMPTS:
+                    await asyncio.sleep(RETRY_BACKOFF_SECONDS * attempt)
+        for row in batch:
+            try:
+                await self._insert([row])
+            except Exception:
+                logger.error("Dropping write-behind row %r", row, exc_info=True)
+
+    async def flush(self) -> None:
+        """Wait until every row queued so far has been written."""
+        if self._queue is None:
+            return
+        self._start()
+        self._urgent += 1
+        self._wake.set()
+        try:
+            await self._queue.join()
+        finally:
+            self._urgent -= 1
+
+    async def close(self) -> None:
+        """Flush and stop the writer (application shutdown)."""
+        await self.flush()
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+        self._queue = self._wake = None
+
+
+write_behind = WriteBehindBuffer()
@@ -0,0 +1,44 @@
+import uuid
+from datetime import datetime
+from typing import Literal
+
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+
+from app.core.dependencies import CurrentUser, DbSession
+from app.core.tenancy import require_owned_org
+from app.exports import service as export_service
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+
+@router.get("/{kind}")
+async def export_rows(
+    kind: Literal["usage", "ledger"],
+    org_id: uuid.UUID,
+    user: CurrentUser,
+    db: DbSession,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    format: Literal["parquet", "arrow"] = "parquet",
+) -> StreamingResponse:
+    """
+    Stream an org's usage events (or its billing group's ledger entries) in
+    [start, end) as Parquet or an Arrow IPC stream.
+    """
+    org = await require_owned_org(db, org_id=org_id, user_id=user.id)
+    # Fail before the response starts; once streaming, errors can't change the status
+    export_service.require_pyarrow()
+    media_type, extension = export_service.FORMATS[format]
+    return StreamingResponse(
+        export_service.stream_export(
+            kind,
+            format,
+            group_id=org.billing_group_id,
+            org_id=org.id,
+            start=start,
+            end=end,
+        ),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{kind}-{org.slug}.{extension}"'},
+    )
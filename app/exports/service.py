@@ -0,0 +1,188 @@
+"""Columnar export of usage_events and ledger rows as Arrow IPC or Parquet.
+
+Rows are read with a server-side cursor (SQLAlchemy yield_per over asyncpg)
+EXPORT_CHUNK_ROWS at a time as plain column tuples: no ORM objects, no
+Pydantic models. Each chunk becomes one Arrow record batch (one Parquet row
+group), encoded off the event loop, and its bytes are handed to the caller
+before the next chunk is fetched. Memory stays bounded by the chunk size,
+however many rows match.
+
+Requires the optional pyarrow package: pip install '.[export]'.
+"""
+import asyncio
+import importlib
+import importlib.util
+import json
+import uuid
+from collections.abc import AsyncIterator, Callable, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any
+
+from sqlalchemy import Column, Row, Select, Table, select
+from sqlalchemy import types as sa_types
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import settings
+from app.core.exceptions import AppError
+from app.db import session as db_session
+from app.ledger.models import LedgerEntry
+from app.usage.models import UsageEvent
+
+FORMATS = {
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    table: Table
+    # Column holding the billing group, for org-scoped exports
+    group_column: str
+    org_column: str | None
+
+
+EXPORTS = {
+    "usage": ExportSpec(UsageEvent.__table__, "group_id", "org_id"),
+    "ledger": ExportSpec(LedgerEntry.__table__, "group_id", None),
+}
+
+
+def pyarrow_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def require_pyarrow() -> Any:
+    if not pyarrow_available():
+        raise AppError(
+            "Columnar export requires the optional pyarrow package (pip install '.[export]')",
+            status_code=501,
+        )
+    return importlib.import_module("pyarrow")
+
+
+def _arrow_field(pa: Any, column: Column) -> tuple[Any, Callable[[Any], Any] | None]:
+    """Arrow field for a column, plus a per-value conversion if one is needed."""
+    type_ = column.type
+    if isinstance(type_, sa_types.Uuid):
+        return pa.field(column.name, pa.string()), str
+    if isinstance(type_, sa_types.DateTime):
+        return pa.field(column.name, pa.timestamp("us", tz="UTC")), None
+    if isinstance(type_, sa_types.Enum):
+        return pa.field(column.name, pa.string()), lambda v: v.value
+    if isinstance(type_, sa_types.JSON):
+        return pa.field(column.name, pa.string()), json.dumps
+    if isinstance(type_, sa_types.Numeric):
+        return pa.field(column.name, pa.decimal128(type_.precision, type_.scale)), None
+    if isinstance(type_, sa_types.SmallInteger):
+        return pa.field(column.name, pa.int16()), None
+    if isinstance(type_, sa_types.BigInteger):
+        return pa.field(column.name, pa.int64()), None
+    if isinstance(type_, sa_types.Integer):
+        return pa.field(column.name, pa.int32()), None
+    return pa.field(column.name, pa.string()), None
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back in chunks."""
+
+    def __init__(self) -> None:
+        self._parts: list[bytes] = []
+        self.closed = False
+
+    def write(self, data: Any) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def build_query(
+    kind: str,
+    *,
+    group_id: uuid.UUID | None = None,
+    org_id: uuid.UUID | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> Select:
+    """Every column of the table, filtered by billing group/org and [start, end)."""
+    spec = EXPORTS[kind]
+    table = spec.table
+    stmt = select(*table.columns)
+    if org_id is not None and spec.org_column is not None:
+        stmt = stmt.where(table.c[spec.org_column] == org_id)
+    elif group_id is not None:
+        stmt = stmt.where(table.c[spec.group_column] == group_id)
+    # created_at bounds prune the monthly partitions
+    if start is not None:
+        stmt = stmt.where(table.c.created_at >= start)
+    if end is not None:
+        stmt = stmt.where(table.c.created_at < end)
+    return stmt
+
+
+async def stream_export(
+    kind: str,
+    fmt: str,
+    *,
+    group_id: uuid.UUID | None = None,
+    org_id: uuid.UUID | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    chunk_rows: int | None = None,
+    session_factory: async_sessionmaker[AsyncSession] | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Yield the encoded export of `kind` ("usage" or "ledger") in `fmt`
+    ("parquet" or "arrow"). Opens its own session (default:
+    app.db.session.async_session_factory) so it can outlive the request
+    handler that starts it.
+    """
+    pa = require_pyarrow()
+    chunk_rows = chunk_rows or settings.export_chunk_rows
+    table = EXPORTS[kind].table
+    fields, converters = zip(*(_arrow_field(pa, column) for column in table.columns))
+    schema = pa.schema(fields)
+
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        parquet = importlib.import_module("pyarrow.parquet")
+        writer = parquet.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+
+    def encode(rows: Sequence[Row]) -> None:
+        arrays = []
+        for values, field, convert in zip(zip(*rows), schema, converters):
+            if convert is not None:
+                values = [None if v is None else convert(v) for v in values]
+            elif pa.types.is_timestamp(field.type):
+                # SQLite hands back naive UTC
+                values = [
+                    v.replace(tzinfo=timezone.utc) if v is not None and v.tzinfo is None else v
+                    for v in values
+                ]
+            arrays.append(pa.array(values, type=field.type))
+        writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+    stmt = build_query(kind, group_id=group_id, org_id=org_id, start=start, end=end)
+    try:
+        async with (session_factory or db_session.async_session_factory)() as db:
+            result = await db.stream(stmt.execution_options(yield_per=chunk_rows))
+            async for rows in result.partitions():
+                await asyncio.to_thread(encode, rows)
+                yield sink.drain()
+    finally:
+        # Also when the client goes away or the query fails, so the writer's
+        # native buffers are released
+        writer.close()
+    yield sink.drain()
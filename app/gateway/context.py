@@ -0,0 +1,134 @@
+"""Cached API key → Agent → AgentGroup → Workspace → Org resolution.
+
+The gateway resolves the full hierarchy for every request. The result is a
+small immutable snapshot, cached by key hash so the hot path skips the
+database entirely on a hit.
+
+Invalidation: whoever revokes a key or changes the status of any level
+calls invalidate_agent_contexts() once that change is committed, so the local
+process sees it immediately; other processes pick it up when the entry's TTL
+expires. Invalidating before the commit is not enough: a concurrent request
+can reload the old row and cache it again.
+"""
+import uuid
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.agent_groups.models import AgentGroup
+from app.agents.models import Agent, AgentStatus, ApiKey
+from app.agents.service import _hash_key
+from app.config import settings
+from app.core.cache import MISSING, TTLCache
+from app.orgs.models import Organization
+from app.workspaces.models import Workspace
+
+
+@dataclass(frozen=True, slots=True)
+class AgentContext:
+    """Everything the gateway needs to know about the calling agent."""
+    api_key_id: uuid.UUID
+    agent_id: uuid.UUID
+    agent_group_id: uuid.UUID
+    workspace_id: uuid.UUID
+    org_id: uuid.UUID
+    billing_group_id: uuid.UUID
+    owner_id: uuid.UUID
+    agent_status: AgentStatus
+    agent_group_active: bool
+    workspace_active: bool
+    org_active: bool
+    credits_per_usd: int
+
+
+_context_cache: TTLCache[str, AgentContext] = TTLCache(
+    maxsize=settings.gateway_context_cache_size,
+    ttl_seconds=settings.gateway_context_cache_ttl_seconds,
+)
+
+
+def agent_context_query(key_hash: str):
+    """Single joined SELECT for an active key and its full hierarchy."""
+    return (
+        select(
+            ApiKey.id,
+            Agent.id,
+            AgentGroup.id,
+            Workspace.id,
+            Organization.id,
+            Organization.billing_group_id,
+            Organization.owner_id,
+            Agent.status,
+            AgentGroup.is_active,
+            Workspace.is_active,
+            Organization.is_active,
+            Organization.credits_per_usd,
+        )
+        .join(Agent, Agent.id == ApiKey.agent_id)
+        .join(AgentGroup, AgentGroup.id == Agent.agent_group_id)
+        .join(Workspace, Workspace.id == AgentGroup.workspace_id)
+        .join(Organization, Organization.id == Workspace.org_id)
+        .where(ApiKey.key_hash == key_hash, ApiKey.is_active == True)  # noqa: E712
+    )
+
+
+async def load_agent_context(db: AsyncSession, key_hash: str) -> AgentContext | None:
+    """Fetch the snapshot from the database (one round trip), bypassing the cache."""
+    result = await db.execute(agent_context_query(key_hash))
+    row = result.one_or_none()
+    if row is None:
+        return None
+    return AgentContext(*row)
+
+
+def get_cached_agent_context(key_hash: str) -> AgentContext | None:
+    ctx = _context_cache.get(key_hash)
+    return None if ctx is MISSING else ctx
+
+
+def cache_agent_context(key_hash: str, ctx: AgentContext) -> None:
+    _context_cache.set(key_hash, ctx)
+
+
+async def resolve_agent_context(
+    db: AsyncSession, plaintext_key: str
+) -> AgentContext | None:
+    """Return the cached snapshot for a key, loading it on a miss.
+
+    Returns None for unknown or revoked keys (never cached).
+    """
+    key_hash = _hash_key(plaintext_key)
+    ctx = get_cached_agent_context(key_hash)
+    if ctx is not None:
+        return ctx
+
+    ctx = await load_agent_context(db, key_hash)
+    if ctx is not None:
+        cache_agent_context(key_hash, ctx)
+    return ctx
+
+
+def invalidate_agent_contexts(
+    *,
+    key_hash: str | None = None,
+    agent_id: uuid.UUID | None = None,
+    agent_group_id: uuid.UUID | None = None,
+    workspace_id: uuid.UUID | None = None,
+    org_id: uuid.UUID | None = None,
+) -> None:
+    """Drop cached snapshots matching a key or any hierarchy level."""
+    if key_hash is not None:
+        _context_cache.pop(key_hash)
+    if agent_id is not None:
+        _context_cache.invalidate_where(lambda _, c: c.agent_id == agent_id)
+    if agent_group_id is not None:
+        _context_cache.invalidate_where(lambda _, c: c.agent_group_id == agent_group_id)
+    if workspace_id is not None:
+        _context_cache.invalidate_where(lambda _, c: c.workspace_id == workspace_id)
+    if org_id is not None:
+        _context_cache.invalidate_where(lambda _, c: c.org_id == org_id)
+
+
+def clear_agent_contexts() -> None:
+    _context_cache.clear()
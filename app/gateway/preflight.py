@@ -0,0 +1,104 @@
+"""Consolidated gateway pre-flight reads.
+
+Before calling a provider the gateway needs the API key, the agent, the full
+hierarchy, the active policies and the pricing rule. Fetched one by one that
+is seven statements:
+
+    api key → agent → agent group → workspace → org → policies → pricing
+
+load_preflight() returns the key, hierarchy and policies from one joined
+SELECT (one row per active policy); pricing comes from the in-memory table
+(app/pricing/registry.py). When the hierarchy snapshot and the compiled
+policy are already cached (app/gateway/context.py, app/policies/service.py)
+the pre-flight issues no statements at all. tests/test_gateway.py pins the
+counts with count_statements().
+"""
+from dataclasses import dataclass
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.agent_groups.models import AgentGroup
+from app.agents.models import Agent
+from app.agents.service import _hash_key
+from app.gateway.context import (
+    AgentContext,
+    agent_context_query,
+    cache_agent_context,
+    get_cached_agent_context,
+)
+from app.orgs.models import Organization
+from app.policies.models import Policy
+from app.policies.service import (
+    EffectivePolicy,
+    _merge_policies,
+    cache_effective_policy,
+    get_effective_policy,
+    hierarchy_policy_filter,
+)
+from app.pricing import service as pricing_service
+from app.pricing.registry import PricingEntry
+from app.workspaces.models import Workspace
+
+_CONTEXT_COLUMNS = len(AgentContext.__dataclass_fields__)
+
+
+@dataclass(frozen=True, slots=True)
+class Preflight:
+    context: AgentContext
+    policy: EffectivePolicy
+    # None when no pricing rule exists; the caller decides when to fail.
+    pricing_rule: PricingEntry | None
+
+
+async def load_preflight(
+    db: AsyncSession, key_hash: str, provider: str, model: str
+) -> Preflight | None:
+    """Key, hierarchy and active policies in a single round trip."""
+    q = (
+        agent_context_query(key_hash)
+        .add_columns(Policy)
+        .outerjoin(
+            Policy,
+            hierarchy_policy_filter(
+                Organization.id, Workspace.id, AgentGroup.id, Agent.id
+            ),
+        )
+    )
+    rows = (await db.execute(q)).all()
+    if not rows:
+        return None
+
+    first = rows[0]
+    ctx = AgentContext(*first[:_CONTEXT_COLUMNS])
+    policy = _merge_policies([row[-1] for row in rows if row[-1] is not None])
+    cache_effective_policy(
+        (ctx.org_id, ctx.workspace_id, ctx.agent_group_id, ctx.agent_id), policy
+    )
+    return Preflight(
+        context=ctx,
+        policy=policy,
+        pricing_rule=await pricing_service.find_pricing_rule(db, provider, model),
+    )
+
+
+async def resolve_preflight(
+    db: AsyncSession, plaintext_key: str, provider: str, model: str
+) -> Preflight | None:
+    """Cache-aware pre-flight. Returns None for unknown or revoked keys."""
+    key_hash = _hash_key(plaintext_key)
+    ctx = get_cached_agent_context(key_hash)
+    if ctx is None:
+        preflight = await load_preflight(db, key_hash, provider, model)
+        if preflight is not None:
+            cache_agent_context(key_hash, preflight.context)
+        return preflight
+
+    policy = await get_effective_policy(
+        db,
+        org_id=ctx.org_id,
+        workspace_id=ctx.workspace_id,
+        agent_group_id=ctx.agent_group_id,
+        agent_id=ctx.agent_id,
+    )
+    pricing_rule = await pricing_service.find_pricing_rule(db, provider, model)
+    return Preflight(context=ctx, policy=policy, pricing_rule=pricing_rule)
@@ -8,39 +8,48 @@ Agent flow:
 Processing:
   1. Authenticate API key → resolve Agent
   2. Walk hierarchy: Agent → AgentGroup → Workspace → Org
-  3. Policy check: model allowed? token limits enforced?
+     (1-2 plus the policy and pricing reads are one consolidated pre-flight —
+      see app/gateway/preflight.py)
+  3. Policy check: model allowed? token limits enforced? under rpm_limit?
   4. Budget check: won't exceed caps at any level?
-  5. Ledger check: org has sufficient credits?
+  5. Ledger check: reserve the estimated credits as a hold, then admit the
+     estimated tokens / an in-flight slot under tpm_limit and max_concurrent_requests
   6. Call provider (BYOK cred or platform default)
-  7. Atomic deduction + usage recording
+  7. Settle the hold for the actual cost + usage recording (app/gateway/settlement.py)
   8. Return OpenAI-compatible response
+
+With "stream": true the provider's chunks are relayed as server-sent events
+and step 7 runs when the stream ends, however it ends (app/gateway/streaming.py).
 """
 import time
 import uuid
 from decimal import Decimal
 from typing import Any
 
+import anyio
 from fastapi import APIRouter, Header, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from sqlalchemy import select
 
-from app.agent_groups.models import AgentGroup
-from app.agents.models import Agent, AgentStatus
-from app.agents.service import resolve_api_key
-from app.audit.service import log_event
+from app.agents.models import AgentStatus
 from app.budgets.service import check_budgets
-from app.core.exceptions import AppError, InsufficientCreditsError
+from app.core.exceptions import AppError, NotFoundError
 from app.db.session import async_session_factory
+from app.gateway.preflight import resolve_preflight
+from app.gateway.settlement import (
+    Settlement,
+    record_provider_error,
+    release_unused_hold,
+    settle_usage,
+)
+from app.gateway.streaming import MeteredStream, MeteredStreamingResponse, StreamMeter
 from app.ledger import service as ledger_service
-from app.ledger.models import TransactionType
-from app.orgs.models import Organization
-from app.policies.service import enforce_policy, get_effective_policy
+from app.policies.service import admit_load, enforce_policy, enforce_rate_limit
 from app.pricing import service as pricing_service
-from app.providers.registry import get_provider, make_provider
-from app.credentials.service import get_active_credential
-from app.usage.models import UsageEvent, UsageStatus
-from app.workspaces.models import Workspace
+from app.providers.base import StreamChunk
+from app.providers.registry import ProviderLease, lease_provider
+from app.providers.tokens import estimate_prompt_tokens
+from app.credentials.service import resolve_credential
 
 router = APIRouter(prefix="/gateway/v1", tags=["gateway"])
 
@@ -58,34 +67,11 @@ class ChatCompletionRequest(BaseModel):
     stream: bool = False
 
 
-async def _resolve_hierarchy(
-    db: Any,
-    agent: Agent,
-) -> tuple[AgentGroup, Workspace, Organization]:
-    """Walk Agent → AgentGroup → Workspace → Org."""
-    group_result = await db.execute(
-        select(AgentGroup).where(AgentGroup.id == agent.agent_group_id)
-    )
-    agent_group: AgentGroup = group_result.scalar_one()
-
-    ws_result = await db.execute(
-        select(Workspace).where(Workspace.id == agent_group.workspace_id)
-    )
-    workspace: Workspace = ws_result.scalar_one()
-
-    org_result = await db.execute(
-        select(Organization).where(Organization.id == workspace.org_id)
-    )
-    org: Organization = org_result.scalar_one()
-
-    return agent_group, workspace, org
-
-
 @router.post("/chat/completions")
 async def chat_completions(
     request: ChatCompletionRequest,
     authorization: str = Header(...),
-) -> JSONResponse:
+) -> Response:
     if not authorization.startswith("Bearer "):
         raise HTTPException(401, "Missing or invalid Authorization header")
 
@@ -96,234 +82,218 @@ async def chat_completions(
     request_id = str(uuid.uuid4())
     start_ts = time.monotonic()
 
+    provider_name = _infer_provider(request.model)
+    messages = [m.model_dump() for m in request.messages]
+
     async with async_session_factory() as db:
         async with db.begin():
-            # 1. Resolve API key → Agent
-            api_key_obj = await resolve_api_key(db, plaintext_key)
-            if api_key_obj is None:
-                raise HTTPException(401, "Invalid or revoked API key")
-
-            agent_result = await db.execute(
-                select(Agent).where(Agent.id == api_key_obj.agent_id)
+            # 1-4. Key, agent, hierarchy, policies and pricing in one or two
+            # round trips (hierarchy snapshot cached by key hash).
+            preflight = await resolve_preflight(
+                db, plaintext_key, provider_name, request.model
             )
-            agent: Agent = agent_result.scalar_one()
+            if preflight is None:
+                raise HTTPException(401, "Invalid or revoked API key")
+            ctx = preflight.context
 
-            if agent.status != AgentStatus.ACTIVE:
+            if ctx.agent_status != AgentStatus.ACTIVE:
                 raise HTTPException(
                     403,
-                    f"Agent is not active (status: {agent.status.value})",
+                    f"Agent is not active (status: {ctx.agent_status.value})",
                 )
-
-            # 2. Resolve hierarchy
-            agent_group, workspace, org = await _resolve_hierarchy(db, agent)
-
-            if not org.is_active:
+            if not ctx.org_active:
                 raise HTTPException(403, "Organization is disabled")
-            if not workspace.is_active:
+            if not ctx.workspace_active:
                 raise HTTPException(403, "Workspace is disabled")
-            if not agent_group.is_active:
+            if not ctx.agent_group_active:
                 raise HTTPException(403, "Agent group is disabled")
 
-            # 3. Policy check
-            policy = await get_effective_policy(
-                db,
-                org_id=org.id,
-                workspace_id=workspace.id,
-                agent_group_id=agent_group.id,
-                agent_id=agent.id,
-            )
+            # 3. Policy check. The prompt is only estimated for an
+            # authenticated caller (and checked against max_input_tokens there).
+            estimated_input = estimate_prompt_tokens(request.model, messages)
             effective_max_tokens = enforce_policy(
-                policy, request.model, request.max_tokens
+                preflight.policy, request.model, request.max_tokens, estimated_input
             )
+            await enforce_rate_limit(preflight.policy, ctx.agent_id)
 
-            # 4. Fetch pricing (needed for budget/credit check)
-            provider_name = _infer_provider(request.model)
-            pricing_rule = await pricing_service.get_pricing_rule(
-                db, provider_name, request.model
-            )
+            # 4. Pricing (needed for budget/credit check)
+            pricing_rule = preflight.pricing_rule
+            if pricing_rule is None:
+                raise NotFoundError("PricingRule", f"{provider_name}/{request.model}")
 
-            # Estimate cost for budget pre-check (use 0 input tokens as estimate; post-check is authoritative)
-            # We use a rough estimate: max_tokens output, 0 input
+            # Estimate cost for budget pre-check: locally estimated prompt plus
+            # max_tokens output (settlement charges the provider-reported usage)
             estimated_output = effective_max_tokens or 1024
             estimated_cost_usd = (
-                (Decimal("0") / 1000) * pricing_rule.input_cost_per_1k
+                (Decimal(estimated_input) / 1000) * pricing_rule.input_cost_per_1k
                 + (Decimal(estimated_output) / 1000) * pricing_rule.output_cost_per_1k
             )
             estimated_credits = pricing_service.cost_to_credits(
                 estimated_cost_usd,
-                credits_per_usd=org.credits_per_usd,
+                credits_per_usd=ctx.credits_per_usd,
             )
 
             # 5. Budget check across hierarchy
             await check_budgets(
                 db,
-                org_id=org.id,
-                workspace_id=workspace.id,
-                agent_group_id=agent_group.id,
-                agent_id=agent.id,
+                org_id=ctx.org_id,
+                workspace_id=ctx.workspace_id,
+                agent_group_id=ctx.agent_group_id,
+                agent_id=ctx.agent_id,
                 required_credits=max(1, estimated_credits),
             )
 
-            # 6. Ledger balance check (inside advisory lock)
-            balance = await ledger_service.get_group_balance_for_update(
-                db, org.billing_group_id
+            # 6. Reserve the estimated credits (inside advisory lock). Concurrent
+            # requests see each other's holds, so they cannot all pass the check
+            # and then fail to pay after the provider call.
+            hold = await ledger_service.place_hold(
+                db,
+                group_id=ctx.billing_group_id,
+                amount=max(1, estimated_credits),
+                reference=f"gateway:{request_id}",
             )
+            hold_id = hold.id
 
-            # We'll do a quick pre-flight — exact deduction happens after provider call
-
-        # End pre-check transaction — release advisory lock
-
-    # 7. Call provider (outside transaction to avoid long-held locks)
-    messages = [m.model_dump() for m in request.messages]
-    kwargs: dict[str, Any] = {}
-    if effective_max_tokens:
-        kwargs["max_tokens"] = effective_max_tokens
-    if request.temperature is not None:
-        kwargs["temperature"] = request.temperature
-
-    usage_status = UsageStatus.SUCCESS
-    error_msg: str | None = None
-    provider_response = None
-
-    async with async_session_factory() as db:
-        # Get provider — prefer BYOK credentials for the org
-        byok_key = await get_active_credential(db, org.id, provider_name)
+        # End pre-check transaction — release advisory lock; the hold persists
 
+    # Load shaping runs once the hold is committed. Tokens are estimated as
+    # prompt + max completion and corrected to actual usage once the provider
+    # has answered.
     try:
-        try:
-            if byok_key:
-                provider = make_provider(provider_name, byok_key)
-            else:
-                provider = get_provider(provider_name)
-        except ValueError as exc:
-            raise HTTPException(
-                503,
-                f"Provider '{provider_name}' is not configured: {exc}",
-            ) from exc
-
-        provider_response = await provider.generate_completion(
-            model=request.model,
-            messages=messages,
-            **kwargs,
+        admission = await admit_load(
+            preflight.policy, ctx.agent_id, estimated_input + estimated_output
         )
-        latency_ms = int((time.monotonic() - start_ts) * 1000)
-    except Exception as exc:
-        latency_ms = int((time.monotonic() - start_ts) * 1000)
-        usage_status = UsageStatus.ERROR
-        error_msg = str(exc)[:1024]
-        # Record the failed attempt without charging
-        async with async_session_factory() as db:
-            async with db.begin():
-                event = UsageEvent(
-                    user_id=org.owner_id,
-                    group_id=org.billing_group_id,
-                    agent_id=agent.id,
-                    provider=provider_name,
-                    model=request.model,
-                    input_tokens=0,
-                    output_tokens=0,
-                    total_tokens=0,
-                    cost_usd=Decimal("0"),
-                    credits_charged=0,
-                    latency_ms=latency_ms,
-                    status=usage_status,
-                    error_message=error_msg,
-                )
-                db.add(event)
-                await log_event(
-                    db,
-                    org_id=org.id,
-                    event_type="gateway.request_error",
-                    actor_agent_id=agent.id,
-                    description=error_msg,
-                    metadata={"model": request.model, "request_id": request_id},
-                )
-        raise HTTPException(502, f"Provider error: {error_msg}")
-
-    # 8. Compute actual cost & deduct
-    actual_input = provider_response.input_tokens
-    actual_output = provider_response.output_tokens
-    actual_cost_usd = (
-        (Decimal(actual_input) / 1000) * pricing_rule.input_cost_per_1k
-        + (Decimal(actual_output) / 1000) * pricing_rule.output_cost_per_1k
-    )
-    actual_credits = pricing_service.cost_to_credits(
-        actual_cost_usd,
-        credits_per_usd=org.credits_per_usd,
-    )
+    except BaseException:
+        with anyio.CancelScope(shield=True):
+            await release_unused_hold(hold_id)
+        raise
+
+    # From here until settlement (or the error path) takes over, any exception
+    # or cancellation must give back the admission slot and the hold.
+    handed_off = False
+    lease: ProviderLease | None = None
+    try:
+        # 7. Call provider (outside transaction to avoid long-held locks)
+        kwargs: dict[str, Any] = {}
+        if effective_max_tokens:
+            kwargs["max_tokens"] = effective_max_tokens
+        if request.temperature is not None:
+            kwargs["temperature"] = request.temperature
 
-    idempotency_key = f"gateway:{request_id}"
+        # Get provider — prefer BYOK credentials for the org (cached, decrypted)
+        byok_key = await resolve_credential(ctx.org_id, provider_name)
 
-    async with async_session_factory() as db:
-        async with db.begin():
+        try:
             try:
-                await ledger_service.deduct_credits(
-                    db,
-                    group_id=org.billing_group_id,
-                    amount=actual_credits,
-                    idempotency_key=idempotency_key,
-                    metadata={
-                        "provider": provider_name,
-                        "model": request.model,
-                        "input_tokens": actual_input,
-                        "output_tokens": actual_output,
-                        "request_id": request_id,
-                        "agent_id": str(agent.id),
-                    },
+                lease = await lease_provider(provider_name, byok_key)
+            except ValueError as exc:
+                raise HTTPException(
+                    503,
+                    f"Provider '{provider_name}' is not configured: {exc}",
+                ) from exc
+            provider = lease.provider
+
+            if request.stream:
+                # Wait for the first chunk so upfront provider failures still get a 502
+                chunks = provider.stream_completion(
+                    model=request.model,
+                    messages=messages,
+                    **kwargs,
                 )
-            except InsufficientCreditsError:
-                usage_status = UsageStatus.BUDGET_EXCEEDED
-                # Record the blocked event (no charge)
-                event = UsageEvent(
-                    user_id=org.owner_id,
-                    group_id=org.billing_group_id,
-                    agent_id=agent.id,
-                    provider=provider_name,
+                first_chunk = await anext(chunks, None) or StreamChunk()
+            else:
+                provider_response = await provider.generate_completion(
                     model=request.model,
-                    input_tokens=actual_input,
-                    output_tokens=actual_output,
-                    total_tokens=actual_input + actual_output,
-                    cost_usd=actual_cost_usd,
-                    credits_charged=0,
-                    latency_ms=latency_ms,
-                    status=UsageStatus.BUDGET_EXCEEDED,
-                    error_message="Insufficient credits after provider call",
+                    messages=messages,
+                    **kwargs,
                 )
-                db.add(event)
-                raise HTTPException(402, "Insufficient credits — usage was not charged")
-
-            # Record usage
-            event = UsageEvent(
-                user_id=org.owner_id,
-                group_id=org.billing_group_id,
-                agent_id=agent.id,
-                provider=provider_name,
+                await lease.release()
+            latency_ms = int((time.monotonic() - start_ts) * 1000)
+        except Exception as exc:
+            latency_ms = int((time.monotonic() - start_ts) * 1000)
+            error_msg = str(exc)[:1024]
+            handed_off = True
+            if lease is not None:
+                await lease.release()
+            await admission.finish(0)
+            # Record the failed attempt without charging
+            await record_provider_error(
+                ctx,
+                hold_id=hold_id,
+                request_id=request_id,
+                provider_name=provider_name,
                 model=request.model,
-                input_tokens=actual_input,
-                output_tokens=actual_output,
-                total_tokens=actual_input + actual_output,
-                cost_usd=actual_cost_usd,
-                credits_charged=actual_credits,
                 latency_ms=latency_ms,
-                status=UsageStatus.SUCCESS,
+                error_msg=error_msg,
             )
-            db.add(event)
-
-            # Audit log
-            await log_event(
-                db,
-                org_id=org.id,
-                event_type="gateway.request",
-                actor_agent_id=agent.id,
-                description=f"Completed {provider_name}/{request.model}",
-                metadata={
-                    "request_id": request_id,
-                    "input_tokens": actual_input,
-                    "output_tokens": actual_output,
-                    "credits_charged": actual_credits,
-                    "latency_ms": latency_ms,
-                },
+            raise HTTPException(502, f"Provider error: {error_msg}")
+
+        if request.stream:
+            async def settle_stream(
+                input_tokens: int, output_tokens: int, latency_ms: int, error_msg: str | None
+            ) -> Settlement:
+                try:
+                    return await settle_usage(
+                        ctx,
+                        hold_id=hold_id,
+                        request_id=request_id,
+                        provider_name=provider_name,
+                        model=request.model,
+                        pricing_rule=pricing_rule,
+                        input_tokens=input_tokens,
+                        output_tokens=output_tokens,
+                        latency_ms=latency_ms,
+                        streamed=True,
+                        error_msg=error_msg,
+                    )
+                finally:
+                    await admission.finish(input_tokens + output_tokens)
+
+            response = MeteredStreamingResponse(
+                MeteredStream(
+                    chunks,
+                    first_chunk,
+                    meter=StreamMeter(prompt_tokens=estimated_input),
+                    request_id=request_id,
+                    model=request.model,
+                    start_ts=start_ts,
+                    settle=settle_stream,
+                    on_close=lease.release,
+                )
             )
+            # The response settles the stream, finishes the admission and
+            # releases the provider lease
+            handed_off = True
+            return response
+        handed_off = True  # settlement below takes over
+    finally:
+        if not handed_off:
+            with anyio.CancelScope(shield=True):
+                if lease is not None:
+                    await lease.release()
+                await admission.finish(0)
+                await release_unused_hold(hold_id)
+
+    # 8. Compute actual cost, deduct, record usage + audit
+    actual_input = provider_response.input_tokens
+    actual_output = provider_response.output_tokens
+    try:
+        settlement = await settle_usage(
+            ctx,
+            hold_id=hold_id,
+            request_id=request_id,
+            provider_name=provider_name,
+            model=request.model,
+            pricing_rule=pricing_rule,
+            input_tokens=actual_input,
+            output_tokens=actual_output,
+            latency_ms=latency_ms,
+        )
+    finally:
+        await admission.finish(actual_input + actual_output)
+    # Delivered work is never withheld: a shortfall (the balance ran out
+    # while the call was in flight) is charged as far as it goes and reported.
+    actual_credits = settlement.credits_charged
 
     # 9. Return OpenAI-compatible response
     return JSONResponse(
@@ -348,6 +318,7 @@ async def chat_completions(
             },
             "x_platform": {
                 "credits_charged": actual_credits,
+                "credits_shortfall": settlement.credits_shortfall,
                 "latency_ms": latency_ms,
                 "request_id": request_id,
             },
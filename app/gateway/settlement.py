@@ -0,0 +1,225 @@
+"""Post-call settlement for gateway requests.
+
+Shared by the buffered and streaming paths: turn the final token counts into
+a ledger deduction (settling the request's credit hold), a usage event and an
+audit entry, all in one transaction. Settlements for the same billing group
+are group-committed by ledger_service.deduction_batcher. With WRITE_BEHIND_ENABLED the usage event
+and audit entry are handed to the write-behind buffer once the deduction has
+committed instead.
+"""
+import uuid
+from dataclasses import dataclass
+from decimal import Decimal
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.audit.service import build_audit_event
+from app.budgets.service import record_spend
+from app.db.base import Base
+from app.db.session import async_session_factory
+from app.db.write_behind import write_behind
+from app.gateway.context import AgentContext
+from app.ledger import service as ledger_service
+from app.ledger.models import LedgerEntry
+from app.pricing import service as pricing_service
+from app.pricing.registry import PricingEntry
+from app.usage.heavy_hitters import heavy_hitters
+from app.usage.models import UsageEvent, UsageStatus
+
+
+@dataclass(frozen=True)
+class Settlement:
+    status: UsageStatus
+    cost_usd: Decimal
+    credits_charged: int
+    # Credits the call cost beyond what the hold and balance could cover
+    credits_shortfall: int = 0
+
+
+def _usage_event(ctx: AgentContext, **fields) -> UsageEvent:
+    """UsageEvent stamped with the caller's full hierarchy."""
+    return UsageEvent(
+        user_id=ctx.owner_id,
+        group_id=ctx.billing_group_id,
+        agent_id=ctx.agent_id,
+        agent_group_id=ctx.agent_group_id,
+        workspace_id=ctx.workspace_id,
+        org_id=ctx.org_id,
+        **fields,
+    )
+
+
+def _record(db: AsyncSession, rows: list[Base]) -> None:
+    """Usage and audit rows join the settlement transaction unless write-behind is on."""
+    if not write_behind.enabled:
+        db.add_all(rows)
+
+
+async def _record_committed(rows: list[Base]) -> None:
+    """Hand the rows to the write-behind buffer once the settlement committed."""
+    if write_behind.enabled:
+        await write_behind.put(*rows)
+
+
+async def record_provider_error(
+    ctx: AgentContext,
+    *,
+    hold_id: uuid.UUID,
+    request_id: str,
+    provider_name: str,
+    model: str,
+    latency_ms: int,
+    error_msg: str,
+) -> None:
+    """Record a failed provider call and release its hold without charging."""
+    rows: list[Base] = [
+        _usage_event(
+            ctx,
+            provider=provider_name,
+            model=model,
+            input_tokens=0,
+            output_tokens=0,
+            total_tokens=0,
+            cost_usd=Decimal("0"),
+            credits_charged=0,
+            latency_ms=latency_ms,
+            status=UsageStatus.ERROR,
+            error_message=error_msg,
+        ),
+        build_audit_event(
+            ctx.org_id,
+            "gateway.request_error",
+            actor_agent_id=ctx.agent_id,
+            description=error_msg,
+            metadata={"model": model, "request_id": request_id},
+        ),
+    ]
+    async with async_session_factory() as db:
+        async with db.begin():
+            await ledger_service.release_hold(db, hold_id)
+            _record(db, rows)
+    await _record_committed(rows)
+
+
+async def release_unused_hold(hold_id: uuid.UUID) -> None:
+    """Release a hold whose request never reached the provider."""
+    async with async_session_factory() as db:
+        async with db.begin():
+            await ledger_service.release_hold(db, hold_id)
+
+
+async def settle_usage(
+    ctx: AgentContext,
+    *,
+    hold_id: uuid.UUID,
+    request_id: str,
+    provider_name: str,
+    model: str,
+    pricing_rule: PricingEntry,
+    input_tokens: int,
+    output_tokens: int,
+    latency_ms: int,
+    streamed: bool = False,
+    error_msg: str | None = None,
+) -> Settlement:
+    """Settle the hold for a completed call and record usage + audit.
+
+    Idempotent per request_id. The provider has already been paid, so the
+    call is always charged: if the hold plus the remaining balance no longer
+    covers the cost, what they cover is charged, the usage is recorded as
+    BUDGET_EXCEEDED and the uncharged remainder as the shortfall.
+    """
+    cost_usd = pricing_service.calculate_cost(pricing_rule, input_tokens, output_tokens)
+    credits = pricing_service.cost_to_credits(cost_usd, credits_per_usd=ctx.credits_per_usd)
+
+    def outcome(entry: LedgerEntry | None) -> tuple[int, int, UsageStatus]:
+        charged = -entry.amount if entry is not None else 0
+        shortfall = max(0, credits - charged)
+        return charged, shortfall, (
+            UsageStatus.BUDGET_EXCEEDED if shortfall else UsageStatus.SUCCESS
+        )
+
+    rows: list[Base] = []
+
+    async def record(db: AsyncSession, entry: LedgerEntry | None) -> None:
+        # Runs in the batch transaction that settles the hold, once
+        nonlocal rows
+        charged, shortfall, status = outcome(entry)
+        # Budget counters move with the deduction
+        await record_spend(
+            db,
+            org_id=ctx.org_id,
+            workspace_id=ctx.workspace_id,
+            agent_group_id=ctx.agent_group_id,
+            agent_id=ctx.agent_id,
+            credits=charged,
+        )
+        message = error_msg
+        audit_metadata = {
+            "request_id": request_id,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "credits_charged": charged,
+            "latency_ms": latency_ms,
+            "streamed": streamed,
+        }
+        if shortfall:
+            message = (
+                f"Insufficient credits after provider call: {shortfall} credits uncharged"
+                + (f"; {error_msg}" if error_msg else "")
+            )[:1024]
+            audit_metadata["credits_shortfall"] = shortfall
+        rows = [
+            _usage_event(
+                ctx,
+                provider=provider_name,
+                model=model,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                total_tokens=input_tokens + output_tokens,
+                cost_usd=cost_usd,
+                credits_charged=charged,
+                latency_ms=latency_ms,
+                status=status,
+                error_message=message,
+            ),
+            build_audit_event(
+                ctx.org_id,
+                "gateway.request",
+                actor_agent_id=ctx.agent_id,
+                description=f"Completed {provider_name}/{model}",
+                metadata=audit_metadata,
+            ),
+        ]
+        _record(db, rows)
+
+    # Group commit with the group's other settlements (one lock, one balance
+    # read, one multi-row insert per batch)
+    entry = await ledger_service.deduction_batcher.settle_hold(
+        ctx.billing_group_id,
+        hold_id,
+        amount=credits,
+        idempotency_key=f"gateway:{request_id}",
+        metadata={
+            "provider": provider_name,
+            "model": model,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "request_id": request_id,
+            "agent_id": str(ctx.agent_id),
+        },
+        on_settled=record,
+    )
+    charged, shortfall, status = outcome(entry)
+    settlement = Settlement(status, cost_usd, charged, shortfall)
+    if not rows:
+        return settlement  # replay: recorded by the original settlement
+    await _record_committed(rows)
+    heavy_hitters.record(
+        ctx.billing_group_id,
+        credits=settlement.credits_charged,
+        user_id=ctx.owner_id,
+        agent_id=ctx.agent_id,
+        model=model,
+    )
+    return settlement
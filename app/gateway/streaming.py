@@ -0,0 +1,200 @@
+"""Server-sent-events streaming for the gateway.
+
+Provider chunks are re-emitted as OpenAI ``chat.completion.chunk`` events as
+they arrive while a StreamMeter keeps a running token count. Settlement runs
+exactly once when the stream ends — normally, on a provider error, because
+the client disconnected, or because the response body was never iterated at
+all — inside a shielded cancel scope so a cancelled request is still charged
+for what was delivered.
+"""
+import json
+import math
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+
+import anyio
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.gateway.settlement import Settlement
+from app.providers.base import StreamChunk
+
+# Same rough heuristic the mock provider uses: ~4 characters per token.
+CHARS_PER_TOKEN = 4
+
+SettleFn = Callable[[int, int, int, str | None], Awaitable[Settlement]]
+
+
+@dataclass
+class StreamMeter:
+    """Running token count for one streamed completion.
+
+    Provider-reported totals win; when a stream ends before the provider
+    reports usage, the prompt is charged at the pre-check estimate and
+    delivered text by the character heuristic.
+    """
+    prompt_tokens: int
+    delivered_chars: int = 0
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+
+    def observe(self, chunk: StreamChunk) -> None:
+        self.delivered_chars += len(chunk.content)
+        if chunk.input_tokens is not None:
+            self.input_tokens = chunk.input_tokens
+        if chunk.output_tokens is not None:
+            self.output_tokens = chunk.output_tokens
+
+    def usage(self) -> tuple[int, int]:
+        input_tokens = self.input_tokens
+        if input_tokens is None:
+            input_tokens = self.prompt_tokens
+        output_tokens = self.output_tokens
+        if output_tokens is None:
+            output_tokens = math.ceil(self.delivered_chars / CHARS_PER_TOKEN)
+        return input_tokens, output_tokens
+
+
+def sse_event(payload: dict[str, Any] | str) -> str:
+    data = payload if isinstance(payload, str) else json.dumps(payload)
+    return f"data: {data}\n\n"
+
+
+def _chunk_payload(
+    request_id: str, model: str, delta: dict[str, str], finish_reason: str | None
+) -> dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{request_id}",
+        "object": "chat.completion.chunk",
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+class MeteredStream:
+    """One provider stream relayed as SSE, settled exactly once.
+
+    ``settle(input_tokens, output_tokens, latency_ms, error_msg)`` is awaited
+    once, from whichever comes first: the end of ``events()`` or ``close()``.
+    ``close()`` also works when ``events()`` never started (the client went
+    away before the response body was iterated), so the upstream stream,
+    hold and admission slot are released either way. ``on_close`` (if given)
+    is awaited once the upstream stream is closed, e.g. to release the
+    provider lease.
+    """
+
+    def __init__(
+        self,
+        chunks: AsyncIterator[StreamChunk],
+        first: StreamChunk,
+        *,
+        meter: StreamMeter,
+        request_id: str,
+        model: str,
+        start_ts: float,
+        settle: SettleFn,
+        on_close: Callable[[], Awaitable[None]] | None = None,
+    ) -> None:
+        self.chunks = chunks
+        self.first = first
+        self.meter = meter
+        self.request_id = request_id
+        self.model = model
+        self.start_ts = start_ts
+        self.settle = settle
+        self.on_close = on_close
+        self.settlement: Settlement | None = None
+        self.error_msg: str | None = None
+        self._chunks_closed = False
+        self._lock = anyio.Lock()
+
+    async def _settle(self) -> Settlement:
+        with anyio.CancelScope(shield=True):
+            async with self._lock:
+                if self.settlement is None:
+                    input_tokens, output_tokens = self.meter.usage()
+                    latency_ms = int((time.monotonic() - self.start_ts) * 1000)
+                    self.settlement = await self.settle(
+                        input_tokens, output_tokens, latency_ms, self.error_msg
+                    )
+        return self.settlement
+
+    async def close(self) -> None:
+        """Close the upstream stream and, if not yet settled, charge what was delivered."""
+        with anyio.CancelScope(shield=True):
+            if not self._chunks_closed:
+                self._chunks_closed = True
+                try:
+                    await self.chunks.aclose()
+                finally:
+                    if self.on_close is not None:
+                        await self.on_close()
+        if self.settlement is None:
+            # Client went away (or we were cancelled): charge what was delivered.
+            self.error_msg = self.error_msg or "Client disconnected before stream completed"
+            await self._settle()
+
+    async def events(self) -> AsyncIterator[str]:
+        """SSE events for the stream, starting with the chunk already in hand."""
+        request_id, model = self.request_id, self.model
+        try:
+            yield sse_event(_chunk_payload(request_id, model, {"role": "assistant"}, None))
+            chunk: StreamChunk | None = self.first
+            while chunk is not None:
+                self.meter.observe(chunk)
+                if chunk.content or chunk.finish_reason:
+                    delta = {"content": chunk.content} if chunk.content else {}
+                    yield sse_event(
+                        _chunk_payload(request_id, model, delta, chunk.finish_reason)
+                    )
+                try:
+                    chunk = await anext(self.chunks, None)
+                except Exception as exc:
+                    self.error_msg = f"Stream ended early: {exc}"[:1024]
+                    break
+
+            settlement = await self._settle()
+            input_tokens, output_tokens = self.meter.usage()
+            if self.error_msg is not None:
+                yield sse_event({"error": {"message": self.error_msg, "type": "provider_error"}})
+            yield sse_event(
+                {
+                    **_chunk_payload(request_id, model, {}, None),
+                    "choices": [],
+                    "usage": {
+                        "prompt_tokens": input_tokens,
+                        "completion_tokens": output_tokens,
+                        "total_tokens": input_tokens + output_tokens,
+                    },
+                    "x_platform": {
+                        "credits_charged": settlement.credits_charged,
+                        "credits_shortfall": settlement.credits_shortfall,
+                        "status": settlement.status.value,
+                        "request_id": request_id,
+                    },
+                }
+            )
+            yield sse_event("[DONE]")
+        finally:
+            await self.close()
+
+
+class MeteredStreamingResponse(StreamingResponse):
+    """SSE response that closes its MeteredStream even if the body never ran."""
+
+    def __init__(self, stream: MeteredStream) -> None:
+        super().__init__(
+            stream.events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        self.stream = stream
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.stream.close()
+
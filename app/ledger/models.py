@@ -1,10 +1,23 @@
 import enum
 import uuid
+from datetime import datetime
 
-from sqlalchemy import BigInteger, Enum, ForeignKey, Index, JSON, String, Uuid
+from sqlalchemy import (
+    BigInteger,
+    DateTime,
+    Enum,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Index,
+    JSON,
+    SmallInteger,
+    String,
+    Uuid,
+    text,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 
-from app.db.base import Base, TimestampMixin, UUIDMixin
+from app.db.base import Base, PartitionedTimestampMixin, TimestampMixin, UUIDMixin
 
 
 class TransactionType(str, enum.Enum):
@@ -12,12 +25,16 @@ class TransactionType(str, enum.Enum):
     USAGE_DEDUCTION = "USAGE_DEDUCTION"
     ADJUSTMENT = "ADJUSTMENT"
     REFUND = "REFUND"
+    # Credits moved between shards of one group; always written in +/- pairs
+    SHARD_TRANSFER = "SHARD_TRANSFER"
 
 
-class LedgerEntry(UUIDMixin, TimestampMixin, Base):
+class LedgerEntry(UUIDMixin, PartitionedTimestampMixin, Base):
     __tablename__ = "ledger"
     __table_args__ = (
         Index("ix_ledger_group_created", "group_id", "created_at"),
+        Index("ix_ledger_group_shard_created", "group_id", "shard", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
     group_id: Mapped[uuid.UUID] = mapped_column(
@@ -26,7 +43,114 @@ class LedgerEntry(UUIDMixin, TimestampMixin, Base):
     # Signed integer: positive = credit in, negative = deduction
     amount: Mapped[int] = mapped_column(BigInteger, nullable=False)
     type: Mapped[TransactionType] = mapped_column(Enum(TransactionType), nullable=False)
-    idempotency_key: Mapped[str | None] = mapped_column(
-        String(255), unique=True, nullable=True
-    )
+    # Unique across the whole ledger via LedgerIdempotencyKey
+    idempotency_key: Mapped[str | None] = mapped_column(String(255), nullable=True)
     metadata_: Mapped[dict | None] = mapped_column("metadata", JSON, nullable=True)
+    # Sub-account of the group (see Group.ledger_shards); 0 for unsharded groups
+    shard: Mapped[int] = mapped_column(
+        SmallInteger, nullable=False, default=0, server_default="0"
+    )
+
+
+class LedgerIdempotencyKey(Base):
+    """
+    Claims an idempotency key for one ledger entry.
+
+    A unique index on the partitioned ledger must include created_at, so it
+    would only keep keys unique within a month. This unpartitioned table
+    holds one row per key instead; (ledger_entry_id, entry_created_at) leads
+    straight to the entry's partition.
+    """
+    __tablename__ = "ledger_idempotency_keys"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["ledger_entry_id", "entry_created_at"], ["ledger.id", "ledger.created_at"]
+        ),
+    )
+
+    idempotency_key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    ledger_entry_id: Mapped[uuid.UUID] = mapped_column(Uuid, nullable=False)
+    entry_created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
+
+
+class HoldStatus(str, enum.Enum):
+    ACTIVE = "ACTIVE"
+    SETTLED = "SETTLED"
+    RELEASED = "RELEASED"
+    EXPIRED = "EXPIRED"
+
+
+class CreditHold(UUIDMixin, TimestampMixin, Base):
+    """
+    A reservation of credits against a group's balance.
+
+    Holds live outside the ledger so the ledger stays append-only: an ACTIVE,
+    unexpired hold reduces the available balance; settling appends the real
+    deduction to the ledger and closes the hold.
+    """
+    __tablename__ = "credit_holds"
+    __table_args__ = (
+        Index(
+            "ix_credit_holds_group_active",
+            "group_id",
+            "expires_at",
+            postgresql_where=text("status = 'ACTIVE'"),
+        ),
+    )
+
+    group_id: Mapped[uuid.UUID] = mapped_column(
+        Uuid, ForeignKey("groups.id"), nullable=False
+    )
+    # Positive number of credits reserved
+    amount: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    status: Mapped[HoldStatus] = mapped_column(
+        Enum(HoldStatus), nullable=False, default=HoldStatus.ACTIVE
+    )
+    # Caller-supplied key (e.g. gateway request id); placing twice is a no-op
+    reference: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    resolved_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    # No FK: the partitioned ledger is keyed by (id, created_at)
+    ledger_entry_id: Mapped[uuid.UUID | None] = mapped_column(Uuid, nullable=True)
+    # Shard the reservation counts against
+    shard: Mapped[int] = mapped_column(
+        SmallInteger, nullable=False, default=0, server_default="0"
+    )
+
+
+class LedgerCheckpoint(UUIDMixin, TimestampMixin, Base):
+    """
+    Immutable snapshot: the SUM of a group's ledger entries created at or
+    before as_of.
+
+    Checkpoints are a derived, verifiable cache — never a source of truth.
+    Balance = latest checkpoint + SUM(entries created after its as_of), and
+    verify_checkpoints() recomputes every checkpoint from the raw ledger.
+    There is deliberately no FK into the ledger so checkpoints never
+    constrain it. shard is NULL for whole-group checkpoints and set for the
+    per-shard checkpoints of sharded groups.
+    """
+    __tablename__ = "ledger_checkpoints"
+    __table_args__ = (
+        Index(
+            "ix_ledger_checkpoints_group_shard_as_of",
+            "group_id",
+            "shard",
+            "as_of",
+            unique=True,
+            postgresql_nulls_not_distinct=True,
+        ),
+    )
+
+    group_id: Mapped[uuid.UUID] = mapped_column(
+        Uuid, ForeignKey("groups.id"), nullable=False
+    )
+    as_of: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    balance: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    # Number of ledger entries covered (cumulative), for verification
+    entry_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    shard: Mapped[int | None] = mapped_column(SmallInteger, nullable=True)
@@ -1,3 +1,5 @@
+import uuid
+
 from fastapi import APIRouter
 
 from app.core.dependencies import CurrentUser, DbSession
@@ -5,7 +7,11 @@ from app.core.exceptions import AppError
 from app.groups.service import get_user_membership
 from app.ledger import service
 from app.ledger.models import TransactionType
-from app.ledger.schemas import LedgerEntryResponse, PurchaseCreditsRequest
+from app.ledger.schemas import (
+    BalanceVerificationResponse,
+    LedgerEntryResponse,
+    PurchaseCreditsRequest,
+)
 
 router = APIRouter(prefix="/credits", tags=["credits"])
 
@@ -27,6 +33,18 @@ async def purchase_credits(
         idempotency_key=body.idempotency_key,
         metadata={"purchased_by": str(user.id)},
     )
+    # Purchases land in shard 0; spread them if the group is sharded
+    await service.rebalance_shards(db, body.group_id)
     await db.commit()
     await db.refresh(entry)
     return LedgerEntryResponse.model_validate(entry)
+
+
+@router.get("/{group_id}/verify", response_model=BalanceVerificationResponse)
+async def verify_balance(
+    group_id: uuid.UUID, db: DbSession, user: CurrentUser
+) -> BalanceVerificationResponse:
+    """Recompute the balance and every checkpoint from the raw ledger."""
+    await get_user_membership(db, user.id, group_id)
+    verification = await service.verify_balance(db, group_id)
+    return BalanceVerificationResponse.model_validate(verification)
@@ -21,3 +21,25 @@ class LedgerEntryResponse(BaseModel):
     type: TransactionType
     metadata_: dict | None = None
     created_at: datetime
+
+
+class CheckpointMismatchResponse(BaseModel):
+    model_config = {"from_attributes": True}
+
+    checkpoint_id: uuid.UUID
+    as_of: datetime
+    stored_balance: int
+    actual_balance: int
+    stored_entry_count: int
+    actual_entry_count: int
+
+
+class BalanceVerificationResponse(BaseModel):
+    model_config = {"from_attributes": True}
+
+    group_id: uuid.UUID
+    balance: int  # checkpoint + tail
+    recomputed_balance: int  # full SUM(amount)
+    checkpoints_checked: int
+    consistent: bool
+    mismatches: list[CheckpointMismatchResponse]
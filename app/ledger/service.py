@@ -3,23 +3,136 @@ Ledger service — the financial core.
 
 Rules:
 - NEVER update or delete ledger entries (append-only).
-- Balance is ALWAYS derived via SUM(amount).
+- Balance is ALWAYS derived via SUM(amount): the latest immutable
+  checkpoint (itself a SUM, verifiable from scratch) plus SUM of the tail.
 - Use advisory locks or row-level locking to prevent race conditions.
-- Idempotency via idempotency_key (unique constraint).
+- Idempotency via idempotency_key, claimed in ledger_idempotency_keys
+  (the partitioned ledger cannot hold a global unique index).
+- Reservations (holds) live in credit_holds, never in the ledger.
+  Available balance = SUM(ledger) - active, unexpired holds.
+- A hot group can be split into Group.ledger_shards sub-accounts. Every
+  entry and hold belongs to one shard and each shard has its own lock, so
+  concurrent deductions serialize per shard instead of per group. The group
+  balance is still the SUM over all shards; credits move between shards only
+  through paired SHARD_TRANSFER entries.
 """
+import asyncio
+import hashlib
+import random
 import uuid
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
 from typing import Any
 
-from sqlalchemy import func, select, text
+from sqlalchemy import (
+    DateTime,
+    and_,
+    cast,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    text,
+    union_all,
+    update,
+)
 from sqlalchemy.dialects.postgresql import insert as pg_insert
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import aliased
 
-from app.core.exceptions import InsufficientCreditsError
-from app.ledger.models import LedgerEntry, TransactionType
+from app.config import settings
+from app.core.cache import MISSING, TTLCache
+from app.core.exceptions import AppError, InsufficientCreditsError, NotFoundError
+from app.db import session as db_session
+from app.db.base import Base
+from app.groups.models import Group
+from app.ledger.models import (
+    CreditHold,
+    HoldStatus,
+    LedgerCheckpoint,
+    LedgerEntry,
+    LedgerIdempotencyKey,
+    TransactionType,
+)
+
+
+# Lower bound for the tail scan when a group has no checkpoint yet
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+MAX_LEDGER_SHARDS = 64
+
+# group_id -> Group.ledger_shards
+_shard_counts: TTLCache[uuid.UUID, int] = TTLCache(
+    maxsize=10_000, ttl_seconds=settings.ledger_shard_count_cache_ttl_seconds
+)
+
+
+def _checkpoint_shard_filter(shard: int | None):
+    return LedgerCheckpoint.shard.is_(None) if shard is None else LedgerCheckpoint.shard == shard
+
+
+def _settled_balance(group_id: uuid.UUID, shard: int | None = None):
+    """SQL expression: latest checkpoint balance + SUM of entries after it.
+
+    With a shard, only that shard's entries and checkpoints count.
+    """
+    latest = (
+        select(LedgerCheckpoint.balance, LedgerCheckpoint.as_of)
+        .where(LedgerCheckpoint.group_id == group_id, _checkpoint_shard_filter(shard))
+        .order_by(LedgerCheckpoint.as_of.desc())
+        .limit(1)
+        .subquery()
+    )
+    checkpoint_balance = select(latest.c.balance).scalar_subquery()
+    checkpoint_as_of = select(latest.c.as_of).scalar_subquery()
+    tail_filter = [
+        LedgerEntry.group_id == group_id,
+        LedgerEntry.created_at
+        > func.coalesce(checkpoint_as_of, literal(_EPOCH, DateTime(timezone=True))),
+    ]
+    if shard is not None:
+        tail_filter.append(LedgerEntry.shard == shard)
+    tail = (
+        select(func.coalesce(func.sum(LedgerEntry.amount), 0))
+        .where(*tail_filter)
+        .scalar_subquery()
+    )
+    return func.coalesce(checkpoint_balance, 0) + tail
+
+
+def _available_balance(
+    group_id: uuid.UUID, shard: int | None = None, exclude_hold_id: uuid.UUID | None = None
+):
+    """SQL expression: settled balance minus active holds (optionally but one)."""
+    held_filter = [
+        CreditHold.group_id == group_id,
+        CreditHold.status == HoldStatus.ACTIVE,
+        CreditHold.expires_at > _now(),
+    ]
+    if shard is not None:
+        held_filter.append(CreditHold.shard == shard)
+    if exclude_hold_id is not None:
+        held_filter.append(CreditHold.id != exclude_hold_id)
+    held = (
+        select(func.coalesce(func.sum(CreditHold.amount), 0))
+        .where(*held_filter)
+        .scalar_subquery()
+    )
+    return _settled_balance(group_id, shard) - held
 
 
 async def get_group_balance(db: AsyncSession, group_id: uuid.UUID) -> int:
     """Compute group balance from ledger. Returns integer credits."""
+    result = await db.execute(select(_settled_balance(group_id)))
+    return int(result.scalar_one())
+
+
+async def recompute_group_balance(db: AsyncSession, group_id: uuid.UUID) -> int:
+    """Full SUM over every ledger row, ignoring checkpoints."""
     result = await db.execute(
         select(func.coalesce(func.sum(LedgerEntry.amount), 0)).where(
             LedgerEntry.group_id == group_id
@@ -28,50 +141,522 @@ async def get_group_balance(db: AsyncSession, group_id: uuid.UUID) -> int:
     return int(result.scalar_one())
 
 
+async def get_held_credits(db: AsyncSession, group_id: uuid.UUID) -> int:
+    """Credits reserved by active, unexpired holds."""
+    result = await db.execute(
+        select(func.coalesce(func.sum(CreditHold.amount), 0)).where(
+            CreditHold.group_id == group_id,
+            CreditHold.status == HoldStatus.ACTIVE,
+            CreditHold.expires_at > _now(),
+        )
+    )
+    return int(result.scalar_one())
+
+
+async def get_available_balance(
+    db: AsyncSession,
+    group_id: uuid.UUID,
+    exclude_hold_id: uuid.UUID | None = None,
+    shard: int | None = None,
+) -> int:
+    """Ledger balance minus active holds (optionally but one), in one round trip."""
+    result = await db.execute(select(_available_balance(group_id, shard, exclude_hold_id)))
+    return int(result.scalar_one())
+
+
+async def get_shard_balances(
+    db: AsyncSession,
+    group_id: uuid.UUID,
+    shards: Sequence[int],
+    exclude_hold_id: uuid.UUID | None = None,
+) -> list[int]:
+    """Available balance of each of `shards`, in one round trip."""
+    result = await db.execute(
+        select(*(_available_balance(group_id, s, exclude_hold_id) for s in shards))
+    )
+    return [int(v) for v in result.one()]
+
+
+def _lock_key(group_id: uuid.UUID, shard: int = 0) -> int:
+    """Signed 64-bit advisory lock key for one shard of a group.
+
+    Hashing the full UUID (not group_id % 2**31) keeps unrelated groups from
+    sharing a lock.
+    """
+    digest = hashlib.blake2b(
+        group_id.bytes + shard.to_bytes(2, "big"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+async def _lock_group(db: AsyncSession, group_id: uuid.UUID, shard: int = 0) -> None:
+    # Advisory lock keyed on (group_id, shard) — holds until end of transaction.
+    # Only PostgreSQL has advisory locks; SQLite (tests) serialises writers anyway.
+    if db.get_bind().dialect.name == "postgresql":
+        await db.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": _lock_key(group_id, shard)}
+        )
+
+
+async def _try_lock_group(db: AsyncSession, group_id: uuid.UUID, shard: int) -> bool:
+    """Take the shard's lock only if it is free right now."""
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    result = await db.execute(
+        text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _lock_key(group_id, shard)}
+    )
+    return bool(result.scalar_one())
+
+
+async def _lock_shards(db: AsyncSession, group_id: uuid.UUID, shards: Sequence[int]) -> None:
+    # Always ascending, so two whole-group lockers cannot deadlock.
+    for shard in sorted(shards):
+        await _lock_group(db, group_id, shard)
+
+
+def _shard_count_expr(group_id: uuid.UUID):
+    """SQL expression: Group.ledger_shards (1 for an unknown group)."""
+    count = select(Group.ledger_shards).where(Group.id == group_id).scalar_subquery()
+    return func.coalesce(count, 1)
+
+
+async def get_shard_count(db: AsyncSession, group_id: uuid.UUID) -> int:
+    """Group.ledger_shards, cached per process.
+
+    Only good for choosing which locks to take: another process may have
+    changed the count. Writers confirm it under their locks (_locked_balance,
+    _lock_all_shards).
+    """
+    count = _shard_counts.get(group_id)
+    if count is MISSING:
+        result = await db.execute(select(_shard_count_expr(group_id)))
+        count = int(result.scalar_one())
+        _shard_counts.set(group_id, count)
+    return count
+
+
+def clear_shard_counts() -> None:
+    _shard_counts.clear()
+
+
+async def _lock_all_shards(
+    db: AsyncSession, group_id: uuid.UUID, count: int | None = None
+) -> int:
+    """
+    Lock every shard of the group and return the shard count read under
+    those locks. set_shard_count locks every shard of both the old and the
+    new count before changing it, so the count cannot move until this
+    transaction ends. If the cached `count` was stale, the missing shards
+    are locked too (still in ascending order).
+    """
+    if count is None:
+        count = await get_shard_count(db, group_id)
+    await _lock_shards(db, group_id, range(count))
+    result = await db.execute(select(_shard_count_expr(group_id)))
+    actual = int(result.scalar_one())
+    if actual != count:
+        _shard_counts.set(group_id, actual)
+        if actual > count:
+            await _lock_shards(db, group_id, range(count, actual))
+    return actual
+
+
+async def _locked_balances(
+    db: AsyncSession,
+    group_id: uuid.UUID,
+    count: int,
+    shards: Sequence[int | None],
+    exclude_hold_id: uuid.UUID | None = None,
+) -> list[int] | None:
+    """
+    Available balances of `shards` (None = the whole group) whose locks are
+    held, read in the same statement as the shard count. Returns None if the
+    count is no longer `count`, because the locks taken may not be the ones
+    other writers take.
+    """
+    result = await db.execute(
+        select(
+            *(_available_balance(group_id, s, exclude_hold_id) for s in shards),
+            _shard_count_expr(group_id),
+        )
+    )
+    *balances, actual = result.one()
+    if actual != count:
+        _shard_counts.set(group_id, int(actual))
+        return None
+    return [int(b) for b in balances]
+
+
+async def _locked_balance(
+    db: AsyncSession,
+    group_id: uuid.UUID,
+    count: int,
+    exclude_hold_id: uuid.UUID | None = None,
+    shard: int | None = None,
+) -> int | None:
+    balances = await _locked_balances(db, group_id, count, [shard], exclude_hold_id)
+    return None if balances is None else balances[0]
+
+
 async def get_group_balance_for_update(db: AsyncSession, group_id: uuid.UUID) -> int:
     """
-    Compute group balance while holding an advisory lock on the group.
+    Compute group balance while holding the advisory locks of all its shards.
     Use this inside a transaction that will also insert a deduction.
     This prevents concurrent deductions from causing over-spend.
     """
-    # Advisory lock keyed on group_id — holds until end of transaction
-    lock_key = int(group_id.int % (2**31))
-    await db.execute(text(f"SELECT pg_advisory_xact_lock({lock_key})"))
-
+    await _lock_all_shards(db, group_id)
     return await get_group_balance(db, group_id)
 
 
-async def append_entry(
+async def get_available_balance_for_update(db: AsyncSession, group_id: uuid.UUID) -> int:
+    """Available balance (net of holds) under the locks of all the group's shards."""
+    await _lock_all_shards(db, group_id)
+    return await get_available_balance(db, group_id)
+
+
+async def _reserve_shard(
     db: AsyncSession,
     group_id: uuid.UUID,
     amount: int,
-    type: TransactionType,
-    idempotency_key: str | None = None,
-    metadata: dict[str, Any] | None = None,
-) -> LedgerEntry:
+    exclude_hold_id: uuid.UUID | None = None,
+    prefer: int | None = None,
+) -> int:
     """
-    Append a ledger entry. If idempotency_key is provided and already exists,
-    returns the existing entry (no-op).
+    Lock and return a shard whose available balance covers `amount`.
+    Raises InsufficientCreditsError when none can.
+
+    Unsharded groups lock their single shard. Sharded groups try `prefer`
+    first, then shards with enough balance from a random starting point,
+    skipping any whose lock is busy. If none is free and covers the amount,
+    all shards are locked and credits are moved into the fullest one.
+
+    The shard count comes from the per-process cache and is confirmed with
+    the first balance read under a lock. If it changed, every shard is
+    locked and the reservation is made against the real count. Holding one
+    shard while locking the rest can deadlock with a whole-group locker.
+    PostgreSQL then aborts one of the two transactions. That is better than
+    checking the wrong balance, and it only happens within the cache TTL
+    after a count change.
     """
-    if idempotency_key is not None:
-        # Check for existing entry with this key
-        result = await db.execute(
-            select(LedgerEntry).where(LedgerEntry.idempotency_key == idempotency_key)
+    count = await get_shard_count(db, group_id)
+    if count == 1:
+        await _lock_group(db, group_id)
+        available = await _locked_balance(db, group_id, count, exclude_hold_id)
+        if available is None:
+            return await _consolidate(db, group_id, count, amount, exclude_hold_id)
+        if available < amount:
+            raise InsufficientCreditsError(balance=available, required=amount)
+        return 0
+
+    locked_any = False
+    if prefer is not None and prefer < count:
+        await _lock_group(db, group_id, prefer)
+        locked_any = True
+        available = await _locked_balance(db, group_id, count, exclude_hold_id, shard=prefer)
+        if available is None:
+            return await _consolidate(db, group_id, count, amount, exclude_hold_id)
+        if available >= amount:
+            return prefer
+
+    balances = await get_shard_balances(db, group_id, range(count), exclude_hold_id)
+    start = random.randrange(count)
+    for shard in ((start + i) % count for i in range(count)):
+        if shard == prefer or balances[shard] < amount:
+            continue
+        if not await _try_lock_group(db, group_id, shard):
+            continue
+        locked_any = True
+        available = await _locked_balance(db, group_id, count, exclude_hold_id, shard=shard)
+        if available is None:
+            return await _consolidate(db, group_id, count, amount, exclude_hold_id)
+        if available >= amount:
+            return shard
+
+    if locked_any:
+        # Blocking on more shards while holding one could deadlock with a
+        # whole-group locker; give up like an unsharded group would.
+        raise InsufficientCreditsError(balance=max(balances), required=amount)
+    return await _consolidate(db, group_id, count, amount, exclude_hold_id)
+
+
+async def _consolidate(
+    db: AsyncSession,
+    group_id: uuid.UUID,
+    count: int,
+    amount: int,
+    exclude_hold_id: uuid.UUID | None = None,
+) -> int:
+    """
+    Lock every shard and move credits into the fullest until it covers
+    `amount`. `count` is the caller's shard count; the one read under the
+    locks is used.
+    """
+    count = await _lock_all_shards(db, group_id, count)
+    balances = await get_shard_balances(db, group_id, range(count), exclude_hold_id)
+    total = sum(b for b in balances if b > 0)
+    if total < amount:
+        raise InsufficientCreditsError(balance=total, required=amount)
+
+    target = max(range(count), key=balances.__getitem__)
+    needed = amount - balances[target]
+    for shard in sorted(range(count), key=balances.__getitem__, reverse=True):
+        if needed <= 0:
+            break
+        if shard == target or balances[shard] <= 0:
+            continue
+        moved = min(needed, balances[shard])
+        await _transfer(db, group_id, shard, target, moved, reason="consolidate")
+        needed -= moved
+    return target
+
+
+async def _transfer(
+    db: AsyncSession,
+    group_id: uuid.UUID,
+    from_shard: int,
+    to_shard: int,
+    amount: int,
+    reason: str,
+) -> None:
+    """Move credits between two locked shards; the group balance is unchanged."""
+    metadata = {"from_shard": from_shard, "to_shard": to_shard, "reason": reason}
+    for shard, signed in ((from_shard, -amount), (to_shard, amount)):
+        await append_entry(
+            db,
+            group_id=group_id,
+            amount=signed,
+            type=TransactionType.SHARD_TRANSFER,
+            metadata=metadata,
+            shard=shard,
         )
-        existing = result.scalar_one_or_none()
-        if existing is not None:
-            return existing
 
+
+async def rebalance_shards(db: AsyncSession, group_id: uuid.UUID) -> int:
+    """
+    Even out available credits across the group's shards, and drain shards
+    left over from a larger shard count. Returns the credits moved.
+
+    Locks every shard for the rest of the transaction; run it off the hot
+    path (after purchases, from scripts/maintenance.py).
+    """
+    count = await _lock_all_shards(db, group_id)
+    result = await db.execute(
+        select(LedgerEntry.shard)
+        .where(LedgerEntry.group_id == group_id, LedgerEntry.shard >= count)
+        .distinct()
+    )
+    stray = sorted(result.scalars().all())
+    if count == 1 and not stray:
+        return 0
+
+    shards = list(range(count)) + stray
+    await _lock_shards(db, group_id, stray)
+    balances = dict(zip(shards, await get_shard_balances(db, group_id, shards)))
+    total = sum(b for b in balances.values() if b > 0)
+    targets = {s: total // count + (1 if s < total % count else 0) for s in range(count)}
+    targets.update({s: 0 for s in stray})
+
+    surplus = [(s, balances[s] - targets[s]) for s in shards if balances[s] > targets[s]]
+    deficit = [(s, targets[s] - balances[s]) for s in shards if balances[s] < targets[s]]
+    moved = 0
+    while surplus and deficit:
+        (src, extra), (dst, missing) = surplus[-1], deficit[-1]
+        step = min(extra, missing)
+        await _transfer(db, group_id, src, dst, step, reason="rebalance")
+        moved += step
+        surplus[-1], deficit[-1] = (src, extra - step), (dst, missing - step)
+        if extra == step:
+            surplus.pop()
+        if missing == step:
+            deficit.pop()
+    return moved
+
+
+async def set_shard_count(db: AsyncSession, group_id: uuid.UUID, count: int) -> int:
+    """Split (or merge) a group's balance across `count` shards. Returns credits moved."""
+    if not 1 <= count <= MAX_LEDGER_SHARDS:
+        raise AppError(
+            f"Shard count must be between 1 and {MAX_LEDGER_SHARDS}", status_code=400
+        )
+    group = await db.get(Group, group_id, with_for_update=True)
+    if group is None:
+        raise NotFoundError("Group", str(group_id))
+    # Writers lock by the count they last saw (possibly cached); wait for
+    # every one of them under either count before changing it.
+    await _lock_shards(db, group_id, range(max(group.ledger_shards, count)))
+    group.ledger_shards = count
+    await db.flush()
+    _shard_counts.set(group_id, count)
+    return await rebalance_shards(db, group_id)
+
+
+def _entries_by_key(keys: Sequence[str]):
+    """Ledger entries claimed by idempotency keys, fetched partition by partition."""
+    return (
+        select(LedgerEntry)
+        .join(
+            LedgerIdempotencyKey,
+            and_(
+                LedgerEntry.id == LedgerIdempotencyKey.ledger_entry_id,
+                LedgerEntry.created_at == LedgerIdempotencyKey.entry_created_at,
+            ),
+        )
+        .where(LedgerIdempotencyKey.idempotency_key.in_(keys))
+    )
+
+
+def _new_entry(
+    group_id: uuid.UUID,
+    amount: int,
+    type: TransactionType,
+    idempotency_key: str | None,
+    metadata: dict[str, Any] | None,
+    shard: int,
+) -> list[Base]:
+    """A ledger entry, plus the row claiming its idempotency key if it has one."""
     entry = LedgerEntry(
+        id=uuid.uuid4(),
+        created_at=_now(),
         group_id=group_id,
         amount=amount,
         type=type,
         idempotency_key=idempotency_key,
         metadata_=metadata,
+        shard=shard,
+    )
+    if idempotency_key is None:
+        return [entry]
+    return [
+        entry,
+        LedgerIdempotencyKey(
+            idempotency_key=idempotency_key,
+            ledger_entry_id=entry.id,
+            entry_created_at=entry.created_at,
+        ),
+    ]
+
+
+async def _insert_or_get_pg(db: AsyncSession, entry: LedgerEntry) -> LedgerEntry | None:
+    """
+    Claim entry.idempotency_key and insert the entry in one statement, or
+    return the entry already holding the key:
+
+        WITH claim AS (INSERT INTO ledger_idempotency_keys ...
+                       ON CONFLICT (idempotency_key) DO NOTHING RETURNING ...),
+             inserted AS (INSERT INTO ledger SELECT ... FROM claim RETURNING *)
+        SELECT * FROM inserted
+        UNION ALL
+        SELECT ledger.* FROM ledger JOIN ledger_idempotency_keys ...
+        WHERE NOT EXISTS (SELECT 1 FROM claim)
+
+    Returns None when the key was claimed by a transaction that committed
+    after this statement's snapshot was taken (ON CONFLICT waited for it).
+    """
+    table = LedgerEntry.__table__
+    claim = (
+        pg_insert(LedgerIdempotencyKey)
+        .values(
+            idempotency_key=entry.idempotency_key,
+            ledger_entry_id=entry.id,
+            entry_created_at=entry.created_at,
+        )
+        .on_conflict_do_nothing(index_elements=[LedgerIdempotencyKey.idempotency_key])
+        .returning(LedgerIdempotencyKey.ledger_entry_id)
+        .cte("claim")
+    )
+    values = {
+        "id": entry.id,
+        "created_at": entry.created_at,
+        "group_id": entry.group_id,
+        "amount": entry.amount,
+        "type": entry.type,
+        "idempotency_key": entry.idempotency_key,
+        "metadata": entry.metadata_,
+        "shard": entry.shard,
+    }
+    inserted = (
+        insert(table)
+        .from_select(
+            list(values),
+            # Cast so enum and JSON parameters are not resolved as text
+            select(
+                *(cast(literal(v, table.c[k].type), table.c[k].type) for k, v in values.items())
+            ).select_from(claim),
+        )
+        .returning(*table.c)
+        .cte("inserted")
+    )
+    existing = (
+        select(*table.c)
+        .join(
+            LedgerIdempotencyKey,
+            and_(
+                table.c.id == LedgerIdempotencyKey.ledger_entry_id,
+                table.c.created_at == LedgerIdempotencyKey.entry_created_at,
+            ),
+        )
+        .where(
+            LedgerIdempotencyKey.idempotency_key == entry.idempotency_key,
+            ~select(claim.c.ledger_entry_id).exists(),
+        )
     )
-    db.add(entry)
+    rows = union_all(select(*inserted.c), existing).subquery("entry")
+    result = await db.execute(select(aliased(LedgerEntry, rows)))
+    return result.scalar_one_or_none()
+
+
+async def _insert_or_get(db: AsyncSession, entry: LedgerEntry) -> LedgerEntry:
+    """Insert `entry` unless its idempotency key is taken; return the stored entry."""
+    if db.get_bind().dialect.name == "postgresql":
+        stored = await _insert_or_get_pg(db, entry)
+        if stored is not None:
+            return stored
+    else:
+        # No data-modifying CTEs: claim the key, then insert the entry
+        claimed = await db.execute(
+            sqlite_insert(LedgerIdempotencyKey)
+            .values(
+                idempotency_key=entry.idempotency_key,
+                ledger_entry_id=entry.id,
+                entry_created_at=entry.created_at,
+            )
+            .on_conflict_do_nothing(index_elements=["idempotency_key"])
+            .returning(LedgerIdempotencyKey.ledger_entry_id)
+        )
+        if claimed.first() is not None:
+            db.add(entry)
+            await db.flush()
+            return entry
+    result = await db.execute(_entries_by_key([entry.idempotency_key]))
+    return result.scalar_one()
+
+
+async def append_entry(
+    db: AsyncSession,
+    group_id: uuid.UUID,
+    amount: int,
+    type: TransactionType,
+    idempotency_key: str | None = None,
+    metadata: dict[str, Any] | None = None,
+    shard: int = 0,
+) -> LedgerEntry:
+    """
+    Append a ledger entry. If idempotency_key is provided and already exists,
+    returns the existing entry (no-op). Keyed appends are a single
+    INSERT ... ON CONFLICT DO NOTHING statement on PostgreSQL, so concurrent
+    replays cannot both insert.
+    """
+    rows = _new_entry(group_id, amount, type, idempotency_key, metadata, shard)
+    if idempotency_key is not None:
+        return await _insert_or_get(db, rows[0])
+    db.add_all(rows)
     await db.flush()
-    return entry
+    return rows[0]
+
+
+async def _find_replay(db: AsyncSession, idempotency_key: str) -> LedgerEntry | None:
+    result = await db.execute(_entries_by_key([idempotency_key]))
+    return result.scalar_one_or_none()
 
 
 async def deduct_credits(
@@ -88,22 +673,22 @@ async def deduct_credits(
     - Appends negative ledger entry
     - Idempotent via idempotency_key
 
+    Replays are detected by the insert itself; only a replay that no longer
+    fits the balance needs the extra lookup.
+
     Must be called within a transaction (the caller should commit).
     """
     if amount <= 0:
         raise ValueError("Deduction amount must be positive")
 
-    # Check for idempotent replay
-    result = await db.execute(
-        select(LedgerEntry).where(LedgerEntry.idempotency_key == idempotency_key)
-    )
-    existing = result.scalar_one_or_none()
-    if existing is not None:
-        return existing
-
-    balance = await get_group_balance_for_update(db, group_id)
-    if balance < amount:
-        raise InsufficientCreditsError(balance=balance, required=amount)
+    # Credits reserved by other requests' holds are not spendable here
+    try:
+        shard = await _reserve_shard(db, group_id, amount)
+    except InsufficientCreditsError:
+        existing = await _find_replay(db, idempotency_key)
+        if existing is not None:
+            return existing
+        raise
 
     return await append_entry(
         db,
@@ -112,4 +697,638 @@ async def deduct_credits(
         type=TransactionType.USAGE_DEDUCTION,
         idempotency_key=idempotency_key,
         metadata=metadata,
+        shard=shard,
+    )
+
+
+# Runs in the settlement's transaction with the new entry (None if nothing was charged)
+SettledHook = Callable[[AsyncSession, LedgerEntry | None], Awaitable[None]]
+
+
+@dataclass
+class _PendingDeduction:
+    amount: int
+    idempotency_key: str
+    metadata: dict[str, Any] | None
+    attach: Sequence[Base]
+    future: asyncio.Future[LedgerEntry | None]
+    # Set when settling a credit hold rather than deducting directly
+    hold_id: uuid.UUID | None = None
+    on_settled: SettledHook | None = None
+
+
+class DeductionBatcher:
+    """
+    Group commit for deductions: concurrent deduct() and settle_hold() calls
+    for the same group arriving within `window_seconds` settle in one
+    transaction — one lock, one balance read, one multi-row insert — instead
+    of one each.
+
+    Every caller still gets its own result (a LedgerEntry, or the error
+    deduct_credits / settle_hold would have raised); requests are admitted in
+    arrival order against the balance left by the ones before them. Objects
+    passed as `attach` (e.g. the matching usage event) are inserted in the
+    same transaction as their deduction; a settlement's `on_settled` hook
+    runs in it.
+
+    The batch runs in its own session, so use this only where the deduction
+    does not have to share the caller's transaction.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float | None = None,
+        max_batch: int | None = None,
+        session_factory: async_sessionmaker[AsyncSession] | None = None,
+    ) -> None:
+        self.window_seconds = (
+            settings.ledger_batch_window_ms / 1000 if window_seconds is None else window_seconds
+        )
+        self.max_batch = settings.ledger_batch_max_size if max_batch is None else max_batch
+        # None = app.db.session.async_session_factory, resolved per batch
+        self.session_factory = session_factory
+        self._pending: dict[uuid.UUID, list[_PendingDeduction]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        # Window timers only sleep; drain() may cancel them
+        self._timers: set[asyncio.Task] = set()
+
+    async def deduct(
+        self,
+        group_id: uuid.UUID,
+        amount: int,
+        idempotency_key: str,
+        metadata: dict[str, Any] | None = None,
+        attach: Sequence[Base] = (),
+    ) -> LedgerEntry:
+        if amount <= 0:
+            raise ValueError("Deduction amount must be positive")
+        pending = _PendingDeduction(
+            amount, idempotency_key, metadata, attach,
+            asyncio.get_running_loop().create_future(),
+        )
+        return await self._submit(group_id, pending)
+
+    async def settle_hold(
+        self,
+        group_id: uuid.UUID,
+        hold_id: uuid.UUID,
+        amount: int,
+        idempotency_key: str,
+        metadata: dict[str, Any] | None = None,
+        on_settled: SettledHook | None = None,
+    ) -> LedgerEntry | None:
+        """
+        settle_hold() for a hold of `group_id`, batched. `on_settled` runs
+        once, in the transaction that settles the hold (not on a replay).
+        """
+        if amount < 0:
+            raise ValueError("Settlement amount must not be negative")
+        pending = _PendingDeduction(
+            amount, idempotency_key, metadata, (),
+            asyncio.get_running_loop().create_future(),
+            hold_id=hold_id,
+            on_settled=on_settled,
+        )
+        return await self._submit(group_id, pending)
+
+    async def _submit(
+        self, group_id: uuid.UUID, pending: _PendingDeduction
+    ) -> LedgerEntry | None:
+        batch = self._pending.setdefault(group_id, [])
+        batch.append(pending)
+        if len(batch) == 1:
+            timer = self._spawn(self._flush_after_window(group_id))
+            self._timers.add(timer)
+            timer.add_done_callback(self._timers.discard)
+        elif len(batch) >= self.max_batch:
+            self._spawn(self._flush(group_id, self._pending.pop(group_id)))
+        # A cancelled caller does not cancel the batch; its deduction may still land.
+        return await asyncio.shield(pending.future)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_after_window(self, group_id: uuid.UUID) -> None:
+        await asyncio.sleep(self.window_seconds)
+        batch = self._pending.pop(group_id, None)
+        if batch:
+            # Its own task, so cancelling the timer never interrupts a flush
+            self._spawn(self._flush(group_id, batch))
+
+    async def _flush(self, group_id: uuid.UUID, batch: list[_PendingDeduction]) -> None:
+        try:
+            try:
+                results = await self._settle_batch(group_id, batch)
+            except IntegrityError:
+                # A key was inserted concurrently outside the batch (or an
+                # attached row is invalid): settle one by one to isolate it.
+                results = [await self._settle_one(group_id, p) for p in batch]
+        except Exception as exc:
+            results = [exc] * len(batch)
+        for pending, result in zip(batch, results):
+            if pending.future.done():
+                continue
+            if isinstance(result, BaseException):
+                pending.future.set_exception(result)
+            else:
+                pending.future.set_result(result)
+
+    def _sessions(self) -> async_sessionmaker[AsyncSession]:
+        return self.session_factory or db_session.async_session_factory
+
+    async def _settle_batch(
+        self, group_id: uuid.UUID, batch: list[_PendingDeduction]
+    ) -> list[LedgerEntry | None | Exception]:
+        async with self._sessions()() as db:
+            async with db.begin():
+                result = await db.execute(
+                    _entries_by_key({p.idempotency_key for p in batch})
+                )
+                entries = {e.idempotency_key: e for e in result.scalars()}
+                hold_ids = [p.hold_id for p in batch if p.hold_id is not None]
+                holds: dict[uuid.UUID, tuple[CreditHold, bool]] = {}
+                if hold_ids:
+                    # With whether each still counts against the balance
+                    result = await db.execute(
+                        select(CreditHold, CreditHold.expires_at > _now())
+                        .where(CreditHold.id.in_(hold_ids))
+                        .with_for_update()
+                    )
+                    holds = {hold.id: (hold, bool(live)) for hold, live in result.all()}
+
+                count = await get_shard_count(db, group_id)
+                await _lock_shards(db, group_id, range(count))
+                balances = await _locked_balances(
+                    db, group_id, count, [None] if count == 1 else range(count)
+                )
+                if balances is None:
+                    # Count changed since it was cached: lock the real set
+                    count = await _lock_all_shards(db, group_id, count)
+                    balances = await get_shard_balances(db, group_id, range(count))
+                shards = list(range(count))
+
+                results: list[LedgerEntry | None | Exception] = []
+                new_rows: list[Base] = []
+                settled: list[tuple[_PendingDeduction, LedgerEntry | None]] = []
+                for p in batch:
+                    if p.hold_id is not None:
+                        try:
+                            entry, new = await self._settle_held(
+                                db, group_id, count, balances, holds, entries, new_rows, p
+                            )
+                        except AppError as exc:
+                            results.append(exc)
+                            continue
+                        if new:
+                            settled.append((p, entry))
+                        results.append(entry)
+                        continue
+                    entry = entries.get(p.idempotency_key)
+                    if entry is not None:
+                        results.append(entry)  # replay, possibly within this batch
+                        continue
+                    shard = max(shards, key=balances.__getitem__)
+                    if balances[shard] < p.amount and sum(b for b in balances if b > 0) >= p.amount:
+                        # Sharded and fragmented: all shards are locked already.
+                        db.add_all(new_rows)
+                        new_rows = []
+                        shard = await _consolidate(db, group_id, count, p.amount)
+                        balances = await get_shard_balances(db, group_id, shards)
+                    if balances[shard] < p.amount:
+                        results.append(
+                            InsufficientCreditsError(balance=balances[shard], required=p.amount)
+                        )
+                        continue
+                    balances[shard] -= p.amount
+                    rows = _new_entry(
+                        group_id, -p.amount, TransactionType.USAGE_DEDUCTION,
+                        p.idempotency_key, p.metadata, shard,
+                    )
+                    entry = rows[0]
+                    entries[p.idempotency_key] = entry
+                    new_rows.extend(rows)
+                    new_rows.extend(p.attach)
+                    results.append(entry)
+
+                # Rows of one class go out as a single multi-row INSERT
+                db.add_all(new_rows)
+                await db.flush()
+                for p, entry in settled:
+                    if p.on_settled is not None:
+                        await p.on_settled(db, entry)
+        return results
+
+    async def _settle_held(
+        self,
+        db: AsyncSession,
+        group_id: uuid.UUID,
+        count: int,
+        balances: list[int],
+        holds: dict[uuid.UUID, tuple[CreditHold, bool]],
+        entries: dict[str, LedgerEntry],
+        new_rows: list[Base],
+        p: _PendingDeduction,
+    ) -> tuple[LedgerEntry | None, bool]:
+        """
+        settle_hold() against the batch's in-memory balances, which every
+        shard lock already guards. Returns (entry, whether newly settled);
+        `balances` and `new_rows` are updated in place.
+        """
+        found = holds.get(p.hold_id)
+        if found is None or found[0].group_id != group_id:
+            raise NotFoundError("CreditHold", str(p.hold_id))
+        hold, live = found
+        if hold.status == HoldStatus.SETTLED:
+            return entries.get(p.idempotency_key), False
+        if hold.status == HoldStatus.RELEASED:
+            raise AppError(f"Credit hold {hold.id} was already released", status_code=409)
+
+        shards = [None] if count == 1 else list(range(count))
+        if count > 1 and hold.shard >= count:
+            # Left over from a larger shard count: take the unbatched path
+            db.add_all(new_rows)
+            new_rows.clear()
+            entry = await settle_hold(db, hold.id, p.amount, p.idempotency_key, p.metadata)
+            balances[:] = await get_shard_balances(db, group_id, shards)
+            return entry, True
+
+        home = 0 if count == 1 else hold.shard
+        if live:
+            balances[home] += hold.amount  # this settlement frees its own reservation
+        charged = max(0, min(p.amount, sum(balances)))
+        entry = None
+        if charged > 0:
+            shard = home
+            if balances[shard] < charged:
+                shard = max(range(count), key=balances.__getitem__)
+            if balances[shard] < charged:
+                # Sharded and fragmented: all shards are locked already.
+                db.add_all(new_rows)
+                new_rows.clear()
+                shard = await _consolidate(db, group_id, count, charged, hold.id)
+                balances[:] = await get_shard_balances(db, group_id, shards, hold.id)
+            balances[shard] -= charged
+            metadata = {**(p.metadata or {}), "hold_id": str(hold.id), "held": hold.amount}
+            if charged < p.amount:
+                metadata["shortfall"] = p.amount - charged
+            rows = _new_entry(
+                group_id, -charged, TransactionType.USAGE_DEDUCTION,
+                p.idempotency_key, metadata, shard,
+            )
+            entry = rows[0]
+            entries[p.idempotency_key] = entry
+            new_rows.extend(rows)
+
+        hold.status = HoldStatus.SETTLED
+        hold.resolved_at = _now()
+        hold.ledger_entry_id = entry.id if entry is not None else None
+        return entry, True
+
+    async def _settle_one(
+        self, group_id: uuid.UUID, pending: _PendingDeduction
+    ) -> LedgerEntry | None | Exception:
+        try:
+            async with self._sessions()() as db:
+                async with db.begin():
+                    if pending.hold_id is not None:
+                        hold = await _get_hold(db, pending.hold_id)
+                        new = hold.status != HoldStatus.SETTLED
+                        entry = await settle_hold(
+                            db,
+                            hold_id=pending.hold_id,
+                            amount=pending.amount,
+                            idempotency_key=pending.idempotency_key,
+                            metadata=pending.metadata,
+                        )
+                        if new and pending.on_settled is not None:
+                            await pending.on_settled(db, entry)
+                        return entry
+                    entry = await deduct_credits(
+                        db,
+                        group_id=group_id,
+                        amount=pending.amount,
+                        idempotency_key=pending.idempotency_key,
+                        metadata=pending.metadata,
+                    )
+                    db.add_all(pending.attach)
+            return entry
+        except Exception as exc:
+            return exc
+
+    async def drain(self) -> None:
+        """Flush everything pending now (shutdown, tests)."""
+        while self._pending:
+            group_id, batch = self._pending.popitem()
+            await self._flush(group_id, batch)
+        for timer in self._timers:
+            timer.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+deduction_batcher = DeductionBatcher()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def place_hold(
+    db: AsyncSession,
+    group_id: uuid.UUID,
+    amount: int,
+    reference: str,
+    ttl_seconds: float | None = None,
+) -> CreditHold:
+    """
+    Reserve credits before doing paid work.
+    - Acquires advisory lock, so concurrent holds cannot over-commit
+    - Checks available balance (ledger minus active holds) >= amount
+    - Idempotent via reference
+
+    Must be called within a transaction (the caller should commit).
+    """
+    if amount <= 0:
+        raise ValueError("Hold amount must be positive")
+
+    result = await db.execute(select(CreditHold).where(CreditHold.reference == reference))
+    existing = result.scalar_one_or_none()
+    if existing is not None:
+        return existing
+
+    shard = await _reserve_shard(db, group_id, amount)
+
+    ttl = settings.credit_hold_ttl_seconds if ttl_seconds is None else ttl_seconds
+    hold = CreditHold(
+        group_id=group_id,
+        amount=amount,
+        status=HoldStatus.ACTIVE,
+        reference=reference,
+        expires_at=_now() + timedelta(seconds=ttl),
+        shard=shard,
+    )
+    db.add(hold)
+    await db.flush()
+    return hold
+
+
+async def _get_hold(db: AsyncSession, hold_id: uuid.UUID) -> CreditHold:
+    result = await db.execute(
+        select(CreditHold).where(CreditHold.id == hold_id).with_for_update()
+    )
+    hold = result.scalar_one_or_none()
+    if hold is None:
+        raise NotFoundError("CreditHold", str(hold_id))
+    return hold
+
+
+async def settle_hold(
+    db: AsyncSession,
+    hold_id: uuid.UUID,
+    amount: int,
+    idempotency_key: str,
+    metadata: dict[str, Any] | None = None,
+) -> LedgerEntry | None:
+    """
+    Convert a hold into the actual deduction and close it.
+
+    The actual amount may differ from the reservation: the difference comes
+    out of (or goes back to) the available balance. Settlement pays for work
+    already delivered, so it never fails for lack of credits: if the hold
+    plus the available balance cannot cover `amount`, that much is charged
+    and the rest is recorded as metadata["shortfall"] on the entry.
+    Returns None when nothing is charged (the hold is simply released).
+    Idempotent: settling a settled hold returns its ledger entry.
+    """
+    if amount < 0:
+        raise ValueError("Settlement amount must not be negative")
+
+    hold = await _get_hold(db, hold_id)
+    if hold.status == HoldStatus.SETTLED:
+        if hold.ledger_entry_id is None:
+            return None
+        return await db.get(LedgerEntry, hold.ledger_entry_id)
+    if hold.status == HoldStatus.RELEASED:
+        raise AppError(f"Credit hold {hold_id} was already released", status_code=409)
+
+    entry = None
+    charged, shard = amount, hold.shard
+    if amount > hold.amount:
+        charged, shard = await _reserve_overrun(db, hold, amount)
+    elif amount > 0:
+        # This hold's own reservation is spendable by its settlement and
+        # covers the amount on the hold's shard (unless the hold expired).
+        try:
+            shard = await _reserve_shard(
+                db, hold.group_id, amount, exclude_hold_id=hold.id, prefer=hold.shard
+            )
+        except InsufficientCreditsError:
+            # Only an expired hold gets here; its credits may have been spent
+            charged, shard = await _reserve_overrun(db, hold, amount)
+    if charged > 0:
+        metadata = {**(metadata or {}), "hold_id": str(hold.id), "held": hold.amount}
+        if charged < amount:
+            metadata["shortfall"] = amount - charged
+        entry = await append_entry(
+            db,
+            group_id=hold.group_id,
+            amount=-charged,
+            type=TransactionType.USAGE_DEDUCTION,
+            idempotency_key=idempotency_key,
+            metadata=metadata,
+            shard=shard,
+        )
+
+    hold.status = HoldStatus.SETTLED
+    hold.resolved_at = _now()
+    hold.ledger_entry_id = entry.id if entry is not None else None
+    await db.flush()
+    return entry
+
+
+async def _reserve_overrun(
+    db: AsyncSession, hold: CreditHold, amount: int
+) -> tuple[int, int]:
+    """
+    Lock every shard and reserve up to `amount` for settling `hold`, capped
+    at the hold plus the group's available balance. Returns (charged, shard).
+
+    Overruns take the whole-group locks up front (in ascending order) rather
+    than growing out of the hold's shard, so they cannot deadlock with other
+    whole-group lockers.
+    """
+    count = await _lock_all_shards(db, hold.group_id)
+    available = await get_available_balance(db, hold.group_id, exclude_hold_id=hold.id)
+    charged = max(0, min(amount, available))
+    if charged == 0:
+        return 0, hold.shard
+    if count == 1:
+        return charged, 0
+    return charged, await _consolidate(db, hold.group_id, count, charged, hold.id)
+
+
+async def release_hold(db: AsyncSession, hold_id: uuid.UUID) -> CreditHold:
+    """Give the reserved credits back without charging. No-op unless ACTIVE."""
+    hold = await _get_hold(db, hold_id)
+    if hold.status == HoldStatus.ACTIVE:
+        hold.status = HoldStatus.RELEASED
+        hold.resolved_at = _now()
+        await db.flush()
+    return hold
+
+
+async def expire_holds(db: AsyncSession) -> int:
+    """
+    Mark abandoned holds EXPIRED. Returns the number expired.
+
+    Expired holds already stop counting against the balance once expires_at
+    passes; this sweep only keeps the active set (and its index) small.
+    """
+    result = await db.execute(
+        update(CreditHold)
+        .where(CreditHold.status == HoldStatus.ACTIVE, CreditHold.expires_at <= _now())
+        .values(status=HoldStatus.EXPIRED, resolved_at=_now())
+    )
+    return result.rowcount
+
+
+# ── Checkpoints ─────────────────────────────────────────────────────────────
+
+
+async def create_checkpoint(
+    db: AsyncSession,
+    group_id: uuid.UUID,
+    min_entries: int | None = None,
+    shard: int | None = None,
+) -> LedgerCheckpoint | None:
+    """
+    Append a checkpoint covering entries up to now - lag, if the uncovered
+    tail is at least min_entries long. Returns None when skipped.
+    With a shard, the checkpoint covers only that shard's entries.
+
+    Entries are only covered once they are older than the lag, so a
+    transaction that stamped created_at but has not committed yet cannot be
+    skipped by the tail scan.
+    """
+    min_entries = settings.ledger_checkpoint_min_entries if min_entries is None else min_entries
+    as_of = _now() - timedelta(seconds=settings.ledger_checkpoint_lag_seconds)
+
+    result = await db.execute(
+        select(LedgerCheckpoint)
+        .where(LedgerCheckpoint.group_id == group_id, _checkpoint_shard_filter(shard))
+        .order_by(LedgerCheckpoint.as_of.desc())
+        .limit(1)
+    )
+    latest = result.scalar_one_or_none()
+
+    conditions = [LedgerEntry.group_id == group_id, LedgerEntry.created_at <= as_of]
+    if shard is not None:
+        conditions.append(LedgerEntry.shard == shard)
+    if latest is not None:
+        conditions.append(LedgerEntry.created_at > latest.as_of)
+    result = await db.execute(
+        select(
+            func.count(LedgerEntry.id), func.coalesce(func.sum(LedgerEntry.amount), 0)
+        ).where(*conditions)
+    )
+    count, amount = result.one()
+    if count == 0 or count < min_entries:
+        return None
+
+    checkpoint = LedgerCheckpoint(
+        group_id=group_id,
+        as_of=as_of,
+        balance=(latest.balance if latest else 0) + int(amount),
+        entry_count=(latest.entry_count if latest else 0) + int(count),
+        shard=shard,
+    )
+    db.add(checkpoint)
+    await db.flush()
+    return checkpoint
+
+
+@dataclass(frozen=True)
+class CheckpointMismatch:
+    checkpoint_id: uuid.UUID
+    as_of: datetime
+    stored_balance: int
+    actual_balance: int
+    stored_entry_count: int
+    actual_entry_count: int
+
+
+@dataclass(frozen=True)
+class BalanceVerification:
+    group_id: uuid.UUID
+    balance: int
+    recomputed_balance: int
+    checkpoints_checked: int
+    mismatches: list[CheckpointMismatch]
+
+    @property
+    def consistent(self) -> bool:
+        return self.balance == self.recomputed_balance and not self.mismatches
+
+
+async def verify_checkpoints(
+    db: AsyncSession, group_id: uuid.UUID
+) -> tuple[int, list[CheckpointMismatch]]:
+    """Recompute every checkpoint of a group from the raw ledger."""
+    result = await db.execute(
+        select(
+            LedgerCheckpoint.id,
+            LedgerCheckpoint.as_of,
+            LedgerCheckpoint.balance,
+            LedgerCheckpoint.entry_count,
+            func.coalesce(func.sum(LedgerEntry.amount), 0),
+            func.count(LedgerEntry.id),
+        )
+        .outerjoin(
+            LedgerEntry,
+            and_(
+                LedgerEntry.group_id == LedgerCheckpoint.group_id,
+                LedgerEntry.created_at <= LedgerCheckpoint.as_of,
+                or_(
+                    LedgerCheckpoint.shard.is_(None),
+                    LedgerEntry.shard == LedgerCheckpoint.shard,
+                ),
+            ),
+        )
+        .where(LedgerCheckpoint.group_id == group_id)
+        .group_by(
+            LedgerCheckpoint.id,
+            LedgerCheckpoint.as_of,
+            LedgerCheckpoint.balance,
+            LedgerCheckpoint.entry_count,
+        )
+        .order_by(LedgerCheckpoint.as_of)
+    )
+    rows = result.all()
+    mismatches = [
+        CheckpointMismatch(
+            checkpoint_id=cp_id,
+            as_of=as_of,
+            stored_balance=balance,
+            actual_balance=int(actual_balance),
+            stored_entry_count=entry_count,
+            actual_entry_count=int(actual_count),
+        )
+        for cp_id, as_of, balance, entry_count, actual_balance, actual_count in rows
+        if balance != actual_balance or entry_count != actual_count
+    ]
+    return len(rows), mismatches
+
+
+async def verify_balance(db: AsyncSession, group_id: uuid.UUID) -> BalanceVerification:
+    """Compare the checkpointed balance with a from-scratch SUM."""
+    checked, mismatches = await verify_checkpoints(db, group_id)
+    return BalanceVerification(
+        group_id=group_id,
+        balance=await get_group_balance(db, group_id),
+        recomputed_balance=await recompute_group_balance(db, group_id),
+        checkpoints_checked=checked,
+        mismatches=mismatches,
     )
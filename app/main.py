@@ -10,23 +10,36 @@ from app.agents.router import key_router, router as agents_router
 from app.auth.router import router as auth_router
 from app.budgets.router import router as budgets_router
 from app.core.exceptions import AppError
+from app.core.rate_limit import close_rate_limiter
 from app.credentials.router import router as credentials_router
-from app.db.session import engine
+from app.db.session import async_session_factory, engine
+from app.db.write_behind import write_behind
+from app.exports.router import router as exports_router
 from app.gateway.router import router as gateway_router
 from app.groups.router import router as groups_router
+from app.ledger.service import deduction_batcher
 from app.ledger.router import router as ledger_router
 from app.orgs.router import router as orgs_router
 from app.policies.router import router as policies_router
+from app.pricing.registry import pricing_registry
 from app.pricing.router import router as pricing_router
 from app.providers.registry import close_all as close_providers
+from app.usage.heavy_hitters import heavy_hitters
 from app.usage.router import router as usage_router
 from app.workspaces.router import router as workspaces_router
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    async with async_session_factory() as db:
+        await pricing_registry.load(db)
     yield
+    # Settlements hand their usage rows to write-behind once they commit
+    await deduction_batcher.drain()
+    await write_behind.close()
+    await heavy_hitters.close()
     await close_providers()
+    await close_rate_limiter()
     await engine.dispose()
 
 
@@ -51,6 +64,7 @@ async def app_error_handler(request: Request, exc: AppError) -> JSONResponse:
     return JSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.message},
+        headers=exc.headers,
     )
 
 
@@ -72,6 +86,7 @@ app.include_router(key_router)
 app.include_router(credentials_router)
 app.include_router(policies_router)
 app.include_router(budgets_router)
+app.include_router(exports_router)
 
 # ── AI Proxy Gateway ──────────────────────────────────────────────────────────
 app.include_router(gateway_router)
@@ -1,3 +1,5 @@
+import uuid
+
 from fastapi import APIRouter
 
 from app.core.dependencies import CurrentUser, DbSession
@@ -5,6 +7,8 @@ from app.core.tenancy import require_owned_org
 from app.ledger import service as ledger_service
 from app.orgs import service as org_service
 from app.orgs.schemas import OrgCreate, OrgResponse
+from app.usage import forecast as forecast_service
+from app.usage.schemas import OrgForecastResponse
 
 router = APIRouter(prefix="/orgs", tags=["organizations"])
 
@@ -28,4 +32,17 @@ async def get_org_balance(org_id: str, user: CurrentUser, db: DbSession):
     import uuid
     org = await require_owned_org(db, org_id=uuid.UUID(org_id), user_id=user.id)
     balance = await ledger_service.get_group_balance(db, org.billing_group_id)
-    return {"org_id": str(org.id), "balance": balance}
+    held = await ledger_service.get_held_credits(db, org.billing_group_id)
+    return {
+        "org_id": str(org.id),
+        "balance": balance,
+        "held": held,
+        "available": balance - held,
+    }
+
+
+@router.get("/{org_id}/forecast", response_model=OrgForecastResponse)
+async def get_org_forecast(org_id: uuid.UUID, user: CurrentUser, db: DbSession):
+    """Projected exhaustion of the balance and of every active budget in the org."""
+    org = await require_owned_org(db, org_id=org_id, user_id=user.id)
+    return await forecast_service.get_org_forecast(db, org)
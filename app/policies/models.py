@@ -56,5 +56,8 @@ class Policy(UUIDMixin, TimestampMixin, Base):
 
     # Rate limiting (requests per minute)
     rpm_limit: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    # Load shaping: prompt + completion tokens per minute, in-flight requests
+    tpm_limit: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    max_concurrent_requests: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
     is_active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
@@ -1,9 +1,10 @@
 import uuid
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 
 from app.core.dependencies import CurrentUser, DbSession
 from app.core.exceptions import AppError
+from app.core.pagination import page_items
 from app.core.tenancy import (
     require_owned_agent,
     require_owned_agent_group,
@@ -43,9 +44,17 @@ async def create_policy(body: PolicyCreate, user: CurrentUser, db: DbSession):
             max_input_tokens=body.max_input_tokens,
             max_output_tokens=body.max_output_tokens,
             rpm_limit=body.rpm_limit,
+            tpm_limit=body.tpm_limit,
+            max_concurrent_requests=body.max_concurrent_requests,
         )
         db.add(policy)
         await db.flush()
+    policy_service.invalidate_effective_policies(
+        org_id=policy.org_id,
+        workspace_id=policy.workspace_id,
+        agent_group_id=policy.agent_group_id,
+        agent_id=policy.agent_id,
+    )
     return policy
 
 
@@ -53,10 +62,13 @@ async def create_policy(body: PolicyCreate, user: CurrentUser, db: DbSession):
 async def list_policies(
     user: CurrentUser,
     db: DbSession,
+    response: Response,
     org_id: uuid.UUID | None = None,
     workspace_id: uuid.UUID | None = None,
     agent_group_id: uuid.UUID | None = None,
     agent_id: uuid.UUID | None = None,
+    limit: int | None = None,
+    cursor: str | None = None,
 ):
     target_count = sum(
         1
@@ -81,11 +93,13 @@ async def list_policies(
     elif agent_id is not None:
         await require_owned_agent(db, agent_id=agent_id, user_id=user.id)
 
-    policies = await policy_service.list_policies_for_target(
+    page = await policy_service.list_policies_for_target(
         db,
         org_id=org_id,
         workspace_id=workspace_id,
         agent_group_id=agent_group_id,
         agent_id=agent_id,
+        limit=limit,
+        cursor=cursor,
     )
-    return [PolicyResponse.model_validate(p) for p in policies]
+    return [PolicyResponse.model_validate(p) for p in page_items(page, response)]
@@ -16,6 +16,8 @@ class PolicyCreate(BaseModel):
     max_input_tokens: int | None = None
     max_output_tokens: int | None = None
     rpm_limit: int | None = None
+    tpm_limit: int | None = None
+    max_concurrent_requests: int | None = None
 
     @model_validator(mode="after")
     def validate_single_target(self) -> "PolicyCreate":
@@ -49,5 +51,7 @@ class PolicyResponse(BaseModel):
     max_input_tokens: int | None
     max_output_tokens: int | None
     rpm_limit: int | None
+    tpm_limit: int | None
+    max_concurrent_requests: int | None
     is_active: bool
     created_at: datetime
@@ -2,36 +2,93 @@
 
 Cascade order: Agent → AgentGroup → Workspace → Org.
 Most restrictive value wins for each field.
+
+Merged policies are cached per agent (bounded, TTL as a cross-process
+safety net) and dropped whenever a policy at any ancestor level changes,
+so evaluating a request is a dict lookup plus a set membership test.
 """
 import uuid
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Any
 
-from sqlalchemy import select
+from sqlalchemy import ColumnElement, and_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.exceptions import AppError
+from app.config import settings
+from app.core.cache import MISSING, TTLCache
+from app.core.exceptions import AppError, RateLimitExceededError
+from app.core.pagination import Page, paginate
+from app.core.rate_limit import get_rate_limiter
 from app.policies.models import Policy
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
+class LoadLimit:
+    """
+    tpm_limit / max_concurrent_requests set at one level of the hierarchy.
+    The window (and the slots) are shared by every agent under that level.
+    """
+    level: str  # "org" | "workspace" | "agent_group" | "agent"
+    target_id: uuid.UUID | None  # None = the requesting agent
+    tpm_limit: int | None = None
+    max_concurrent_requests: int | None = None
+
+    def key(self, kind: str, agent_id: uuid.UUID) -> str:
+        return f"{kind}:{self.level}:{self.target_id or agent_id}"
+
+
+@dataclass(frozen=True, slots=True)
 class EffectivePolicy:
     """The merged, most-restrictive policy for a request."""
-    allowed_models: list[str] | None  # None = all allowed
+    allowed_models: frozenset[str] | None  # None = all allowed
     max_input_tokens: int | None
     max_output_tokens: int | None
     rpm_limit: int | None
+    tpm_limit: int | None = None
+    max_concurrent_requests: int | None = None
+    # Per-level limits behind tpm_limit / max_concurrent_requests
+    load_limits: tuple[LoadLimit, ...] = ()
+
+    def effective_load_limits(self) -> tuple[LoadLimit, ...]:
+        if self.load_limits:
+            return self.load_limits
+        if self.tpm_limit is None and self.max_concurrent_requests is None:
+            return ()
+        # Built without levels: the merged values apply to the agent alone
+        return (LoadLimit("agent", None, self.tpm_limit, self.max_concurrent_requests),)
+
+
+def _policy_level(p: Policy) -> tuple[str, uuid.UUID | None]:
+    for level in ("org", "workspace", "agent_group", "agent"):
+        target_id = getattr(p, f"{level}_id")
+        if target_id is not None:
+            return level, target_id
+    return "agent", None
+
+
+# (org_id, workspace_id, agent_group_id, agent_id) an entry was compiled for.
+PolicyScope = tuple[uuid.UUID, uuid.UUID, uuid.UUID, uuid.UUID]
+
+_policy_cache: TTLCache[uuid.UUID, tuple[PolicyScope, EffectivePolicy]] = TTLCache(
+    maxsize=settings.policy_cache_size,
+    ttl_seconds=settings.policy_cache_ttl_seconds,
+)
 
 
 def _merge_policies(policies: list[Policy]) -> EffectivePolicy:
     """
     Merge multiple policies into one effective policy.
-    For lists (allowed_models): intersection (most restrictive = smallest set).
+    For sets (allowed_models): intersection (most restrictive = smallest set).
     For integers: minimum non-None value.
     """
-    merged_allowed: list[str] | None = None
+    merged_allowed: frozenset[str] | None = None
     merged_max_input: int | None = None
     merged_max_output: int | None = None
     merged_rpm: int | None = None
+    merged_tpm: int | None = None
+    merged_concurrency: int | None = None
+    # (level, target_id) -> [tpm_limit, max_concurrent_requests]
+    load_limits: dict[tuple[str, uuid.UUID | None], list[int | None]] = {}
 
     for p in policies:
         if not p.is_active:
@@ -40,9 +97,9 @@ def _merge_policies(policies: list[Policy]) -> EffectivePolicy:
         # Allowed models — take intersection
         if p.allowed_models is not None:
             if merged_allowed is None:
-                merged_allowed = list(p.allowed_models)
+                merged_allowed = frozenset(p.allowed_models)
             else:
-                merged_allowed = [m for m in merged_allowed if m in p.allowed_models]
+                merged_allowed = merged_allowed.intersection(p.allowed_models)
 
         # Max tokens — take minimum
         if p.max_input_tokens is not None:
@@ -64,11 +121,59 @@ def _merge_policies(policies: list[Policy]) -> EffectivePolicy:
             else:
                 merged_rpm = min(merged_rpm, p.rpm_limit)
 
+        # TPM and concurrency — take minimum
+        if p.tpm_limit is not None:
+            if merged_tpm is None:
+                merged_tpm = p.tpm_limit
+            else:
+                merged_tpm = min(merged_tpm, p.tpm_limit)
+
+        if p.max_concurrent_requests is not None:
+            if merged_concurrency is None:
+                merged_concurrency = p.max_concurrent_requests
+            else:
+                merged_concurrency = min(merged_concurrency, p.max_concurrent_requests)
+
+        # ...and keep each level's own, enforced against that level's window
+        if p.tpm_limit is not None or p.max_concurrent_requests is not None:
+            level = load_limits.setdefault(_policy_level(p), [None, None])
+            for i, value in enumerate((p.tpm_limit, p.max_concurrent_requests)):
+                if value is not None:
+                    level[i] = value if level[i] is None else min(level[i], value)
+
     return EffectivePolicy(
         allowed_models=merged_allowed,
         max_input_tokens=merged_max_input,
         max_output_tokens=merged_max_output,
         rpm_limit=merged_rpm,
+        tpm_limit=merged_tpm,
+        max_concurrent_requests=merged_concurrency,
+        load_limits=tuple(
+            LoadLimit(level, target_id, tpm, concurrency)
+            for (level, target_id), (tpm, concurrency) in load_limits.items()
+        ),
+    )
+
+
+def hierarchy_policy_filter(
+    org_id: Any,
+    workspace_id: Any,
+    agent_group_id: Any,
+    agent_id: Any,
+) -> ColumnElement[bool]:
+    """Active policies attached to any of the four levels.
+
+    Arguments may be plain ids or SQL column expressions, so the same filter
+    serves a standalone query and a join condition.
+    """
+    return and_(
+        Policy.is_active == True,  # noqa: E712
+        (
+            (Policy.org_id == org_id)
+            | (Policy.workspace_id == workspace_id)
+            | (Policy.agent_group_id == agent_group_id)
+            | (Policy.agent_id == agent_id)
+        ),
     )
 
 
@@ -79,20 +184,44 @@ async def get_effective_policy(
     agent_group_id: uuid.UUID,
     agent_id: uuid.UUID,
 ) -> EffectivePolicy:
-    """Fetch and merge all active policies across the hierarchy."""
+    """Return the merged policy for an agent, compiling it on a cache miss."""
+    scope = (org_id, workspace_id, agent_group_id, agent_id)
+    cached = _policy_cache.get(agent_id)
+    if cached is not MISSING and cached[0] == scope:
+        return cached[1]
+
     result = await db.execute(
         select(Policy).where(
-            Policy.is_active == True,  # noqa: E712
-            (
-                (Policy.org_id == org_id)
-                | (Policy.workspace_id == workspace_id)
-                | (Policy.agent_group_id == agent_group_id)
-                | (Policy.agent_id == agent_id)
-            ),
+            hierarchy_policy_filter(org_id, workspace_id, agent_group_id, agent_id)
         )
     )
-    policies = list(result.scalars().all())
-    return _merge_policies(policies)
+    policy = _merge_policies(list(result.scalars().all()))
+    _policy_cache.set(agent_id, (scope, policy))
+    return policy
+
+
+def cache_effective_policy(scope: PolicyScope, policy: EffectivePolicy) -> None:
+    """Store a policy merged elsewhere (e.g. by the gateway pre-flight join)."""
+    _policy_cache.set(scope[3], (scope, policy))
+
+
+def invalidate_effective_policies(
+    *,
+    org_id: uuid.UUID | None = None,
+    workspace_id: uuid.UUID | None = None,
+    agent_group_id: uuid.UUID | None = None,
+    agent_id: uuid.UUID | None = None,
+) -> None:
+    """Drop every compiled policy whose hierarchy includes the changed level."""
+    for position, level_id in enumerate((org_id, workspace_id, agent_group_id, agent_id)):
+        if level_id is not None:
+            _policy_cache.invalidate_where(
+                lambda _, entry, i=position, v=level_id: entry[0][i] == v
+            )
+
+
+def clear_effective_policies() -> None:
+    _policy_cache.clear()
 
 
 async def list_policies_for_target(
@@ -102,7 +231,9 @@ async def list_policies_for_target(
     workspace_id: uuid.UUID | None = None,
     agent_group_id: uuid.UUID | None = None,
     agent_id: uuid.UUID | None = None,
-) -> list[Policy]:
+    limit: int | None = None,
+    cursor: str | None = None,
+) -> Page[Policy]:
     q = select(Policy)
     if org_id is not None:
         q = q.where(Policy.org_id == org_id)
@@ -113,26 +244,37 @@ async def list_policies_for_target(
     elif agent_id is not None:
         q = q.where(Policy.agent_id == agent_id)
     else:
-        return []
+        return Page([])
 
-    q = q.order_by(Policy.created_at.desc())
-    result = await db.execute(q)
-    return list(result.scalars().all())
+    return await paginate(db, q, Policy, limit=limit, cursor=cursor)
 
 
 def enforce_policy(
     policy: EffectivePolicy,
     model: str,
     requested_max_tokens: int | None,
+    input_tokens: int | None = None,
 ) -> int | None:
     """
     Check model is allowed, enforce token limits.
+    `input_tokens` is the estimated prompt size, checked against max_input_tokens.
     Returns effective max_tokens to pass to provider.
     Raises AppError(403) on policy violation.
     """
     if policy.allowed_models is not None and model not in policy.allowed_models:
         raise AppError(
-            f"Model '{model}' is not in the allowed list for this agent: {policy.allowed_models}",
+            f"Model '{model}' is not in the allowed list for this agent: {sorted(policy.allowed_models)}",
+            status_code=403,
+        )
+
+    if (
+        policy.max_input_tokens is not None
+        and input_tokens is not None
+        and input_tokens > policy.max_input_tokens
+    ):
+        raise AppError(
+            f"Prompt of ~{input_tokens} tokens exceeds the input limit for this agent "
+            f"({policy.max_input_tokens} tokens)",
             status_code=403,
         )
 
@@ -144,3 +286,104 @@ def enforce_policy(
             effective_max = min(effective_max, policy.max_output_tokens)
 
     return effective_max
+
+
+async def enforce_rate_limit(policy: EffectivePolicy, agent_id: uuid.UUID) -> None:
+    """
+    Count this request against the agent's rpm_limit (sliding 60s window).
+    Raises RateLimitExceededError(429, Retry-After) when the window is full.
+    """
+    if policy.rpm_limit is None:
+        return
+    decision = await get_rate_limiter().acquire(f"rpm:agent:{agent_id}", policy.rpm_limit)
+    if not decision.allowed:
+        raise RateLimitExceededError(
+            f"Rate limit exceeded: {policy.rpm_limit} requests per minute",
+            decision.retry_after,
+        )
+
+
+@dataclass
+class LoadAdmission:
+    """Capacity taken by one admitted request; finish() gives it back."""
+    agent_id: uuid.UUID
+    estimated_tokens: int = 0  # charged to each of token_keys
+    token_keys: list[str] = field(default_factory=list)  # tpm windows charged
+    lease_id: str | None = None  # max_concurrent_requests slot in each of slot_keys
+    slot_keys: list[str] = field(default_factory=list)
+    finished: bool = False
+
+    async def finish(self, actual_tokens: int) -> None:
+        """Correct the token windows to actual usage and free the slots (once)."""
+        if self.finished:
+            return
+        self.finished = True
+        limiter = get_rate_limiter()
+        if actual_tokens != self.estimated_tokens:
+            for key in self.token_keys:
+                await limiter.adjust_tokens(key, actual_tokens - self.estimated_tokens)
+        for key in self.slot_keys:
+            await limiter.release_slot(key, self.lease_id)
+
+
+async def admit_load(
+    policy: EffectivePolicy, agent_id: uuid.UUID, estimated_tokens: int
+) -> LoadAdmission:
+    """
+    Admit a request under every level's tpm_limit and max_concurrent_requests.
+    An org, workspace or agent group limit is one window (or set of slots)
+    shared by all the agents under it.
+
+    The estimate (prompt + max completion) is charged up front and corrected
+    by LoadAdmission.finish() once actual usage is known.
+    Raises AppError(403) when the estimate alone exceeds a tpm_limit (no
+    retry could succeed), and RateLimitExceededError(429, Retry-After) when a
+    window or the slots are exhausted.
+    """
+    limits = policy.effective_load_limits()
+    for limit in limits:
+        if limit.tpm_limit is not None and estimated_tokens > limit.tpm_limit:
+            raise AppError(
+                f"Request of ~{estimated_tokens} tokens (prompt + max_tokens) exceeds the "
+                f"{limit.level} token rate limit of {limit.tpm_limit} tokens per minute; "
+                "lower max_tokens or shorten the prompt",
+                status_code=403,
+            )
+
+    admission = LoadAdmission(agent_id=agent_id, estimated_tokens=estimated_tokens)
+    limiter = get_rate_limiter()
+    try:
+        for limit in limits:
+            if limit.tpm_limit is None:
+                continue
+            key = limit.key("tpm", agent_id)
+            decision = await limiter.acquire_tokens(key, estimated_tokens, limit.tpm_limit)
+            if not decision.allowed:
+                raise RateLimitExceededError(
+                    f"Token rate limit exceeded: {limit.tpm_limit} tokens per minute "
+                    f"({limit.level})",
+                    decision.retry_after,
+                )
+            admission.token_keys.append(key)
+
+        for limit in limits:
+            if limit.max_concurrent_requests is None:
+                continue
+            admission.lease_id = admission.lease_id or uuid.uuid4().hex
+            key = limit.key("concurrency", agent_id)
+            decision = await limiter.acquire_slot(
+                key, limit.max_concurrent_requests, admission.lease_id
+            )
+            if not decision.allowed:
+                raise RateLimitExceededError(
+                    f"Concurrency limit exceeded: {limit.max_concurrent_requests} "
+                    f"requests in flight ({limit.level})",
+                    decision.retry_after,
+                )
+            admission.slot_keys.append(key)
+    except BaseException:
+        # Give back what the levels before the exhausted one admitted
+        await admission.finish(0)
+        raise
+
+    return admission
@@ -1,6 +1,7 @@
+from datetime import datetime, timezone
 from decimal import Decimal
 
-from sqlalchemy import Index, Numeric, String
+from sqlalchemy import DateTime, Index, Numeric, String, func
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.base import Base, TimestampMixin, UUIDMixin
@@ -18,3 +19,11 @@ class PricingRule(UUIDMixin, TimestampMixin, Base):
     input_cost_per_1k: Mapped[Decimal] = mapped_column(Numeric(18, 8), nullable=False)
     # Cost in USD per 1,000 output tokens
     output_cost_per_1k: Mapped[Decimal] = mapped_column(Numeric(18, 8), nullable=False)
+    # Bumped on every edit, so the pricing table fingerprint sees price changes
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now(),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
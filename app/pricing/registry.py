@@ -0,0 +1,113 @@
+"""Process-wide, preloaded pricing table.
+
+The pricing table is tiny and changes rarely, so every process keeps an
+immutable copy keyed by (provider, model). Lookups are a dict access.
+
+Staleness: at most once per refresh interval a single aggregate query
+fingerprints the table (row count, newest row, latest edit, summed prices).
+The table is only reloaded — and the version bumped — when the fingerprint
+changes. Writers (app.pricing.service.set_pricing_rule) call invalidate()
+after committing so this process checks on its next lookup.
+"""
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.pricing.models import PricingRule
+
+
+@dataclass(frozen=True, slots=True)
+class PricingEntry:
+    """Immutable snapshot of a PricingRule row."""
+    id: uuid.UUID
+    provider: str
+    model: str
+    input_cost_per_1k: Decimal
+    output_cost_per_1k: Decimal
+
+
+Fingerprint = tuple[int, datetime | None, datetime | None, Decimal | None, Decimal | None]
+
+
+class PricingRegistry:
+    def __init__(self, refresh_interval_seconds: float) -> None:
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.version = 0
+        self._rules: dict[tuple[str, str], PricingEntry] = {}
+        self._fingerprint: Fingerprint | None = None
+        self._checked_at: float | None = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._fingerprint is not None
+
+    def is_stale(self) -> bool:
+        if self._checked_at is None:
+            return True
+        return time.monotonic() - self._checked_at >= self.refresh_interval_seconds
+
+    def lookup(self, provider: str, model: str) -> PricingEntry | None:
+        return self._rules.get((provider, model))
+
+    async def load(self, db: AsyncSession) -> None:
+        """Unconditionally reload every rule."""
+        fingerprint = await self._read_fingerprint(db)
+        result = await db.execute(select(PricingRule))
+        self._rules = {
+            (r.provider, r.model): PricingEntry(
+                id=r.id,
+                provider=r.provider,
+                model=r.model,
+                input_cost_per_1k=r.input_cost_per_1k,
+                output_cost_per_1k=r.output_cost_per_1k,
+            )
+            for r in result.scalars().all()
+        }
+        self._fingerprint = fingerprint
+        self._checked_at = time.monotonic()
+        self.version += 1
+
+    async def refresh_if_stale(self, db: AsyncSession) -> None:
+        if not self.is_stale():
+            return
+        if not self.loaded:
+            await self.load(db)
+            return
+        if await self._read_fingerprint(db) != self._fingerprint:
+            await self.load(db)
+        else:
+            self._checked_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Force a fingerprint check on the next lookup."""
+        self._checked_at = None
+
+    def clear(self) -> None:
+        self._rules = {}
+        self._fingerprint = None
+        self._checked_at = None
+
+    @staticmethod
+    async def _read_fingerprint(db: AsyncSession) -> Fingerprint:
+        result = await db.execute(
+            select(
+                func.count(PricingRule.id),
+                func.max(PricingRule.created_at),
+                func.max(PricingRule.updated_at),
+                func.sum(PricingRule.input_cost_per_1k),
+                func.sum(PricingRule.output_cost_per_1k),
+            )
+        )
+        count, newest, edited, input_total, output_total = result.one()
+        return int(count), newest, edited, input_total, output_total
+
+
+pricing_registry = PricingRegistry(
+    refresh_interval_seconds=settings.pricing_refresh_interval_seconds
+)
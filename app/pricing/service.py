@@ -2,6 +2,8 @@
 Cost engine: tokens → cost_usd → credits
 
 All pricing comes from the database. No hardcoded prices.
+Lookups are served from the preloaded in-memory table in
+app/pricing/registry.py; the database is only read to refresh it.
 """
 from decimal import Decimal, ROUND_CEILING
 
@@ -11,12 +13,38 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
 from app.core.exceptions import NotFoundError
 from app.pricing.models import PricingRule
+from app.pricing.registry import PricingEntry, pricing_registry
 from app.pricing.schemas import CostCalculation
 
 
+async def find_pricing_rule(
+    db: AsyncSession, provider: str, model: str
+) -> PricingEntry | None:
+    await pricing_registry.refresh_if_stale(db)
+    return pricing_registry.lookup(provider, model)
+
+
 async def get_pricing_rule(
     db: AsyncSession, provider: str, model: str
+) -> PricingEntry:
+    rule = await find_pricing_rule(db, provider, model)
+    if rule is None:
+        raise NotFoundError("PricingRule", f"{provider}/{model}")
+    return rule
+
+
+async def set_pricing_rule(
+    db: AsyncSession,
+    provider: str,
+    model: str,
+    input_cost_per_1k: Decimal,
+    output_cost_per_1k: Decimal,
 ) -> PricingRule:
+    """
+    Create or reprice the rule for provider/model. Callers commit, then call
+    pricing_registry.invalidate() so this process reloads on its next lookup;
+    other processes pick the edit up through the fingerprint (updated_at).
+    """
     result = await db.execute(
         select(PricingRule).where(
             PricingRule.provider == provider, PricingRule.model == model
@@ -24,12 +52,16 @@ async def get_pricing_rule(
     )
     rule = result.scalar_one_or_none()
     if rule is None:
-        raise NotFoundError("PricingRule", f"{provider}/{model}")
+        rule = PricingRule(provider=provider, model=model)
+        db.add(rule)
+    rule.input_cost_per_1k = input_cost_per_1k
+    rule.output_cost_per_1k = output_cost_per_1k
+    await db.flush()
     return rule
 
 
 def calculate_cost(
-    rule: PricingRule, input_tokens: int, output_tokens: int
+    rule: PricingEntry, input_tokens: int, output_tokens: int
 ) -> Decimal:
     """Calculate USD cost from token counts and pricing rule."""
     input_cost = (Decimal(input_tokens) / 1000) * rule.input_cost_per_1k
@@ -1,16 +1,25 @@
 """Anthropic Claude provider via httpx."""
+import json
+from collections.abc import AsyncIterator
 from typing import Any
 
-import httpx
-
-from app.providers.base import BaseProvider, ProviderResponse
+from app.providers.base import BaseProvider, ProviderResponse, StreamChunk
+from app.providers.http import build_http_client
 
 ANTHROPIC_API_URL = "https://api.anthropic.com/v1"
 
+# Anthropic stop_reason → OpenAI finish_reason
+_FINISH_REASONS = {
+    "end_turn": "stop",
+    "stop_sequence": "stop",
+    "max_tokens": "length",
+    "tool_use": "tool_calls",
+}
+
 
 class AnthropicProvider(BaseProvider):
     def __init__(self, api_key: str) -> None:
-        self._client = httpx.AsyncClient(
+        self._client = build_http_client(
             base_url=ANTHROPIC_API_URL,
             headers={
                 "x-api-key": api_key,
@@ -30,25 +39,7 @@ class AnthropicProvider(BaseProvider):
         messages: list[dict[str, str]],
         **kwargs: Any,
     ) -> ProviderResponse:
-        # Separate system message from user/assistant turns
-        system_content: str | None = None
-        filtered: list[dict[str, str]] = []
-        for msg in messages:
-            if msg.get("role") == "system":
-                system_content = msg["content"]
-            else:
-                filtered.append(msg)
-
-        max_tokens = kwargs.pop("max_tokens", 1024)
-        payload: dict[str, Any] = {
-            "model": model,
-            "messages": filtered,
-            "max_tokens": max_tokens,
-            **kwargs,
-        }
-        if system_content:
-            payload["system"] = system_content
-
+        payload = self._build_payload(model, messages, **kwargs)
         response = await self._client.post("/messages", json=payload)
         response.raise_for_status()
         data = response.json()
@@ -68,5 +59,67 @@ class AnthropicProvider(BaseProvider):
             raw_metadata=data,
         )
 
+    async def stream_completion(
+        self,
+        model: str,
+        messages: list[dict[str, str]],
+        **kwargs: Any,
+    ) -> AsyncIterator[StreamChunk]:
+        payload = self._build_payload(model, messages, **kwargs)
+        payload["stream"] = True
+
+        input_tokens: int | None = None
+        async with self._client.stream("POST", "/messages", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line.removeprefix("data:").strip())
+                event_type = event.get("type")
+                if event_type == "message_start":
+                    usage = event.get("message", {}).get("usage", {})
+                    input_tokens = usage.get("input_tokens")
+                    yield StreamChunk(
+                        input_tokens=input_tokens,
+                        output_tokens=usage.get("output_tokens"),
+                    )
+                elif event_type == "content_block_delta":
+                    delta = event.get("delta", {})
+                    if delta.get("type") == "text_delta":
+                        yield StreamChunk(content=delta.get("text", ""))
+                elif event_type == "message_delta":
+                    # output_tokens here is cumulative for the message
+                    stop_reason = event.get("delta", {}).get("stop_reason")
+                    yield StreamChunk(
+                        input_tokens=input_tokens,
+                        output_tokens=event.get("usage", {}).get("output_tokens"),
+                        finish_reason=_FINISH_REASONS.get(stop_reason, stop_reason),
+                    )
+                elif event_type == "message_stop":
+                    break
+
+    def _build_payload(
+        self, model: str, messages: list[dict[str, str]], **kwargs: Any
+    ) -> dict[str, Any]:
+        # Separate system message from user/assistant turns
+        system_content: str | None = None
+        filtered: list[dict[str, str]] = []
+        for msg in messages:
+            if msg.get("role") == "system":
+                system_content = msg["content"]
+            else:
+                filtered.append(msg)
+
+        max_tokens = kwargs.pop("max_tokens", 1024)
+        payload: dict[str, Any] = {
+            "model": model,
+            "messages": filtered,
+            "max_tokens": max_tokens,
+            **kwargs,
+        }
+        if system_content:
+            payload["system"] = system_content
+        return payload
+
     async def close(self) -> None:
         await self._client.aclose()
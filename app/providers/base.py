@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
 from typing import Any
 
@@ -13,6 +14,19 @@ class ProviderResponse:
     raw_metadata: dict[str, Any]
 
 
+@dataclass(frozen=True)
+class StreamChunk:
+    """One incremental piece of a streamed completion.
+
+    Token counts are the provider's running totals when it reports them,
+    otherwise None.
+    """
+    content: str = ""
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    finish_reason: str | None = None
+
+
 class BaseProvider(ABC):
     """Abstract interface for AI providers."""
 
@@ -34,6 +48,24 @@ class BaseProvider(ABC):
         """
         ...
 
+    async def stream_completion(
+        self,
+        model: str,
+        messages: list[dict[str, str]],
+        **kwargs: Any,
+    ) -> AsyncIterator[StreamChunk]:
+        """
+        Stream the completion as it is generated.
+        Providers without native streaming yield the full response as one chunk.
+        """
+        response = await self.generate_completion(model, messages, **kwargs)
+        yield StreamChunk(
+            content=response.content,
+            input_tokens=response.input_tokens,
+            output_tokens=response.output_tokens,
+            finish_reason="stop",
+        )
+
     async def close(self) -> None:
         """Cleanup resources (e.g., httpx client)."""
         pass
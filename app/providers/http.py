@@ -0,0 +1,31 @@
+"""Shared httpx client construction for provider adapters.
+
+Every provider client — managed singleton or pooled BYOK — uses the same
+connection limits so keep-alive behaviour is consistent. HTTP/2 is only
+enabled when requested *and* the optional ``h2`` package is installed.
+"""
+import importlib.util
+
+import httpx
+
+from app.config import settings
+
+
+def http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def build_http_client(
+    base_url: str, headers: dict[str, str], timeout: float
+) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        headers=headers,
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=settings.provider_max_connections,
+            max_keepalive_connections=settings.provider_max_keepalive_connections,
+            keepalive_expiry=settings.provider_keepalive_expiry_seconds,
+        ),
+        http2=settings.provider_http2 and http2_available(),
+    )
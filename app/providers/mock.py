@@ -1,6 +1,7 @@
+from collections.abc import AsyncIterator
 from typing import Any
 
-from app.providers.base import BaseProvider, ProviderResponse
+from app.providers.base import BaseProvider, ProviderResponse, StreamChunk
 
 
 class MockProvider(BaseProvider):
@@ -28,3 +29,20 @@ class MockProvider(BaseProvider):
             total_tokens=input_tokens + output_tokens,
             raw_metadata={"provider": "mock", "model": model},
         )
+
+    async def stream_completion(
+        self,
+        model: str,
+        messages: list[dict[str, str]],
+        **kwargs: Any,
+    ) -> AsyncIterator[StreamChunk]:
+        # Word-by-word, with usage on the final chunk like OpenAI's include_usage
+        response = await self.generate_completion(model, messages, **kwargs)
+        words = response.content.split(" ")
+        for i, word in enumerate(words):
+            yield StreamChunk(content=word if i == 0 else f" {word}")
+        yield StreamChunk(
+            input_tokens=response.input_tokens,
+            output_tokens=response.output_tokens,
+            finish_reason="stop",
+        )
@@ -1,16 +1,17 @@
+import json
+from collections.abc import AsyncIterator
 from typing import Any
 
-import httpx
-
 from app.config import settings
-from app.providers.base import BaseProvider, ProviderResponse
+from app.providers.base import BaseProvider, ProviderResponse, StreamChunk
+from app.providers.http import build_http_client
 
 
 class OpenAIProvider(BaseProvider):
-    def __init__(self) -> None:
-        self._client = httpx.AsyncClient(
-            base_url=settings.openai_base_url,
-            headers={"Authorization": f"Bearer {settings.openai_api_key}"},
+    def __init__(self, api_key: str | None = None, base_url: str | None = None) -> None:
+        self._client = build_http_client(
+            base_url=base_url or settings.openai_base_url,
+            headers={"Authorization": f"Bearer {api_key or settings.openai_api_key}"},
             timeout=60.0,
         )
 
@@ -38,5 +39,38 @@ class OpenAIProvider(BaseProvider):
             raw_metadata=data,
         )
 
+    async def stream_completion(
+        self,
+        model: str,
+        messages: list[dict[str, str]],
+        **kwargs: Any,
+    ) -> AsyncIterator[StreamChunk]:
+        payload: dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            **kwargs,
+            "stream": True,
+            # Final chunk carries authoritative usage
+            "stream_options": {"include_usage": True},
+        }
+        async with self._client.stream("POST", "/chat/completions", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line.removeprefix("data:").strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                usage = event.get("usage") or {}
+                choices = event.get("choices") or []
+                choice = choices[0] if choices else {}
+                yield StreamChunk(
+                    content=choice.get("delta", {}).get("content") or "",
+                    input_tokens=usage.get("prompt_tokens"),
+                    output_tokens=usage.get("completion_tokens"),
+                    finish_reason=choice.get("finish_reason"),
+                )
+
     async def close(self) -> None:
         await self._client.aclose()
@@ -2,16 +2,60 @@
 
 Supports two modes:
   - Singleton providers (for platform-managed keys configured in env)
-  - Ephemeral providers (created per-request for BYOK org credentials)
+  - Pooled BYOK providers, keyed by (provider, credential fingerprint)
+
+BYOK providers are kept alive between requests so tenants get the same
+connection reuse as the managed singletons. The pool is bounded; the least
+recently used provider is evicted. Requests hold a lease on the provider they
+use (lease_provider), and an evicted provider's client is closed when its
+last lease is released, however long a stream keeps it busy.
 """
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
 from app.providers.base import BaseProvider
 from app.config import settings
 from app.providers.mock import MockProvider
 from app.providers.openai import OpenAIProvider
 
+
+@dataclass(eq=False)
+class _PoolEntry:
+    provider: BaseProvider
+    leases: int = 0
+    evicted: bool = False
+
+
 # Singleton providers (platform-managed / test)
 _providers: dict[str, BaseProvider] = {}
 
+# BYOK providers, most recently used last
+_byok_pool: OrderedDict[tuple[str, str], _PoolEntry] = OrderedDict()
+# Evicted providers still leased by in-flight requests
+_draining: set[_PoolEntry] = set()
+
+
+class ProviderLease:
+    """A provider checked out for one request. release() when done (idempotent)."""
+
+    def __init__(self, provider: BaseProvider, entry: _PoolEntry | None = None) -> None:
+        self.provider = provider
+        self._entry = entry
+        self._released = False
+
+    async def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        entry = self._entry
+        if entry is None:
+            return
+        entry.leases -= 1
+        if entry.evicted and entry.leases == 0:
+            _draining.discard(entry)
+            await entry.provider.close()
+
 
 def get_provider(name: str) -> BaseProvider:
     """Get singleton provider by name (uses platform/env credentials)."""
@@ -33,18 +77,9 @@ def get_provider(name: str) -> BaseProvider:
 
 
 def make_provider(name: str, api_key: str) -> BaseProvider:
-    """Create an ephemeral provider with a specific API key (for BYOK)."""
+    """Create a new provider with a specific API key (not pooled)."""
     if name == "openai":
-        from app.providers.openai import OpenAIProvider as _OAI
-        from app.config import settings
-        provider = _OAI.__new__(_OAI)
-        import httpx
-        provider._client = httpx.AsyncClient(
-            base_url=settings.openai_base_url,
-            headers={"Authorization": f"Bearer {api_key}"},
-            timeout=60.0,
-        )
-        return provider
+        return OpenAIProvider(api_key=api_key)
     elif name == "anthropic":
         from app.providers.anthropic import AnthropicProvider
         return AnthropicProvider(api_key=api_key)
@@ -52,7 +87,44 @@ def make_provider(name: str, api_key: str) -> BaseProvider:
         raise ValueError(f"Unknown provider for BYOK: {name}")
 
 
+def _fingerprint(api_key: str) -> str:
+    # Pool keys never hold the plaintext credential.
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
+async def lease_provider(name: str, byok_key: str | None = None) -> ProviderLease:
+    """
+    Lease the provider for a request: the pooled one for a BYOK credential
+    (created on first use), else the platform singleton.
+    """
+    if not byok_key:
+        return ProviderLease(get_provider(name))
+
+    key = (name, _fingerprint(byok_key))
+    entry = _byok_pool.get(key)
+    if entry is not None:
+        _byok_pool.move_to_end(key)
+    else:
+        entry = _byok_pool[key] = _PoolEntry(make_provider(name, byok_key))
+    # Leased before anything awaits, so it cannot be closed under us
+    entry.leases += 1
+    while len(_byok_pool) > max(settings.byok_provider_pool_size, 1):
+        _, evicted = _byok_pool.popitem(last=False)
+        evicted.evicted = True
+        if evicted.leases:
+            _draining.add(evicted)  # closed by its last release()
+        else:
+            await evicted.provider.close()
+    return ProviderLease(entry.provider, entry)
+
+
 async def close_all() -> None:
-    for provider in _providers.values():
+    for provider in [
+        *_providers.values(),
+        *(entry.provider for entry in _byok_pool.values()),
+        *(entry.provider for entry in _draining),
+    ]:
         await provider.close()
     _providers.clear()
+    _byok_pool.clear()
+    _draining.clear()
@@ -0,0 +1,104 @@
+"""Local prompt token estimates for pre-checks.
+
+Used before the provider call to enforce max_input_tokens and to price the
+prompt in the budget and credit pre-checks; the provider-reported usage is
+what gets charged. Estimators are looked up by model-name prefix (longest
+match wins) and can be swapped per model family with register_estimator(),
+e.g. for an exact tokenizer.
+
+System prompts repeat across requests of the same agent, so their counts
+are memoized.
+"""
+import math
+from dataclasses import dataclass
+from typing import Protocol
+
+from app.config import settings
+from app.core.cache import MISSING, TTLCache
+
+
+class TokenEstimator(Protocol):
+    name: str
+    # Per-message framing (role markers etc.) and the reply primer.
+    tokens_per_message: int
+    tokens_per_reply: int
+
+    def count_text(self, text: str) -> int: ...
+
+
+@dataclass(frozen=True)
+class HeuristicEstimator:
+    """Characters-per-token ratio for ASCII text; one token per other character.
+
+    BPE vocabularies rarely merge non-ASCII characters (CJK, emoji), so
+    counting them individually keeps non-English prompts from being
+    underestimated by a factor of three or four.
+    """
+    name: str
+    chars_per_token: float = 4.0
+    tokens_per_message: int = 3
+    tokens_per_reply: int = 3
+
+    def count_text(self, text: str) -> int:
+        if text.isascii():
+            return math.ceil(len(text) / self.chars_per_token)
+        ascii_chars = sum(1 for ch in text if ch < "\x80")
+        return math.ceil(ascii_chars / self.chars_per_token) + len(text) - ascii_chars
+
+
+DEFAULT_ESTIMATOR = HeuristicEstimator("default")
+
+_estimators: dict[str, TokenEstimator] = {
+    "gpt-": HeuristicEstimator("openai", chars_per_token=4.0),
+    "o1": HeuristicEstimator("openai", chars_per_token=4.0),
+    "o3": HeuristicEstimator("openai", chars_per_token=4.0),
+    "claude-": HeuristicEstimator(
+        "anthropic", chars_per_token=3.5, tokens_per_message=4, tokens_per_reply=1
+    ),
+    "mock": HeuristicEstimator("mock", tokens_per_message=0, tokens_per_reply=0),
+}
+# (estimator name, system prompt) -> token count
+_system_prompt_cache: TTLCache[tuple[str, str], int] = TTLCache(
+    maxsize=settings.token_estimate_cache_size,
+    ttl_seconds=settings.token_estimate_cache_ttl_seconds,
+)
+
+
+def register_estimator(model_prefix: str, estimator: TokenEstimator) -> None:
+    """Use `estimator` for models starting with `model_prefix`."""
+    _estimators[model_prefix] = estimator
+    _system_prompt_cache.clear()
+
+
+def get_estimator(model: str) -> TokenEstimator:
+    # A scan of a handful of prefixes; not memoized, since `model` is
+    # client-supplied and a per-model table would grow without bound.
+    matches = [prefix for prefix in _estimators if model.startswith(prefix)]
+    return _estimators[max(matches, key=len)] if matches else DEFAULT_ESTIMATOR
+
+
+def _count_system_prompt(estimator: TokenEstimator, text: str) -> int:
+    key = (estimator.name, text)
+    count = _system_prompt_cache.get(key)
+    if count is MISSING:
+        count = estimator.count_text(text)
+        _system_prompt_cache.set(key, count)
+    return count
+
+
+def estimate_prompt_tokens(model: str, messages: list[dict[str, str]]) -> int:
+    """Estimated input tokens for a chat request."""
+    estimator = get_estimator(model)
+    total = estimator.tokens_per_reply
+    for message in messages:
+        content = message.get("content", "")
+        if message.get("role") == "system":
+            total += _count_system_prompt(estimator, content)
+        else:
+            total += estimator.count_text(content)
+        total += estimator.tokens_per_message
+    return total
+
+
+def clear_token_estimates() -> None:
+    _system_prompt_cache.clear()
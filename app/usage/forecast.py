@@ -0,0 +1,260 @@
+"""Spend forecasts: when an org's balance or budgets run out at current velocity.
+
+Velocity is an exponentially weighted moving average (EWMA) of hourly spend
+over the last FORECAST_WINDOW_HOURS complete hours, with a half-life of
+FORECAST_HALF_LIFE_HOURS. A burst shows up within a few hours, while one
+quiet hour barely moves it. Hourly spend comes from usage_rollups_hourly
+below the rollup high-water mark and from usage_events above it, in one
+statement (see app.usage.rollups).
+
+Forecasts are cached per org for FORECAST_CACHE_TTL_SECONDS so dashboards can
+poll them; their inputs only move hour by hour.
+"""
+import uuid
+from collections import defaultdict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, or_, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.agent_groups.models import AgentGroup
+from app.agents.models import Agent
+from app.budgets.models import Budget, BudgetLevel, BudgetPeriod
+from app.budgets.service import _budget_target, _period_end, _period_start, get_budget_spend
+from app.config import settings
+from app.core.cache import MISSING, TTLCache
+from app.ledger import service as ledger_service
+from app.orgs.models import Organization
+from app.usage.models import UsageEvent, UsageRollupHourly, UsageStatus
+from app.usage.rollups import bucket_start, high_water_mark
+from app.workspaces.models import Workspace
+
+HOUR = timedelta(hours=1)
+
+# Series key: ("group", billing_group_id) or (BudgetLevel, target_id)
+SeriesKey = tuple[str | BudgetLevel, uuid.UUID]
+
+
+@dataclass(frozen=True)
+class BalanceForecast:
+    group_id: uuid.UUID
+    available_credits: int  # balance minus active holds
+    credits_per_hour: float
+    exhausts_at: datetime | None  # None = not at the current velocity
+
+
+@dataclass(frozen=True)
+class BudgetForecast:
+    budget_id: uuid.UUID
+    level: BudgetLevel
+    target_id: uuid.UUID
+    period: BudgetPeriod
+    limit_credits: int
+    spent_credits: int
+    remaining_credits: int
+    credits_per_hour: float
+    period_ends_at: datetime | None  # None for TOTAL budgets
+    exhausts_at: datetime | None  # None = not before the period resets
+
+
+@dataclass(frozen=True)
+class OrgForecast:
+    org_id: uuid.UUID
+    generated_at: datetime
+    window_hours: int
+    half_life_hours: float
+    balance: BalanceForecast
+    budgets: list[BudgetForecast]
+
+
+_forecast_cache: TTLCache[uuid.UUID, OrgForecast] = TTLCache(
+    maxsize=settings.forecast_cache_size,
+    ttl_seconds=settings.forecast_cache_ttl_seconds,
+)
+
+
+def ewma(series: Sequence[float], half_life: float) -> float:
+    """EWMA of `series` (oldest first), seeded with the series mean."""
+    if not series:
+        return 0.0
+    alpha = 1 - 0.5 ** (1 / half_life)
+    value = sum(series) / len(series)
+    for x in series:
+        value = alpha * x + (1 - alpha) * value
+    return value
+
+
+def projected_exhaustion(
+    remaining: int, per_hour: float, now: datetime, deadline: datetime | None = None
+) -> datetime | None:
+    """When `remaining` credits are used up at `per_hour`, if before `deadline`."""
+    if remaining <= 0:
+        return now
+    if per_hour <= 0:
+        return None
+    at = now + timedelta(hours=remaining / per_hour)
+    if deadline is not None and at >= deadline:
+        return None
+    return at
+
+
+async def _hierarchy_budgets(db: AsyncSession, org_id: uuid.UUID) -> list[Budget]:
+    """Active budgets on the org and everything under it."""
+    workspace_ids = select(Workspace.id).where(Workspace.org_id == org_id)
+    agent_group_ids = select(AgentGroup.id).where(AgentGroup.workspace_id.in_(workspace_ids))
+    agent_ids = select(Agent.id).where(Agent.agent_group_id.in_(agent_group_ids))
+    result = await db.execute(
+        select(Budget)
+        .where(
+            Budget.is_active == True,  # noqa: E712
+            or_(
+                Budget.org_id == org_id,
+                Budget.workspace_id.in_(workspace_ids),
+                Budget.agent_group_id.in_(agent_group_ids),
+                Budget.agent_id.in_(agent_ids),
+            ),
+        )
+        .order_by(Budget.created_at, Budget.id)
+    )
+    return list(result.scalars().all())
+
+
+async def _hourly_spend(
+    db: AsyncSession, org: Organization, start: datetime, end: datetime
+) -> dict[SeriesKey, list[float]]:
+    """
+    Credits spent per hour in [start, end) by the org's billing group and by
+    every hierarchy target under the org, oldest hour first.
+    """
+    rollup = UsageRollupHourly
+    rolled = (
+        select(
+            rollup.bucket_start,
+            rollup.group_id,
+            rollup.org_id,
+            rollup.workspace_id,
+            rollup.agent_group_id,
+            rollup.agent_id,
+            func.sum(rollup.credits_charged).label("credits"),
+        )
+        .where(
+            or_(rollup.org_id == org.id, rollup.group_id == org.billing_group_id),
+            rollup.status == UsageStatus.SUCCESS,
+            rollup.bucket_start >= start,
+            rollup.bucket_start < end,
+        )
+        .group_by(
+            rollup.bucket_start,
+            rollup.group_id,
+            rollup.org_id,
+            rollup.workspace_id,
+            rollup.agent_group_id,
+            rollup.agent_id,
+        )
+    )
+    bucket = bucket_start(db, "hour")
+    raw_dimensions = (
+        UsageEvent.group_id,
+        UsageEvent.org_id,
+        UsageEvent.workspace_id,
+        UsageEvent.agent_group_id,
+        UsageEvent.agent_id,
+    )
+    raw = (
+        select(bucket, *raw_dimensions, func.sum(UsageEvent.credits_charged).label("credits"))
+        .where(
+            or_(UsageEvent.org_id == org.id, UsageEvent.group_id == org.billing_group_id),
+            UsageEvent.status == UsageStatus.SUCCESS,
+            UsageEvent.created_at >= high_water_mark(),
+            UsageEvent.created_at >= start,
+            UsageEvent.created_at < end,
+        )
+        .group_by(bucket, *raw_dimensions)
+    )
+    result = await db.execute(union_all(rolled, raw))
+
+    hours = round((end - start) / HOUR)
+    series: dict[SeriesKey, list[float]] = defaultdict(lambda: [0.0] * hours)
+    for at, group_id, org_id, workspace_id, agent_group_id, agent_id, credits in result.all():
+        if at.tzinfo is None:  # SQLite returns naive UTC
+            at = at.replace(tzinfo=timezone.utc)
+        index = round((at - start) / HOUR)
+        if group_id == org.billing_group_id:
+            series[("group", group_id)][index] += credits
+        if org_id == org.id:
+            series[(BudgetLevel.ORG, org_id)][index] += credits
+            series[(BudgetLevel.WORKSPACE, workspace_id)][index] += credits
+            series[(BudgetLevel.AGENT_GROUP, agent_group_id)][index] += credits
+            series[(BudgetLevel.AGENT, agent_id)][index] += credits
+    return series
+
+
+async def compute_org_forecast(
+    db: AsyncSession, org: Organization, now: datetime | None = None
+) -> OrgForecast:
+    now = now or datetime.now(timezone.utc)
+    window_hours = settings.forecast_window_hours
+    half_life = settings.forecast_half_life_hours
+    # Complete hours only: the current one would read as a slowdown
+    end = now.replace(minute=0, second=0, microsecond=0)
+    series = await _hourly_spend(db, org, end - window_hours * HOUR, end)
+
+    def velocity(key: SeriesKey) -> float:
+        return ewma(series[key], half_life) if key in series else 0.0
+
+    balance = await ledger_service.get_group_balance(db, org.billing_group_id)
+    held = await ledger_service.get_held_credits(db, org.billing_group_id)
+    group_rate = velocity(("group", org.billing_group_id))
+    balance_forecast = BalanceForecast(
+        group_id=org.billing_group_id,
+        available_credits=balance - held,
+        credits_per_hour=group_rate,
+        exhausts_at=projected_exhaustion(balance - held, group_rate, now),
+    )
+
+    budgets = await _hierarchy_budgets(db, org.id)
+    spend = await get_budget_spend(db, budgets, now)
+    budget_forecasts = []
+    for budget in budgets:
+        level, target_id = _budget_target(budget)
+        rate = velocity((level, target_id))
+        period_ends_at = _period_end(budget.period, _period_start(budget.period, now))
+        remaining = budget.limit_credits - spend[budget.id]
+        budget_forecasts.append(
+            BudgetForecast(
+                budget_id=budget.id,
+                level=level,
+                target_id=target_id,
+                period=budget.period,
+                limit_credits=budget.limit_credits,
+                spent_credits=spend[budget.id],
+                remaining_credits=remaining,
+                credits_per_hour=rate,
+                period_ends_at=period_ends_at,
+                exhausts_at=projected_exhaustion(remaining, rate, now, period_ends_at),
+            )
+        )
+
+    return OrgForecast(
+        org_id=org.id,
+        generated_at=now,
+        window_hours=window_hours,
+        half_life_hours=half_life,
+        balance=balance_forecast,
+        budgets=budget_forecasts,
+    )
+
+
+async def get_org_forecast(db: AsyncSession, org: Organization) -> OrgForecast:
+    """Cached compute_org_forecast()."""
+    forecast = _forecast_cache.get(org.id)
+    if forecast is MISSING:
+        forecast = await compute_org_forecast(db, org)
+        _forecast_cache.set(org.id, forecast)
+    return forecast
+
+
+def clear_forecasts() -> None:
+    _forecast_cache.clear()
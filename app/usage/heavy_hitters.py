@@ -0,0 +1,223 @@
+"""Approximate top users, agents and models per billing group.
+
+Every settled request that charges credits adds them to in-memory Space-Saving
+summaries (app.core.sketch) for the current hour: one per billing group and
+dimension (user, agent, model). A background task merges these deltas into
+heavy_hitter_slots every HEAVY_HITTER_FLUSH_SECONDS. Summaries therefore
+survive restarts and combine the traffic of every worker process; a crash
+loses at most one interval. Slots older than HEAVY_HITTER_RETENTION_HOURS are
+deleted on flush.
+
+A top-K query over the last N hours merges N stored slots and this process's
+unflushed deltas: O(HEAVY_HITTER_CAPACITY) per slot, regardless of traffic or
+the number of distinct users. Reported credits overestimate the truth by at
+most the reported error, itself bounded by window total / capacity.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import settings
+from app.core.exceptions import AppError
+from app.core.sketch import HeavyHitter, SpaceSaving
+from app.db import session as db_session
+from app.usage.models import HeavyHitterSlot
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ("user", "agent", "model")
+SLOT = timedelta(hours=1)
+
+SlotKey = tuple[uuid.UUID, str, datetime]
+
+
+def slot_start(at: datetime) -> datetime:
+    at = at.astimezone(timezone.utc) if at.tzinfo else at.replace(tzinfo=timezone.utc)
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+def window_start(window_hours: int, now: datetime | None = None) -> datetime:
+    """Start of a window of `window_hours` whole hours ending with the current one."""
+    return slot_start(now or datetime.now(timezone.utc)) - (window_hours - 1) * SLOT
+
+
+class HeavyHitterTracker:
+    """Per-process deltas of hourly heavy-hitter summaries, flushed in the background."""
+
+    def __init__(
+        self,
+        capacity: int | None = None,
+        retention_hours: int | None = None,
+        flush_interval_seconds: float | None = None,
+        session_factory: async_sessionmaker[AsyncSession] | None = None,
+    ) -> None:
+        self.capacity = settings.heavy_hitter_capacity if capacity is None else capacity
+        self.retention_hours = (
+            settings.heavy_hitter_retention_hours if retention_hours is None else retention_hours
+        )
+        self.flush_interval_seconds = (
+            settings.heavy_hitter_flush_seconds
+            if flush_interval_seconds is None
+            else flush_interval_seconds
+        )
+        # None = app.db.session.async_session_factory, resolved per flush
+        self.session_factory = session_factory
+        self._deltas: dict[SlotKey, SpaceSaving] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+
+    def check_window(self, window_hours: int) -> None:
+        if not 1 <= window_hours <= self.retention_hours:
+            raise AppError(
+                f"window_hours must be between 1 and {self.retention_hours}", status_code=400
+            )
+
+    def record(
+        self,
+        group_id: uuid.UUID,
+        *,
+        credits: int,
+        user_id: uuid.UUID,
+        agent_id: uuid.UUID | None = None,
+        model: str | None = None,
+        at: datetime | None = None,
+    ) -> None:
+        """Count a settled charge. Call from the event loop, after the commit."""
+        if credits <= 0:
+            return
+        slot = slot_start(at or datetime.now(timezone.utc))
+        for dimension, key in (("user", user_id), ("agent", agent_id), ("model", model)):
+            if key is None:
+                continue
+            summary = self._deltas.get((group_id, dimension, slot))
+            if summary is None:
+                summary = self._deltas[(group_id, dimension, slot)] = SpaceSaving(self.capacity)
+            summary.add(str(key), credits)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            try:
+                await self.flush()
+            except Exception:
+                logger.warning("Heavy-hitter flush failed; retrying next interval", exc_info=True)
+
+    def _sessions(self) -> async_sessionmaker[AsyncSession]:
+        return self.session_factory or db_session.async_session_factory
+
+    async def flush(self) -> int:
+        """Merge every pending delta into heavy_hitter_slots. Returns slots written."""
+        async with self._flush_lock:
+            deltas, self._deltas = self._deltas, {}
+            if not deltas:
+                return 0
+            try:
+                async with self._sessions()() as db:
+                    async with db.begin():
+                        await self._merge_into_slots(db, deltas)
+            except BaseException:
+                # Keep them for the next flush, merged with anything recorded since;
+                # a flush cancelled mid-write (shutdown) must not drop them either
+                for key, delta in deltas.items():
+                    pending = self._deltas.get(key)
+                    self._deltas[key] = delta if pending is None else delta.merge(pending)
+                raise
+            return len(deltas)
+
+    async def _merge_into_slots(self, db: AsyncSession, deltas: dict[SlotKey, SpaceSaving]) -> None:
+        now = datetime.now(timezone.utc)
+        # Sorted so concurrent flushes from other processes lock rows in the same order
+        keys = sorted(deltas, key=lambda k: (str(k[0]), k[1], k[2]))
+        insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+        await db.execute(
+            insert(HeavyHitterSlot)
+            .values(
+                [
+                    {
+                        "group_id": group_id,
+                        "dimension": dimension,
+                        "slot_start": slot,
+                        "summary": SpaceSaving(self.capacity).to_dict(),
+                        "updated_at": now,
+                    }
+                    for group_id, dimension, slot in keys
+                ]
+            )
+            .on_conflict_do_nothing()
+        )
+        result = await db.execute(
+            select(HeavyHitterSlot)
+            .where(
+                tuple_(
+                    HeavyHitterSlot.group_id, HeavyHitterSlot.dimension, HeavyHitterSlot.slot_start
+                ).in_(keys)
+            )
+            .order_by(HeavyHitterSlot.group_id, HeavyHitterSlot.dimension, HeavyHitterSlot.slot_start)
+            .with_for_update()
+        )
+        for row in result.scalars():
+            delta = deltas[(row.group_id, row.dimension, slot_start(row.slot_start))]
+            row.summary = SpaceSaving.from_dict(row.summary).merge(delta).to_dict()
+            row.updated_at = now
+        await db.execute(
+            delete(HeavyHitterSlot)
+            .where(HeavyHitterSlot.slot_start < slot_start(now) - self.retention_hours * SLOT)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def top(
+        self,
+        db: AsyncSession,
+        group_id: uuid.UUID,
+        dimension: str,
+        limit: int,
+        window_hours: int,
+    ) -> list[HeavyHitter]:
+        """Approximate top `limit` keys of `dimension` over the last `window_hours`."""
+        self.check_window(window_hours)
+        since = window_start(window_hours)
+        result = await db.execute(
+            select(HeavyHitterSlot.summary).where(
+                HeavyHitterSlot.group_id == group_id,
+                HeavyHitterSlot.dimension == dimension,
+                HeavyHitterSlot.slot_start >= since,
+            )
+        )
+        summary = SpaceSaving(self.capacity)
+        for data in result.scalars():
+            summary = summary.merge(SpaceSaving.from_dict(data))
+        for (delta_group, delta_dimension, slot), delta in self._deltas.items():
+            if delta_group == group_id and delta_dimension == dimension and slot >= since:
+                summary = summary.merge(delta)
+        return summary.top(limit)
+
+    async def close(self) -> None:
+        """Stop the flusher and write what is pending (shutdown)."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.error("Dropping unflushed heavy-hitter deltas", exc_info=True)
+
+    def clear(self) -> None:
+        """Forget unflushed deltas and the flusher (tests, one event loop each)."""
+        self._deltas.clear()
+        self._flush_lock = asyncio.Lock()
+        self._flusher = None
+
+
+heavy_hitters = HeavyHitterTracker()
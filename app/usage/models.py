@@ -1,11 +1,23 @@
 import enum
 import uuid
+from datetime import datetime
 from decimal import Decimal
 
-from sqlalchemy import BigInteger, Enum, ForeignKey, Index, Integer, Numeric, String, Uuid
+from sqlalchemy import (
+    BigInteger,
+    DateTime,
+    Enum,
+    ForeignKey,
+    Index,
+    Integer,
+    JSON,
+    Numeric,
+    String,
+    Uuid,
+)
 from sqlalchemy.orm import Mapped, mapped_column
 
-from app.db.base import Base, TimestampMixin, UUIDMixin
+from app.db.base import Base, PartitionedTimestampMixin, UUIDMixin
 
 
 class UsageStatus(str, enum.Enum):
@@ -15,12 +27,33 @@ class UsageStatus(str, enum.Enum):
     BUDGET_EXCEEDED = "BUDGET_EXCEEDED"
 
 
-class UsageEvent(UUIDMixin, TimestampMixin, Base):
+class UsageEvent(UUIDMixin, PartitionedTimestampMixin, Base):
     __tablename__ = "usage_events"
     __table_args__ = (
         Index("ix_usage_group_user", "group_id", "user_id"),
         Index("ix_usage_group_created", "group_id", "created_at"),
-        Index("ix_usage_agent_id", "agent_id"),
+        # Hierarchy spend: index-only scans per level (see budgets.service)
+        Index(
+            "ix_usage_org_status_created",
+            "org_id", "status", "created_at",
+            postgresql_include=["credits_charged"],
+        ),
+        Index(
+            "ix_usage_workspace_status_created",
+            "workspace_id", "status", "created_at",
+            postgresql_include=["credits_charged"],
+        ),
+        Index(
+            "ix_usage_agent_group_status_created",
+            "agent_group_id", "status", "created_at",
+            postgresql_include=["credits_charged"],
+        ),
+        Index(
+            "ix_usage_agent_status_created",
+            "agent_id", "status", "created_at",
+            postgresql_include=["credits_charged"],
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
     user_id: Mapped[uuid.UUID] = mapped_column(
@@ -33,6 +66,17 @@ class UsageEvent(UUIDMixin, TimestampMixin, Base):
     agent_id: Mapped[uuid.UUID | None] = mapped_column(
         Uuid, ForeignKey("agents.id"), nullable=True
     )
+    # Agent's ancestors, denormalized at insert time so hierarchy-scoped
+    # aggregations need no joins (null for legacy, agent-less usage)
+    agent_group_id: Mapped[uuid.UUID | None] = mapped_column(
+        Uuid, ForeignKey("agent_groups.id"), nullable=True
+    )
+    workspace_id: Mapped[uuid.UUID | None] = mapped_column(
+        Uuid, ForeignKey("workspaces.id"), nullable=True
+    )
+    org_id: Mapped[uuid.UUID | None] = mapped_column(
+        Uuid, ForeignKey("organizations.id"), nullable=True
+    )
     provider: Mapped[str] = mapped_column(String(64), nullable=False)
     model: Mapped[str] = mapped_column(String(128), nullable=False)
     input_tokens: Mapped[int] = mapped_column(BigInteger, nullable=False)
@@ -46,3 +90,71 @@ class UsageEvent(UUIDMixin, TimestampMixin, Base):
         Enum(UsageStatus), nullable=False, default=UsageStatus.SUCCESS
     )
     error_message: Mapped[str | None] = mapped_column(String(1024), nullable=True)
+
+
+# Rollup keys are primary keys, so a missing hierarchy id (legacy, agent-less
+# usage) is stored as the zero UUID instead of NULL.
+ROLLUP_NONE = uuid.UUID(int=0)
+
+
+class _UsageRollupColumns:
+    """
+    Usage events aggregated per bucket and dimension tuple. Derived data,
+    maintained by app.usage.rollups: every event created before the
+    high-water mark in usage_rollup_state is counted exactly once.
+    """
+    group_id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True)
+    org_id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True)
+    workspace_id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True)
+    agent_group_id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True)
+    agent_id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True)
+    provider: Mapped[str] = mapped_column(String(64), primary_key=True)
+    model: Mapped[str] = mapped_column(String(128), primary_key=True)
+    status: Mapped[UsageStatus] = mapped_column(Enum(UsageStatus), primary_key=True)
+    request_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    input_tokens: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    output_tokens: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    total_tokens: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    cost_usd: Mapped[Decimal] = mapped_column(Numeric(24, 8), nullable=False)
+    credits_charged: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    # Average latency = latency_ms_sum / latency_count (latency is optional)
+    latency_ms_sum: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    latency_count: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class UsageRollupHourly(_UsageRollupColumns, Base):
+    __tablename__ = "usage_rollups_hourly"
+    __table_args__ = (
+        # Org-wide spend series (app.usage.forecast)
+        Index("ix_usage_rollups_hourly_org_bucket", "org_id", "bucket_start"),
+    )
+
+
+class UsageRollupDaily(_UsageRollupColumns, Base):
+    __tablename__ = "usage_rollups_daily"
+
+
+class UsageRollupState(Base):
+    """How far the rollups reach: events created before high_water_mark."""
+    __tablename__ = "usage_rollup_state"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    high_water_mark: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+class HeavyHitterSlot(Base):
+    """
+    Space-Saving summary (app.core.sketch) of the credits charged per user,
+    agent or model in one billing group and hour. Approximate, derived data
+    maintained by app.usage.heavy_hitters; never read for billing.
+    """
+    __tablename__ = "heavy_hitter_slots"
+
+    group_id: Mapped[uuid.UUID] = mapped_column(Uuid, primary_key=True)
+    dimension: Mapped[str] = mapped_column(String(16), primary_key=True)
+    slot_start: Mapped[datetime] = mapped_column(DateTime(timezone=True), primary_key=True)
+    summary: Mapped[dict] = mapped_column(JSON, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
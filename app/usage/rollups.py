@@ -0,0 +1,182 @@
+"""Hourly and daily usage rollups, maintained by tailing usage_events.
+
+roll_up() folds the usage events created between the stored high-water mark
+and now - USAGE_ROLLUP_LAG_SECONDS into usage_rollups_hourly and
+usage_rollups_daily and advances the mark, in one transaction. Run it every
+minute or so (`python -m scripts.maintenance rollup`); an advisory lock makes
+a concurrent run skip instead of counting the same events twice.
+
+Readers combine both sides of the mark in a single statement, so they see
+one snapshot: rollups for events before it, raw usage_events from it on.
+The lag leaves room for rows that commit some time after their created_at
+(long settlement transactions, the write-behind buffer). A row that commits
+more than the lag late is missed until `rollup --rebuild`.
+
+Rollups outlive detached usage_events partitions, which a rebuild cannot
+recover, so rebuild only while the raw history is still attached.
+"""
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import DateTime, delete, func, literal_column, select, text, type_coerce
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.usage.models import (
+    ROLLUP_NONE,
+    UsageEvent,
+    UsageRollupDaily,
+    UsageRollupHourly,
+    UsageRollupState,
+)
+
+ROLLUP_STATE = "usage_events"
+ROLLUP_TABLES = {"hour": UsageRollupHourly, "day": UsageRollupDaily}
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+UPSERT_CHUNK = 500
+
+_LOCK_KEY = int.from_bytes(
+    hashlib.blake2b(b"usage_rollups", digest_size=8).digest(), "big", signed=True
+)
+_DIMENSIONS = (
+    "group_id", "user_id", "org_id", "workspace_id", "agent_group_id", "agent_id",
+    "provider", "model", "status",
+)
+_NULLABLE = ("org_id", "workspace_id", "agent_group_id", "agent_id")
+_MEASURES = (
+    "request_count", "input_tokens", "output_tokens", "total_tokens", "cost_usd",
+    "credits_charged", "latency_ms_sum", "latency_count",
+)
+
+
+@dataclass(frozen=True)
+class RollupRun:
+    start: datetime | None  # None = from the first event
+    end: datetime
+    events: int
+
+
+def high_water_mark():
+    """Scalar subquery: events created before it are in the rollups."""
+    return func.coalesce(
+        select(UsageRollupState.high_water_mark)
+        .where(UsageRollupState.name == ROLLUP_STATE)
+        .scalar_subquery(),
+        EPOCH,
+    )
+
+
+async def _try_lock(db: AsyncSession) -> bool:
+    # Only PostgreSQL has advisory locks; SQLite (tests) serialises writers anyway.
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    result = await db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _LOCK_KEY})
+    return bool(result.scalar_one())
+
+
+def bucket_start(db: AsyncSession, unit: str):
+    """usage_events.created_at truncated to its UTC hour or day."""
+    # Constants inlined so the GROUP BY expression matches the select list
+    if db.get_bind().dialect.name == "postgresql":
+        utc = literal_column("'UTC'")
+        expr = func.timezone(
+            utc, func.date_trunc(literal_column(f"'{unit}'"), func.timezone(utc, UsageEvent.created_at))
+        )
+    else:
+        fmt = "%Y-%m-%d %H:00:00" if unit == "hour" else "%Y-%m-%d 00:00:00"
+        expr = func.strftime(literal_column(f"'{fmt}'"), UsageEvent.created_at)
+    return type_coerce(expr, DateTime(timezone=True)).label("bucket_start")
+
+
+async def _fold(
+    db: AsyncSession, unit: str, model: type, start: datetime | None, end: datetime
+) -> int:
+    """Add the events in [start, end) to one rollup table; returns how many."""
+    bucket = bucket_start(db, unit)
+    dimensions = [getattr(UsageEvent, name) for name in _DIMENSIONS]
+    stmt = (
+        select(
+            bucket,
+            *dimensions,
+            func.count().label("request_count"),
+            func.sum(UsageEvent.input_tokens).label("input_tokens"),
+            func.sum(UsageEvent.output_tokens).label("output_tokens"),
+            func.sum(UsageEvent.total_tokens).label("total_tokens"),
+            func.sum(UsageEvent.cost_usd).label("cost_usd"),
+            func.sum(UsageEvent.credits_charged).label("credits_charged"),
+            func.coalesce(func.sum(UsageEvent.latency_ms), 0).label("latency_ms_sum"),
+            func.count(UsageEvent.latency_ms).label("latency_count"),
+        )
+        .where(UsageEvent.created_at < end)
+        .group_by(bucket, *dimensions)
+    )
+    if start is not None:
+        stmt = stmt.where(UsageEvent.created_at >= start)
+
+    rows = []
+    for row in (await db.execute(stmt)).mappings():
+        values = dict(row)
+        for name in _NULLABLE:
+            if values[name] is None:
+                values[name] = ROLLUP_NONE
+        rows.append(values)
+
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    for i in range(0, len(rows), UPSERT_CHUNK):
+        stmt = insert(model).values(rows[i : i + UPSERT_CHUNK])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["bucket_start", *_DIMENSIONS],
+            set_={name: getattr(model, name) + stmt.excluded[name] for name in _MEASURES},
+        )
+        await db.execute(stmt)
+    return sum(row["request_count"] for row in rows)
+
+
+async def roll_up(
+    db: AsyncSession, now: datetime | None = None, lag_seconds: int | None = None
+) -> RollupRun | None:
+    """
+    Fold the events created since the high-water mark (up to now - lag)
+    into both rollup tables and advance the mark. Call inside a transaction.
+    Returns None if another run holds the lock or nothing new is due.
+    """
+    if not await _try_lock(db):
+        return None
+    now = now or datetime.now(timezone.utc)
+    lag = settings.usage_rollup_lag_seconds if lag_seconds is None else lag_seconds
+    end = now - timedelta(seconds=lag)
+
+    state = await db.get(UsageRollupState, ROLLUP_STATE)
+    start = None
+    if state is not None:
+        start = state.high_water_mark
+        if start.tzinfo is None:  # SQLite returns naive UTC
+            start = start.replace(tzinfo=timezone.utc)
+        if start >= end:
+            return None
+
+    events = 0
+    for unit, model in ROLLUP_TABLES.items():
+        events = await _fold(db, unit, model, start, end)
+
+    if state is None:
+        db.add(UsageRollupState(name=ROLLUP_STATE, high_water_mark=end, updated_at=now))
+    else:
+        state.high_water_mark = end
+        state.updated_at = now
+    await db.flush()
+    return RollupRun(start, end, events)
+
+
+async def rebuild_rollups(
+    db: AsyncSession, now: datetime | None = None, lag_seconds: int | None = None
+) -> RollupRun | None:
+    """Recompute both rollup tables from the usage events still in usage_events."""
+    if not await _try_lock(db):
+        return None
+    for model in (*ROLLUP_TABLES.values(), UsageRollupState):
+        await db.execute(delete(model))
+    return await roll_up(db, now, lag_seconds)
@@ -1,4 +1,5 @@
 import uuid
+from typing import Literal
 
 from fastapi import APIRouter
 from temporalio.client import Client
@@ -9,10 +10,13 @@ from app.core.exceptions import AppError
 from app.groups.service import get_user_membership
 from app.providers.registry import get_provider
 from app.usage import service as usage_service
+from app.usage.heavy_hitters import heavy_hitters, window_start
 from app.usage.schemas import (
     BurnRateResponse,
+    HeavyHitterResponse,
     TopUserResponse,
     UsageEventResponse,
+    UsageHistoryResponse,
     UsageRequest,
     UsageResponse,
 )
@@ -69,17 +73,20 @@ async def request_usage(
     )
 
 
-@router.get("/history/{group_id}", response_model=list[UsageEventResponse])
+@router.get("/history/{group_id}", response_model=UsageHistoryResponse)
 async def usage_history(
     group_id: uuid.UUID,
     db: DbSession,
     user: CurrentUser,
     limit: int = 50,
-    offset: int = 0,
-) -> list[UsageEventResponse]:
+    cursor: str | None = None,
+) -> UsageHistoryResponse:
     await get_user_membership(db, user.id, group_id)
-    events = await usage_service.get_usage_history(db, group_id, limit, offset)
-    return [UsageEventResponse.model_validate(e) for e in events]
+    page = await usage_service.get_usage_history(db, group_id, limit, cursor)
+    return UsageHistoryResponse(
+        items=[UsageEventResponse.model_validate(e) for e in page.items],
+        next_cursor=page.next_cursor,
+    )
 
 
 @router.get("/burn-rate/{group_id}", response_model=BurnRateResponse)
@@ -95,8 +102,41 @@ async def burn_rate(
 
 @router.get("/top-users/{group_id}", response_model=list[TopUserResponse])
 async def top_users(
-    group_id: uuid.UUID, db: DbSession, user: CurrentUser, limit: int = 10
+    group_id: uuid.UUID,
+    db: DbSession,
+    user: CurrentUser,
+    limit: int = 10,
+    window_hours: int = 24,
+    exact: bool = False,
 ) -> list[TopUserResponse]:
+    """
+    Top spenders over the last `window_hours` whole hours (including the
+    current one), from the heavy-hitter sketch; exact=true sums usage instead.
+    """
+    await get_user_membership(db, user.id, group_id)
+    heavy_hitters.check_window(window_hours)
+    if exact:
+        rows = await usage_service.get_top_users(
+            db, group_id, limit, since=window_start(window_hours)
+        )
+        return [TopUserResponse(user_id=uid, total_credits=tc) for uid, tc in rows]
+    hitters = await heavy_hitters.top(db, group_id, "user", limit, window_hours)
+    return [
+        TopUserResponse(user_id=uuid.UUID(h.key), total_credits=h.count, error=h.error)
+        for h in hitters
+    ]
+
+
+@router.get("/heavy-hitters/{group_id}", response_model=list[HeavyHitterResponse])
+async def top_keys(
+    group_id: uuid.UUID,
+    db: DbSession,
+    user: CurrentUser,
+    dimension: Literal["user", "agent", "model"] = "agent",
+    limit: int = 10,
+    window_hours: int = 24,
+) -> list[HeavyHitterResponse]:
+    """Approximate top users, agents or models by credits over the last `window_hours`."""
     await get_user_membership(db, user.id, group_id)
-    rows = await usage_service.get_top_users(db, group_id, limit)
-    return [TopUserResponse(user_id=uid, total_credits=tc) for uid, tc in rows]
+    hitters = await heavy_hitters.top(db, group_id, dimension, limit, window_hours)
+    return [HeavyHitterResponse(key=h.key, credits=h.count, error=h.error) for h in hitters]
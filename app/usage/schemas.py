@@ -4,6 +4,8 @@ from decimal import Decimal
 
 from pydantic import BaseModel
 
+from app.budgets.models import BudgetLevel, BudgetPeriod
+
 
 class UsageRequest(BaseModel):
     group_id: uuid.UUID
@@ -37,10 +39,9 @@ class UsageEventResponse(BaseModel):
     created_at: datetime
 
 
-class UsageHistoryParams(BaseModel):
-    group_id: uuid.UUID
-    limit: int = 50
-    offset: int = 0
+class UsageHistoryResponse(BaseModel):
+    items: list[UsageEventResponse]
+    next_cursor: str | None = None  # pass as ?cursor= for the next page
 
 
 class BurnRateResponse(BaseModel):
@@ -52,3 +53,46 @@ class BurnRateResponse(BaseModel):
 class TopUserResponse(BaseModel):
     user_id: uuid.UUID
     total_credits: int
+    # Sketch answers overstate total_credits by at most this much (0 when exact)
+    error: int = 0
+
+
+class HeavyHitterResponse(BaseModel):
+    key: str  # user id, agent id or model name
+    credits: int
+    error: int
+
+
+class BalanceForecastResponse(BaseModel):
+    model_config = {"from_attributes": True}
+
+    group_id: uuid.UUID
+    available_credits: int
+    credits_per_hour: float
+    exhausts_at: datetime | None
+
+
+class BudgetForecastResponse(BaseModel):
+    model_config = {"from_attributes": True}
+
+    budget_id: uuid.UUID
+    level: BudgetLevel
+    target_id: uuid.UUID
+    period: BudgetPeriod
+    limit_credits: int
+    spent_credits: int
+    remaining_credits: int
+    credits_per_hour: float
+    period_ends_at: datetime | None
+    exhausts_at: datetime | None  # null = not before the period resets
+
+
+class OrgForecastResponse(BaseModel):
+    model_config = {"from_attributes": True}
+
+    org_id: uuid.UUID
+    generated_at: datetime
+    window_hours: int
+    half_life_hours: float
+    balance: BalanceForecastResponse
+    budgets: list[BudgetForecastResponse]
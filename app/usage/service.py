@@ -2,14 +2,15 @@ import uuid
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
-from sqlalchemy import func, select
+from sqlalchemy import and_, func, or_, select, union_all
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.usage.models import UsageEvent
+from app.core.pagination import Page, paginate
+from app.usage.models import UsageEvent, UsageRollupDaily, UsageRollupHourly
+from app.usage.rollups import high_water_mark
 
 
-async def record_usage_event(
-    db: AsyncSession,
+def build_usage_event(
     user_id: uuid.UUID,
     group_id: uuid.UUID,
     provider: str,
@@ -19,15 +20,22 @@ async def record_usage_event(
     cost_usd: Decimal,
     credits_charged: int,
     agent_id: uuid.UUID | None = None,
+    agent_group_id: uuid.UUID | None = None,
+    workspace_id: uuid.UUID | None = None,
+    org_id: uuid.UUID | None = None,
     latency_ms: int | None = None,
     status: str = "SUCCESS",
     error_message: str | None = None,
 ) -> UsageEvent:
+    """A new, not yet added usage event (for callers that insert it themselves)."""
     from app.usage.models import UsageStatus
-    event = UsageEvent(
+    return UsageEvent(
         user_id=user_id,
         group_id=group_id,
         agent_id=agent_id,
+        agent_group_id=agent_group_id,
+        workspace_id=workspace_id,
+        org_id=org_id,
         provider=provider,
         model=model,
         input_tokens=input_tokens,
@@ -39,56 +47,151 @@ async def record_usage_event(
         status=UsageStatus(status),
         error_message=error_message,
     )
+
+
+async def record_usage_event(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    group_id: uuid.UUID,
+    provider: str,
+    model: str,
+    input_tokens: int,
+    output_tokens: int,
+    cost_usd: Decimal,
+    credits_charged: int,
+    agent_id: uuid.UUID | None = None,
+    agent_group_id: uuid.UUID | None = None,
+    workspace_id: uuid.UUID | None = None,
+    org_id: uuid.UUID | None = None,
+    latency_ms: int | None = None,
+    status: str = "SUCCESS",
+    error_message: str | None = None,
+) -> UsageEvent:
+    event = build_usage_event(
+        user_id=user_id,
+        group_id=group_id,
+        provider=provider,
+        model=model,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cost_usd=cost_usd,
+        credits_charged=credits_charged,
+        agent_id=agent_id,
+        agent_group_id=agent_group_id,
+        workspace_id=workspace_id,
+        org_id=org_id,
+        latency_ms=latency_ms,
+        status=status,
+        error_message=error_message,
+    )
     db.add(event)
     await db.flush()
     return event
 
 
 async def get_usage_history(
-    db: AsyncSession, group_id: uuid.UUID, limit: int = 50, offset: int = 0
-) -> list[UsageEvent]:
-    result = await db.execute(
-        select(UsageEvent)
-        .where(UsageEvent.group_id == group_id)
-        .order_by(UsageEvent.created_at.desc())
-        .limit(limit)
-        .offset(offset)
+    db: AsyncSession, group_id: uuid.UUID, limit: int = 50, cursor: str | None = None
+) -> Page[UsageEvent]:
+    """Newest first; pass the returned next_cursor to get the following page."""
+    return await paginate(
+        db,
+        select(UsageEvent).where(UsageEvent.group_id == group_id),
+        UsageEvent,
+        limit=limit,
+        cursor=cursor,
     )
-    return list(result.scalars().all())
+
+
+def _next_hour(at: datetime) -> datetime:
+    hour = at.replace(minute=0, second=0, microsecond=0)
+    return hour if hour == at else hour + timedelta(hours=1)
 
 
 async def get_burn_rate(
     db: AsyncSession, group_id: uuid.UUID
 ) -> tuple[int, int]:
-    """Returns (credits_last_24h, credits_last_7d)."""
+    """Returns (credits_last_24h, credits_last_7d).
+
+    Whole hours come from usage_rollups_hourly. usage_events is read only
+    for the part-hour at the start of each window and for events past the
+    rollup high-water mark, in the same statement (see app.usage.rollups).
+    """
     now = datetime.now(timezone.utc)
+    since_24h, since_7d = now - timedelta(hours=24), now - timedelta(days=7)
+    hour_24h, hour_7d = _next_hour(since_24h), _next_hour(since_7d)
+    mark = high_water_mark()
 
-    async def _sum_since(since: datetime) -> int:
-        result = await db.execute(
-            select(func.coalesce(func.sum(UsageEvent.credits_charged), 0)).where(
-                UsageEvent.group_id == group_id,
-                UsageEvent.created_at >= since,
-            )
+    rolled = select(
+        func.sum(UsageRollupHourly.credits_charged)
+        .filter(UsageRollupHourly.bucket_start >= hour_24h)
+        .label("last_24h"),
+        func.sum(UsageRollupHourly.credits_charged).label("last_7d"),
+    ).where(
+        UsageRollupHourly.group_id == group_id,
+        UsageRollupHourly.bucket_start >= hour_7d,
+    )
+    created_at = UsageEvent.created_at
+    raw_24h = and_(created_at >= since_24h, or_(created_at < hour_24h, created_at >= mark))
+    raw_7d = or_(created_at < hour_7d, created_at >= mark)
+    raw = select(
+        func.sum(UsageEvent.credits_charged).filter(raw_24h).label("last_24h"),
+        func.sum(UsageEvent.credits_charged).filter(raw_7d).label("last_7d"),
+    ).where(
+        UsageEvent.group_id == group_id,
+        created_at >= since_7d,
+        or_(raw_7d, raw_24h),
+    )
+    both = union_all(rolled, raw).subquery()
+    result = await db.execute(
+        select(
+            func.coalesce(func.sum(both.c.last_24h), 0),
+            func.coalesce(func.sum(both.c.last_7d), 0),
         )
-        return int(result.scalar_one())
-
-    last_24h = await _sum_since(now - timedelta(hours=24))
-    last_7d = await _sum_since(now - timedelta(days=7))
-    return last_24h, last_7d
+    )
+    last_24h, last_7d = result.one()
+    return int(last_24h), int(last_7d)
 
 
 async def get_top_users(
-    db: AsyncSession, group_id: uuid.UUID, limit: int = 10
+    db: AsyncSession,
+    group_id: uuid.UUID,
+    limit: int = 10,
+    since: datetime | None = None,
 ) -> list[tuple[uuid.UUID, int]]:
-    """Returns list of (user_id, total_credits) sorted desc."""
-    result = await db.execute(
-        select(
-            UsageEvent.user_id,
-            func.sum(UsageEvent.credits_charged).label("total"),
-        )
-        .where(UsageEvent.group_id == group_id)
+    """Returns list of (user_id, total_credits) sorted desc, all-time or since `since`.
+
+    Exact: daily rollups (hourly from `since` on, with the part-hour before
+    the first whole one read raw) plus the raw events past the high-water mark.
+    """
+    mark = high_water_mark()
+    if since is None:
+        rollup = UsageRollupDaily
+        rolled_window = []
+        raw_window = [UsageEvent.created_at >= mark]
+    else:
+        rollup = UsageRollupHourly
+        first_hour = _next_hour(since)
+        rolled_window = [rollup.bucket_start >= first_hour]
+        raw_window = [
+            UsageEvent.created_at >= since,
+            or_(UsageEvent.created_at < first_hour, UsageEvent.created_at >= mark),
+        ]
+    rolled = (
+        select(rollup.user_id, func.sum(rollup.credits_charged).label("credits"))
+        .where(rollup.group_id == group_id, *rolled_window)
+        .group_by(rollup.user_id)
+    )
+    raw = (
+        select(UsageEvent.user_id, func.sum(UsageEvent.credits_charged).label("credits"))
+        .where(UsageEvent.group_id == group_id, *raw_window)
         .group_by(UsageEvent.user_id)
-        .order_by(func.sum(UsageEvent.credits_charged).desc())
+    )
+    both = union_all(rolled, raw).subquery()
+    total = func.sum(both.c.credits)
+    result = await db.execute(
+        select(both.c.user_id, total.label("total"))
+        .group_by(both.c.user_id)
+        .order_by(total.desc())
         .limit(limit)
     )
     return [(row.user_id, int(row.total)) for row in result.all()]
@@ -14,6 +14,7 @@ from app.db.session import async_session_factory
 from app.ledger import service as ledger_service
 from app.pricing import service as pricing_service
 from app.usage import service as usage_service
+from app.usage.heavy_hitters import heavy_hitters
 
 
 @dataclass
@@ -64,6 +65,7 @@ class RecordUsageInput:
 
 @activity.defn
 async def fetch_pricing(input: FetchPricingInput) -> FetchPricingOutput:
+    """Served from the in-memory pricing table; the session is only used on refresh."""
     async with async_session_factory() as db:
         rule = await pricing_service.get_pricing_rule(db, input.provider, input.model)
         return FetchPricingOutput(
@@ -92,7 +94,7 @@ async def check_balance_and_limits(input: CheckBalanceInput) -> bool:
     """Check if group has sufficient balance. Returns True if OK."""
     group_id = uuid.UUID(input.group_id)
     async with async_session_factory() as db:
-        balance = await ledger_service.get_group_balance(db, group_id)
+        balance = await ledger_service.get_available_balance(db, group_id)
         # Extension point: check per-user limits, group spend caps, etc.
         return balance >= input.required_credits
 
@@ -101,39 +103,43 @@ async def check_balance_and_limits(input: CheckBalanceInput) -> bool:
 async def record_usage_and_deduct(input: RecordUsageInput) -> str:
     """
     Atomic operation: record usage event + deduct credits.
-    Both happen in a single DB transaction.
-    Returns the usage event ID.
+    Both happen in a single DB transaction, shared with concurrent deductions
+    for the same group (group commit — see ledger_service.DeductionBatcher).
+    Returns the usage event ID; a retried activity gets the original one back.
     """
     user_id = uuid.UUID(input.user_id)
     group_id = uuid.UUID(input.group_id)
 
-    async with async_session_factory() as db:
-        async with db.begin():
-            # Deduct credits (with advisory lock + idempotency check)
-            await ledger_service.deduct_credits(
-                db,
-                group_id=group_id,
-                amount=input.credits_charged,
-                idempotency_key=input.idempotency_key,
-                metadata={
-                    "provider": input.provider,
-                    "model": input.model,
-                    "input_tokens": input.input_tokens,
-                    "output_tokens": input.output_tokens,
-                },
-            )
-
-            # Record usage event
-            event = await usage_service.record_usage_event(
-                db,
-                user_id=user_id,
-                group_id=group_id,
-                provider=input.provider,
-                model=input.model,
-                input_tokens=input.input_tokens,
-                output_tokens=input.output_tokens,
-                cost_usd=Decimal(input.cost_usd),
-                credits_charged=input.credits_charged,
-            )
-
-        return str(event.id)
+    event = usage_service.build_usage_event(
+        user_id=user_id,
+        group_id=group_id,
+        provider=input.provider,
+        model=input.model,
+        input_tokens=input.input_tokens,
+        output_tokens=input.output_tokens,
+        cost_usd=Decimal(input.cost_usd),
+        credits_charged=input.credits_charged,
+    )
+    event.id = uuid.uuid4()
+
+    # Deduct credits (advisory lock + idempotency check, batched per group)
+    entry = await ledger_service.deduction_batcher.deduct(
+        group_id,
+        amount=input.credits_charged,
+        idempotency_key=input.idempotency_key,
+        metadata={
+            "provider": input.provider,
+            "model": input.model,
+            "input_tokens": input.input_tokens,
+            "output_tokens": input.output_tokens,
+            "usage_event_id": str(event.id),
+        },
+        # The usage event is only inserted with a new deduction, not on replay
+        attach=[event],
+    )
+    usage_event_id = (entry.metadata_ or {}).get("usage_event_id", str(event.id))
+    if usage_event_id == str(event.id):  # not a replay
+        heavy_hitters.record(
+            group_id, credits=input.credits_charged, user_id=user_id, model=input.model
+        )
+    return usage_event_id
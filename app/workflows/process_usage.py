@@ -49,13 +49,26 @@ class ProcessUsageResult:
 class ProcessUsageWorkflow:
     @workflow.run
     async def run(self, input: ProcessUsageInput) -> ProcessUsageResult:
-        # Step 1: Fetch pricing from DB
-        pricing: FetchPricingOutput = await workflow.execute_activity(
-            fetch_pricing,
-            FetchPricingInput(provider=input.provider, model=input.model),
-            start_to_close_timeout=timedelta(seconds=10),
-            retry_policy=workflow.RetryPolicy(maximum_attempts=3),
-        )
+        # Step 1: Fetch pricing from the worker's in-memory pricing table.
+        # A local activity: no task-queue round trip for a dict lookup.
+        # Histories started before the switch recorded a regular activity and
+        # must replay one, so the old command stays behind the patch marker.
+        pricing_input = FetchPricingInput(provider=input.provider, model=input.model)
+        pricing_retry = workflow.RetryPolicy(maximum_attempts=3)
+        if workflow.patched("fetch-pricing-local"):
+            pricing: FetchPricingOutput = await workflow.execute_local_activity(
+                fetch_pricing,
+                pricing_input,
+                start_to_close_timeout=timedelta(seconds=10),
+                retry_policy=pricing_retry,
+            )
+        else:
+            pricing = await workflow.execute_activity(
+                fetch_pricing,
+                pricing_input,
+                start_to_close_timeout=timedelta(seconds=10),
+                retry_policy=pricing_retry,
+            )
 
         # Step 2: Calculate cost (tokens → USD → credits)
         cost: CalculateCostOutput = await workflow.execute_activity(
@@ -5,6 +5,10 @@ from temporalio.client import Client
 from temporalio.worker import Worker
 
 from app.config import settings
+from app.db.session import async_session_factory
+from app.ledger.service import deduction_batcher
+from app.pricing.registry import pricing_registry
+from app.usage.heavy_hitters import heavy_hitters
 from app.workflows.activities import (
     calculate_cost,
     check_balance_and_limits,
@@ -14,7 +18,17 @@ from app.workflows.activities import (
 from app.workflows.process_usage import ProcessUsageWorkflow
 
 
+async def shutdown() -> None:
+    """Settle queued deductions, then persist heavy-hitter deltas."""
+    await deduction_batcher.drain()
+    await heavy_hitters.close()
+
+
 async def main() -> None:
+    # fetch_pricing runs as a local activity against the in-memory table.
+    async with async_session_factory() as db:
+        await pricing_registry.load(db)
+
     client = await Client.connect(settings.temporal_host)
 
     worker = Worker(
@@ -30,7 +44,10 @@ async def main() -> None:
     )
 
     print(f"Worker started on task queue: {settings.temporal_task_queue}")
-    await worker.run()
+    try:
+        await worker.run()
+    finally:
+        await shutdown()
 
 
 if __name__ == "__main__":
@@ -11,11 +11,12 @@ import type {
   GatewayResponse,
   Group,
   LedgerEntry,
+  OrgForecast,
   Organization,
   Policy,
   PricingRule,
   TopUser,
-  UsageEvent,
+  UsageHistoryPage,
   UsageResponse,
   User,
   Workspace,
@@ -91,8 +92,11 @@ export const usageApi = {
       messages: [{ role: "user", content: message }],
       request_id: crypto.randomUUID(),
     }),
-  history: (groupId: string, limit = 20, offset = 0) =>
-    request<UsageEvent[]>("GET", `/usage/history/${groupId}?limit=${limit}&offset=${offset}`),
+  history: (groupId: string, limit = 20, cursor?: string) =>
+    request<UsageHistoryPage>(
+      "GET",
+      `/usage/history/${groupId}?limit=${limit}${cursor ? `&cursor=${encodeURIComponent(cursor)}` : ""}`,
+    ),
   burnRate: (groupId: string) =>
     request<BurnRate>("GET", `/usage/burn-rate/${groupId}`),
   topUsers: (groupId: string) =>
@@ -113,6 +117,7 @@ export const orgsApi = {
     request<Organization>("POST", "/orgs", { name, description }),
   balance: (orgId: string) =>
     request<{ org_id: string; balance: number }>("GET", `/orgs/${orgId}/balance`),
+  forecast: (orgId: string) => request<OrgForecast>("GET", `/orgs/${orgId}/forecast`),
 };
 
 // --- Workspaces ---
@@ -174,6 +179,8 @@ type PolicyCreatePayload = {
   max_input_tokens?: number | null;
   max_output_tokens?: number | null;
   rpm_limit?: number | null;
+  tpm_limit?: number | null;
+  max_concurrent_requests?: number | null;
   org_id?: string;
   workspace_id?: string;
   agent_group_id?: string;
@@ -47,7 +47,7 @@ export default function DashboardPage() {
       setBalance(bal.balance);
       setBurnRate(burn);
       setTopUsers(top);
-      setRecentUsage(usage);
+      setRecentUsage(usage.items);
     } catch {
       // ignore
     } finally {
@@ -124,7 +124,7 @@ export default function DashboardPage() {
             {/* Top Users */}
             <div className="bg-white rounded-xl border border-gray-200 p-6">
               <h3 className="text-sm font-semibold text-gray-700 mb-4">
-                Top Users by Spend
+                Top Users by Spend (24h)
               </h3>
               {topUsers.length === 0 ? (
                 <p className="text-sm text-gray-400">No usage yet.</p>
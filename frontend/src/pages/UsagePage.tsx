@@ -21,8 +21,8 @@ export default function UsagePage() {
   const loadHistory = useCallback(async (groupId: string) => {
     setHistoryLoading(true);
     try {
-      const events = await usageApi.history(groupId, 20);
-      setHistory(events);
+      const page = await usageApi.history(groupId, 20);
+      setHistory(page.items);
     } finally {
       setHistoryLoading(false);
     }
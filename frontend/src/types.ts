@@ -43,6 +43,11 @@ export interface UsageEvent {
   created_at: string;
 }
 
+export interface UsageHistoryPage {
+  items: UsageEvent[];
+  next_cursor: string | null;
+}
+
 export interface UsageResponse {
   request_id: string;
   response: string;
@@ -60,6 +65,7 @@ export interface BurnRate {
 export interface TopUser {
   user_id: string;
   total_credits: number;
+  error: number; // approximate answers overstate total_credits by at most this
 }
 
 export interface PricingRule {
@@ -171,6 +177,8 @@ export interface Policy {
   max_input_tokens: number | null;
   max_output_tokens: number | null;
   rpm_limit: number | null;
+  tpm_limit: number | null;
+  max_concurrent_requests: number | null;
   is_active: boolean;
   created_at: string;
 }
@@ -189,3 +197,32 @@ export interface Budget {
   is_active: boolean;
   created_at: string;
 }
+
+export interface BalanceForecast {
+  group_id: string;
+  available_credits: number;
+  credits_per_hour: number;
+  exhausts_at: string | null;
+}
+
+export interface BudgetForecast {
+  budget_id: string;
+  level: "ORG" | "WORKSPACE" | "AGENT_GROUP" | "AGENT";
+  target_id: string;
+  period: BudgetPeriod;
+  limit_credits: number;
+  spent_credits: number;
+  remaining_credits: number;
+  credits_per_hour: number;
+  period_ends_at: string | null;
+  exhausts_at: string | null;
+}
+
+export interface OrgForecast {
+  org_id: string;
+  generated_at: string;
+  window_hours: number;
+  half_life_hours: number;
+  balance: BalanceForecast;
+  budgets: BudgetForecast[];
+}
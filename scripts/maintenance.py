@@ -0,0 +1,294 @@
+"""Ledger maintenance tasks. Run with: python -m scripts.maintenance <command>
+
+Commands:
+  checkpoint     Append balance checkpoints for groups with a long uncovered tail
+  verify         Recompute balances and checkpoints from the raw ledger
+  expire-holds   Mark abandoned credit holds as EXPIRED
+  rebuild-spend-counters
+                 Repopulate budget spend counters from usage_events
+  shards         Set how many ledger shards a billing group is split across
+  rebalance      Even out credits across the shards of sharded groups
+  partitions     Create upcoming monthly partitions (create) or detach
+                 expired usage/audit partitions (detach)
+  rollup         Fold new usage events into the hourly/daily rollups
+  export         Write usage events or ledger entries to a Parquet/Arrow file
+"""
+import argparse
+import asyncio
+import sys
+import uuid
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app.budgets import service as budget_service
+from app.config import settings
+from app.db import partitions as partition_service
+from app.db.session import async_session_factory
+from app.exports import service as export_service
+from app.groups.models import Group
+from app.ledger import service as ledger_service
+from app.usage import rollups as rollup_service
+
+
+async def _group_ids(group_id: str | None) -> list[uuid.UUID]:
+    if group_id:
+        return [uuid.UUID(group_id)]
+    async with async_session_factory() as db:
+        result = await db.execute(select(Group.id))
+        return list(result.scalars().all())
+
+
+async def checkpoint(group_id: str | None, min_entries: int | None) -> int:
+    created = 0
+    for gid in await _group_ids(group_id):
+        async with async_session_factory() as db:
+            async with db.begin():
+                shards = await ledger_service.get_shard_count(db, gid)
+                # Whole-group checkpoint, plus one per shard for sharded groups
+                checkpoints = [
+                    await ledger_service.create_checkpoint(
+                        db, gid, min_entries=min_entries, shard=shard
+                    )
+                    for shard in ([None] + list(range(shards)) if shards > 1 else [None])
+                ]
+        for cp in checkpoints:
+            if cp is None:
+                continue
+            created += 1
+            label = "" if cp.shard is None else f" shard={cp.shard}"
+            print(
+                f"  Checkpoint: group={gid}{label} as_of={cp.as_of.isoformat()} "
+                f"balance={cp.balance}"
+            )
+    print(f"Checkpoints created: {created}")
+    return 0
+
+
+async def verify(group_id: str | None) -> int:
+    failures = 0
+    for gid in await _group_ids(group_id):
+        async with async_session_factory() as db:
+            result = await ledger_service.verify_balance(db, gid)
+        if result.consistent:
+            continue
+        failures += 1
+        print(
+            f"  MISMATCH group={gid} balance={result.balance} "
+            f"recomputed={result.recomputed_balance}"
+        )
+        for m in result.mismatches:
+            print(
+                f"    checkpoint={m.checkpoint_id} as_of={m.as_of.isoformat()} "
+                f"stored={m.stored_balance}/{m.stored_entry_count} "
+                f"actual={m.actual_balance}/{m.actual_entry_count}"
+            )
+    print(f"Groups with mismatches: {failures}")
+    return 1 if failures else 0
+
+
+async def expire_holds() -> int:
+    async with async_session_factory() as db:
+        async with db.begin():
+            expired = await ledger_service.expire_holds(db)
+    print(f"Holds expired: {expired}")
+    return 0
+
+
+async def rebuild_spend_counters() -> int:
+    async with async_session_factory() as db:
+        async with db.begin():
+            written = await budget_service.rebuild_spend_counters(db)
+    print(f"Spend counters written: {written}")
+    return 0
+
+
+async def set_shards(group_id: str, count: int) -> int:
+    async with async_session_factory() as db:
+        async with db.begin():
+            moved = await ledger_service.set_shard_count(db, uuid.UUID(group_id), count)
+    print(f"Group {group_id}: {count} shard(s), {moved} credits moved")
+    return 0
+
+
+async def rebalance(group_id: str | None) -> int:
+    moved_total = 0
+    for gid in await _group_ids(group_id):
+        async with async_session_factory() as db:
+            async with db.begin():
+                moved = await ledger_service.rebalance_shards(db, gid)
+        if moved:
+            moved_total += moved
+            print(f"  Rebalanced: group={gid} moved={moved}")
+    print(f"Credits moved: {moved_total}")
+    return 0
+
+
+async def create_partitions(months_ahead: int | None) -> int:
+    async with async_session_factory() as db:
+        async with db.begin():
+            created = await partition_service.create_partitions(db, months_ahead)
+            stray = await partition_service.default_partition_rows(db)
+    for partition in created:
+        print(f"  Created: {partition.name} [{partition.start.date()}, {partition.end.date()})")
+    print(f"Partitions created: {len(created)}")
+    failures = 0
+    for table, rows in stray.items():
+        if rows:
+            failures += 1
+            print(f"  WARNING {table}_default holds {rows} rows; move them into monthly partitions")
+    return 1 if failures else 0
+
+
+async def detach_partitions(retention_months: int, archive_schema: str | None) -> int:
+    if retention_months < 1:
+        print("Retention not configured (PARTITION_RETENTION_MONTHS / --retention-months)")
+        return 1
+    async with async_session_factory() as db:
+        async with db.begin():
+            detached = await partition_service.detach_expired_partitions(
+                db, retention_months, archive_schema=archive_schema
+            )
+    where = f" -> {archive_schema}" if archive_schema else ""
+    for partition in detached:
+        print(f"  Detached: {partition.name}{where}")
+    print(f"Partitions detached: {len(detached)}")
+    return 0
+
+
+async def rollup(rebuild: bool) -> int:
+    async with async_session_factory() as db:
+        async with db.begin():
+            if rebuild:
+                run = await rollup_service.rebuild_rollups(db)
+            else:
+                run = await rollup_service.roll_up(db)
+    if run is None:
+        print("Rollups: nothing to do (up to date, or another run holds the lock)")
+        return 0
+    start = run.start.isoformat() if run.start else "beginning"
+    print(f"Rollups: {run.events} events in [{start}, {run.end.isoformat()})")
+    return 0
+
+
+async def export(
+    kind: str,
+    fmt: str,
+    output: str,
+    org_id: str | None,
+    group_id: str | None,
+    start: str | None,
+    end: str | None,
+) -> int:
+    written = 0
+    with open(output, "wb") as f:
+        async for chunk in export_service.stream_export(
+            kind,
+            fmt,
+            org_id=uuid.UUID(org_id) if org_id else None,
+            group_id=uuid.UUID(group_id) if group_id else None,
+            start=datetime.fromisoformat(start) if start else None,
+            end=datetime.fromisoformat(end) if end else None,
+        ):
+            f.write(chunk)
+            written += len(chunk)
+    print(f"Export: {kind} -> {output} ({written} bytes)")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m scripts.maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_checkpoint = sub.add_parser("checkpoint", help="append balance checkpoints")
+    p_checkpoint.add_argument("--group", help="only this group id")
+    p_checkpoint.add_argument(
+        "--min-entries", type=int, default=None,
+        help="minimum uncovered entries (default: LEDGER_CHECKPOINT_MIN_ENTRIES)",
+    )
+
+    p_verify = sub.add_parser("verify", help="recompute balances from scratch")
+    p_verify.add_argument("--group", help="only this group id")
+
+    sub.add_parser("expire-holds", help="expire abandoned credit holds")
+    sub.add_parser(
+        "rebuild-spend-counters",
+        help="recompute budget spend counters (drain gateway traffic first)",
+    )
+
+    p_shards = sub.add_parser("shards", help="set a group's ledger shard count")
+    p_shards.add_argument("--group", required=True, help="billing group id")
+    p_shards.add_argument(
+        "--count", type=int, required=True,
+        help=f"number of shards (1-{ledger_service.MAX_LEDGER_SHARDS}; 1 = unsharded)",
+    )
+
+    p_rebalance = sub.add_parser("rebalance", help="even out credits across shards")
+    p_rebalance.add_argument("--group", help="only this group id")
+
+    p_partitions = sub.add_parser("partitions", help="manage monthly table partitions")
+    partition_sub = p_partitions.add_subparsers(dest="action", required=True)
+    p_create = partition_sub.add_parser("create", help="create upcoming monthly partitions")
+    p_create.add_argument(
+        "--months-ahead", type=int, default=None,
+        help="months beyond the current one (default: PARTITION_MONTHS_AHEAD)",
+    )
+    p_detach = partition_sub.add_parser(
+        "detach", help="detach usage_events/audit_logs partitions past retention"
+    )
+    p_detach.add_argument(
+        "--retention-months", type=int, default=settings.partition_retention_months,
+        help="keep this many whole months before the current one "
+        "(default: PARTITION_RETENTION_MONTHS)",
+    )
+    p_detach.add_argument(
+        "--archive-schema", default=None,
+        help="move detached partitions into this schema instead of leaving them in place",
+    )
+
+    p_rollup = sub.add_parser("rollup", help="fold new usage events into the rollups")
+    p_rollup.add_argument(
+        "--rebuild", action="store_true",
+        help="recompute the rollups from every attached usage_events partition",
+    )
+
+    p_export = sub.add_parser("export", help="export rows as Parquet or Arrow (needs pyarrow)")
+    p_export.add_argument("kind", choices=sorted(export_service.EXPORTS))
+    p_export.add_argument("--output", required=True, help="file to write")
+    p_export.add_argument("--format", choices=sorted(export_service.FORMATS), default="parquet")
+    p_export.add_argument("--org", help="only this org's usage events")
+    p_export.add_argument("--group", help="only this billing group (default: every group)")
+    p_export.add_argument("--start", help="ISO 8601, inclusive")
+    p_export.add_argument("--end", help="ISO 8601, exclusive")
+
+    args = parser.parse_args(argv)
+    if args.command == "checkpoint":
+        return asyncio.run(checkpoint(args.group, args.min_entries))
+    if args.command == "verify":
+        return asyncio.run(verify(args.group))
+    if args.command == "rebuild-spend-counters":
+        return asyncio.run(rebuild_spend_counters())
+    if args.command == "shards":
+        return asyncio.run(set_shards(args.group, args.count))
+    if args.command == "rebalance":
+        return asyncio.run(rebalance(args.group))
+    if args.command == "partitions":
+        if args.action == "create":
+            return asyncio.run(create_partitions(args.months_ahead))
+        return asyncio.run(detach_partitions(args.retention_months, args.archive_schema))
+    if args.command == "rollup":
+        return asyncio.run(rollup(args.rebuild))
+    if args.command == "export":
+        if not export_service.pyarrow_available():
+            print("Export requires pyarrow: pip install '.[export]'")
+            return 1
+        return asyncio.run(
+            export(
+                args.kind, args.format, args.output, args.org, args.group, args.start, args.end
+            )
+        )
+    return asyncio.run(expire_holds())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
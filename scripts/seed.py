@@ -6,6 +6,8 @@ from sqlalchemy import select
 
 from app.db.session import async_session_factory
 from app.pricing.models import PricingRule
+from app.pricing.registry import pricing_registry
+from app.pricing.service import set_pricing_rule
 
 PRICING_DATA = [
     # OpenAI models
@@ -27,19 +29,13 @@ async def main() -> None:
                 )
             )
             if result.scalar_one_or_none() is None:
-                db.add(
-                    PricingRule(
-                        provider=provider,
-                        model=model,
-                        input_cost_per_1k=input_cost,
-                        output_cost_per_1k=output_cost,
-                    )
-                )
+                await set_pricing_rule(db, provider, model, input_cost, output_cost)
                 print(f"  Added: {provider}/{model}")
             else:
                 print(f"  Exists: {provider}/{model}")
 
         await db.commit()
+    pricing_registry.invalidate()
     print("Seeding complete.")
 
 
@@ -3,6 +3,7 @@ Test fixtures using async SQLite for fast, isolated tests.
 No PostgreSQL required for unit tests.
 """
 import uuid
+from dataclasses import dataclass
 from decimal import Decimal
 
 import pytest
@@ -24,6 +25,33 @@ from app.credentials.models import ProviderCredential  # noqa: F401
 from app.policies.models import Policy  # noqa: F401
 from app.budgets.models import Budget  # noqa: F401
 from app.audit.models import AuditLog  # noqa: F401
+from app.credentials.service import clear_credential_cache
+from app.gateway.context import clear_agent_contexts
+from app.ledger.service import clear_shard_counts
+from app.policies.service import clear_effective_policies
+from app.pricing.registry import pricing_registry
+from app.providers.tokens import clear_token_estimates
+from app.usage.forecast import clear_forecasts
+from app.usage.heavy_hitters import heavy_hitters
+
+
+def _clear_caches() -> None:
+    clear_agent_contexts()
+    clear_credential_cache()
+    clear_effective_policies()
+    clear_shard_counts()
+    pricing_registry.clear()
+    clear_token_estimates()
+    clear_forecasts()
+    heavy_hitters.clear()
+
+
+@pytest.fixture(autouse=True)
+def _reset_process_caches():
+    """Process-wide caches must not leak between per-test databases."""
+    _clear_caches()
+    yield
+    _clear_caches()
 
 
 @pytest_asyncio.fixture
@@ -42,6 +70,12 @@ async def db():
     await engine.dispose()
 
 
+@pytest.fixture
+def session_factory(db: AsyncSession) -> async_sessionmaker[AsyncSession]:
+    """Sessions on the test database, for code that opens its own sessions."""
+    return async_sessionmaker(db.bind, class_=AsyncSession, expire_on_commit=False)
+
+
 @pytest_asyncio.fixture
 async def sample_group(db: AsyncSession) -> tuple[uuid.UUID, uuid.UUID]:
     """Create a user and a group, return (group_id, user_id)."""
@@ -75,3 +109,65 @@ async def pricing_rule(db: AsyncSession) -> PricingRule:
     await db.commit()
     await db.refresh(rule)
     return rule
+
+
+@dataclass
+class AgentHierarchy:
+    user: User
+    billing_group: Group
+    org: Organization
+    workspace: Workspace
+    agent_group: AgentGroup
+    agent: Agent
+    api_key: ApiKey
+    plaintext_key: str
+
+
+@pytest_asyncio.fixture
+async def agent_hierarchy(db: AsyncSession) -> AgentHierarchy:
+    """Create User → Org (+ billing group) → Workspace → AgentGroup → Agent → ApiKey."""
+    from app.agents.service import create_api_key
+    from app.core.security import hash_password
+
+    user = User(email="agent-owner@example.com", hashed_password=hash_password("password"))
+    db.add(user)
+    await db.flush()
+
+    billing_group = Group(name="[Billing] Agent Org", owner_id=user.id)
+    db.add(billing_group)
+    await db.flush()
+
+    org = Organization(
+        name="Agent Org",
+        slug="agent-org",
+        owner_id=user.id,
+        billing_group_id=billing_group.id,
+    )
+    db.add(org)
+    await db.flush()
+
+    workspace = Workspace(org_id=org.id, name="WS", slug="ws")
+    db.add(workspace)
+    await db.flush()
+
+    agent_group = AgentGroup(workspace_id=workspace.id, name="AG")
+    db.add(agent_group)
+    await db.flush()
+
+    agent = Agent(agent_group_id=agent_group.id, name="Agent")
+    db.add(agent)
+    await db.flush()
+
+    api_key, plaintext = await create_api_key(db, agent_id=agent.id, name="default")
+    await db.commit()
+
+    return AgentHierarchy(
+        user=user,
+        billing_group=billing_group,
+        org=org,
+        workspace=workspace,
+        agent_group=agent_group,
+        agent=agent,
+        api_key=api_key,
+        plaintext_key=plaintext,
+    )
@@ -0,0 +1,673 @@
+"""Tests for the gateway hot path: cached hierarchy resolution and pre-flight."""
+import asyncio
+import json
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app.agent_groups.models import AgentGroup
+from app.agents.models import Agent, AgentStatus
+from app.agents.service import _hash_key, disable_agent, resolve_api_key, revoke_api_key
+from app.budgets.models import BudgetLevel, BudgetPeriod
+from app.budgets.service import TOTAL_PERIOD_START, get_period_spend, rebuild_spend_counters
+from app.core.cache import MISSING, TTLCache
+from app.db import session as db_session
+from app.db.session import count_statements
+from app.gateway import context as gateway_context
+from app.gateway.context import resolve_agent_context
+from app.gateway.preflight import load_preflight, resolve_preflight
+from app.gateway import settlement as gateway_settlement
+from app.gateway.settlement import Settlement, settle_usage
+from app.gateway.streaming import MeteredStream, MeteredStreamingResponse, StreamMeter
+from app.providers.base import StreamChunk
+from app.providers.tokens import estimate_prompt_tokens
+from app.ledger.models import TransactionType
+from app.ledger.service import (
+    append_entry,
+    get_available_balance,
+    get_group_balance,
+    place_hold,
+)
+from app.orgs.models import Organization
+from app.policies.models import Policy
+from app.policies.service import clear_effective_policies, get_effective_policy
+from app.pricing.models import PricingRule
+from app.pricing.registry import pricing_registry
+from app.providers import registry as provider_registry
+from app.providers.mock import MockProvider
+from app.usage.models import UsageEvent, UsageStatus
+from app.workspaces.models import Workspace
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" is now most recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.core.cache.time.monotonic", lambda: now[0])
+    cache: TTLCache[str, int] = TTLCache(maxsize=10, ttl_seconds=5)
+    cache.set("a", 1)
+    now[0] += 4
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a") is MISSING
+
+
+@pytest.mark.asyncio
+async def test_agent_context_snapshot_is_cached(db, agent_hierarchy):
+    h = agent_hierarchy
+    ctx = await resolve_agent_context(db, h.plaintext_key)
+
+    assert ctx is not None
+    assert ctx.agent_id == h.agent.id
+    assert ctx.org_id == h.org.id
+    assert ctx.billing_group_id == h.billing_group.id
+    assert ctx.agent_status == AgentStatus.ACTIVE
+
+    async def _no_db(*args, **kwargs):
+        raise AssertionError("cache hit must not query the database")
+
+    monkey_db = type("NoDb", (), {"execute": _no_db})()
+    assert await resolve_agent_context(monkey_db, h.plaintext_key) is ctx
+
+
+@pytest.mark.asyncio
+async def test_revoke_and_disable_invalidate_cached_context(db, agent_hierarchy):
+    h = agent_hierarchy
+    assert await resolve_agent_context(db, h.plaintext_key) is not None
+
+    await disable_agent(db, h.agent.id, reason="manual")
+    # Not before the commit: a concurrent request could re-cache the old row
+    assert len(gateway_context._context_cache) == 1
+    await db.commit()
+    gateway_context.invalidate_agent_contexts(agent_id=h.agent.id)
+    ctx = await resolve_agent_context(db, h.plaintext_key)
+    assert ctx.agent_status == AgentStatus.DISABLED
+
+    key = await revoke_api_key(db, h.api_key.id, reason="test")
+    assert len(gateway_context._context_cache) == 1
+    await db.commit()
+    gateway_context.invalidate_agent_contexts(key_hash=key.key_hash)
+    assert await resolve_agent_context(db, h.plaintext_key) is None
+    assert len(gateway_context._context_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_preflight_statement_counts(db, agent_hierarchy, pricing_rule):
+    h = agent_hierarchy
+    db.add(Policy(name="org", org_id=h.org.id, allowed_models=["mock-model"]))
+    db.add(Policy(name="agent", agent_id=h.agent.id, max_output_tokens=128))
+    await db.commit()
+
+    # Legacy path: one statement per hop.
+    with count_statements(db.bind) as legacy:
+        key = await resolve_api_key(db, h.plaintext_key)
+        agent = (await db.execute(select(Agent).where(Agent.id == key.agent_id))).scalar_one()
+        group = (await db.execute(
+            select(AgentGroup).where(AgentGroup.id == agent.agent_group_id)
+        )).scalar_one()
+        ws = (await db.execute(
+            select(Workspace).where(Workspace.id == group.workspace_id)
+        )).scalar_one()
+        org = (await db.execute(
+            select(Organization).where(Organization.id == ws.org_id)
+        )).scalar_one()
+        legacy_policy = await get_effective_policy(db, org.id, ws.id, group.id, agent.id)
+        (await db.execute(
+            select(PricingRule).where(
+                PricingRule.provider == "mock", PricingRule.model == "mock-model"
+            )
+        )).scalar_one()
+    assert legacy.statements == 7
+
+    clear_effective_policies()
+    await pricing_registry.load(db)
+
+    # Pricing table loaded as at startup; hierarchy and policy caches cold.
+    with count_statements(db.bind) as cold:
+        preflight = await resolve_preflight(db, h.plaintext_key, "mock", "mock-model")
+    assert cold.statements == 1
+
+    # Hierarchy and compiled policy cached too — no database access at all.
+    with count_statements(db.bind) as warm:
+        cached = await resolve_preflight(db, h.plaintext_key, "mock", "mock-model")
+    assert warm.statements == 0
+
+    for result in (preflight, cached):
+        assert result.context.agent_id == h.agent.id
+        assert result.pricing_rule.id == pricing_rule.id
+        assert result.pricing_rule.output_cost_per_1k == pricing_rule.output_cost_per_1k
+        assert result.policy == legacy_policy
+        assert result.policy.max_output_tokens == 128
+
+
+@pytest.mark.asyncio
+async def test_preflight_without_policies_or_pricing(db, agent_hierarchy):
+    preflight = await load_preflight(
+        db, _hash_key(agent_hierarchy.plaintext_key), "mock", "unknown-model"
+    )
+    assert preflight is not None
+    assert preflight.pricing_rule is None
+    assert preflight.policy.allowed_models is None
+
+    assert await load_preflight(db, _hash_key("cpk_nope"), "mock", "mock-model") is None
+
+
+@pytest.mark.asyncio
+async def test_pricing_registry_serves_lookups_from_memory(db, pricing_rule):
+    from decimal import Decimal
+
+    from app.core.exceptions import NotFoundError
+    from app.pricing.service import get_pricing_rule
+
+    await pricing_registry.load(db)
+    version = pricing_registry.version
+
+    with count_statements(db.bind) as lookups:
+        rule = await get_pricing_rule(db, "mock", "mock-model")
+        with pytest.raises(NotFoundError):
+            await get_pricing_rule(db, "mock", "missing-model")
+    assert lookups.statements == 0
+    assert rule.input_cost_per_1k == Decimal("0.001")
+
+    # Unchanged table: the staleness check is one aggregate, no reload.
+    pricing_registry.invalidate()
+    with count_statements(db.bind) as check:
+        await get_pricing_rule(db, "mock", "mock-model")
+    assert check.statements == 1
+    assert pricing_registry.version == version
+
+    db.add(PricingRule(
+        provider="mock",
+        model="mock-large",
+        input_cost_per_1k=Decimal("0.01"),
+        output_cost_per_1k=Decimal("0.02"),
+    ))
+    await db.commit()
+    pricing_registry.invalidate()
+    assert (await get_pricing_rule(db, "mock", "mock-large")).model == "mock-large"
+    assert pricing_registry.version == version + 1
+
+
+async def test_pricing_registry_reloads_after_a_price_swap(db, pricing_rule):
+    from decimal import Decimal
+
+    from app.pricing.registry import PricingRegistry
+    from app.pricing.service import set_pricing_rule
+
+    await set_pricing_rule(db, "mock", "mock-large", Decimal("0.002"), Decimal("0.001"))
+    await db.commit()
+    # Another process: no invalidate() reaches it, only the fingerprint check.
+    other = PricingRegistry(refresh_interval_seconds=0)
+    await other.load(db)
+    version = other.version
+
+    # Swapping prices keeps the row count, newest row and price sums unchanged.
+    await set_pricing_rule(db, "mock", "mock-model", Decimal("0.002"), Decimal("0.001"))
+    await set_pricing_rule(db, "mock", "mock-large", Decimal("0.001"), Decimal("0.002"))
+    await db.commit()
+
+    await other.refresh_if_stale(db)
+    assert other.version == version + 1
+    assert other.lookup("mock", "mock-model").input_cost_per_1k == Decimal("0.002")
+    assert other.lookup("mock", "mock-large").input_cost_per_1k == Decimal("0.001")
+
+
+async def test_byok_providers_pooled_per_credential(monkeypatch):
+    monkeypatch.setattr(provider_registry.settings, "byok_provider_pool_size", 2)
+    try:
+        lease = await provider_registry.lease_provider("openai", "sk-one")
+        first = lease.provider
+        again = await provider_registry.lease_provider("openai", "sk-one")
+        assert again.provider is first
+        await again.release()
+        other = await provider_registry.lease_provider("openai", "sk-two")
+        assert other.provider is not first
+        await other.release()
+
+        # A third credential evicts the least recently used client, but an
+        # in-flight request still holds it: it stays open until released.
+        third = await provider_registry.lease_provider("anthropic", "sk-three")
+        await third.release()
+        assert not first._client.is_closed
+
+        # Re-leasing sk-one evicts sk-two, which nobody holds: closed at once.
+        replacement = await provider_registry.lease_provider("openai", "sk-one")
+        assert replacement.provider is not first
+        await replacement.release()
+        assert other.provider._client.is_closed
+
+        assert not first._client.is_closed
+        await lease.release()
+        assert first._client.is_closed
+        await lease.release()  # idempotent
+    finally:
+        await provider_registry.close_all()
+
+
+def _recording_settle(calls: list[tuple]):
+    async def settle(input_tokens, output_tokens, latency_ms, error_msg):
+        calls.append((input_tokens, output_tokens, error_msg))
+        return Settlement(UsageStatus.SUCCESS, Decimal("0"), 7)
+
+    return settle
+
+
+async def _open_stream(messages, calls):
+    chunks = MockProvider().stream_completion("mock-model", messages)
+    first = await anext(chunks)
+    return MeteredStream(
+        chunks,
+        first,
+        meter=StreamMeter(prompt_tokens=estimate_prompt_tokens("mock-model", messages)),
+        request_id="req-1",
+        model="mock-model",
+        start_ts=0.0,
+        settle=_recording_settle(calls),
+    ).events()
+
+
+async def test_stream_relays_chunks_and_settles_with_reported_usage():
+    messages = [{"role": "user", "content": "x" * 80}]
+    calls: list[tuple] = []
+    events = [e async for e in await _open_stream(messages, calls)]
+
+    assert all(e.startswith("data: ") and e.endswith("\n\n") for e in events)
+    assert events[-1] == "data: [DONE]\n\n"
+    payloads = [json.loads(e[6:]) for e in events[:-1]]
+    text = "".join(
+        p["choices"][0]["delta"].get("content", "") for p in payloads if p["choices"]
+    )
+    assert text == "Mock response for model=mock-model"
+    assert payloads[-1]["usage"] == {
+        "prompt_tokens": 20, "completion_tokens": 40, "total_tokens": 60,
+    }
+    assert payloads[-1]["x_platform"]["credits_charged"] == 7
+    assert calls == [(20, 40, None)]
+
+
+async def test_stream_bills_reported_output_tokens_below_char_estimate():
+    async def chunks():
+        yield StreamChunk(content="x" * 40)
+        yield StreamChunk(input_tokens=3, output_tokens=2, finish_reason="stop")
+
+    calls: list[tuple] = []
+    stream = chunks()
+    events = [
+        e
+        async for e in MeteredStream(
+            stream,
+            await anext(stream),
+            meter=StreamMeter(prompt_tokens=20),
+            request_id="req-1",
+            model="mock-model",
+            start_ts=0.0,
+            settle=_recording_settle(calls),
+        ).events()
+    ]
+
+    # 40 characters would estimate 10 tokens; the provider's 2 is what we bill.
+    assert calls == [(3, 2, None)]
+    assert json.loads(events[-2][6:])["usage"]["completion_tokens"] == 2
+
+
+async def test_cancelled_stream_is_charged_for_delivered_text():
+    messages = [{"role": "user", "content": "x" * 80}]
+    calls: list[tuple] = []
+    stream = await _open_stream(messages, calls)
+    await anext(stream)  # role preamble
+    await anext(stream)  # "Mock"
+    await stream.aclose()  # client disconnects
+
+    assert len(calls) == 1
+    input_tokens, output_tokens, error_msg = calls[0]
+    # No usage reported yet: prompt and delivered text are estimated.
+    assert (input_tokens, output_tokens) == (20, 1)
+    assert "disconnected" in error_msg
+
+
+async def test_stream_response_settles_when_body_never_starts():
+    from starlette.requests import ClientDisconnect
+
+    closed: list[object] = []
+
+    async def chunks():
+        try:
+            yield StreamChunk(content="more")
+        finally:
+            closed.append(True)
+
+    async def lease_released():
+        closed.append("lease")
+
+    stream = chunks()
+    first = await anext(stream)
+    calls: list[tuple] = []
+    response = MeteredStreamingResponse(
+        MeteredStream(
+            stream,
+            first,
+            meter=StreamMeter(prompt_tokens=20),
+            request_id="req-1",
+            model="mock-model",
+            start_ts=0.0,
+            settle=_recording_settle(calls),
+            on_close=lease_released,
+        )
+    )
+
+    async def send(message):
+        raise OSError("client went away")  # before the first body chunk
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}}
+    with pytest.raises(ClientDisconnect):
+        await response(scope, receive, send)
+
+    assert closed == [True, "lease"]  # upstream stream and provider lease released
+    assert len(calls) == 1
+    assert calls[0][:2] == (20, 0)
+    assert "disconnected" in calls[0][2]
+    await response.stream.close()  # idempotent
+    assert len(calls) == 1
+    assert closed == [True, "lease"]
+
+
+async def test_gateway_releases_hold_and_slot_when_request_fails_after_admission(
+    db, agent_hierarchy, pricing_rule, session_factory, monkeypatch
+):
+    from httpx import ASGITransport, AsyncClient
+
+    from app.core import rate_limit
+    from app.gateway import router as gateway_router
+    from app.ledger.models import CreditHold, HoldStatus
+    from app.main import app
+
+    h = agent_hierarchy
+    group_id = h.billing_group.id
+    await append_entry(db, group_id, amount=1000, type=TransactionType.CREDIT_PURCHASE)
+    db.add(Policy(name="one-at-a-time", agent_id=h.agent.id, max_concurrent_requests=1))
+    await db.commit()
+    monkeypatch.setattr(rate_limit, "_limiter", rate_limit.InMemoryRateLimiter())
+    monkeypatch.setattr(gateway_router, "async_session_factory", session_factory)
+    monkeypatch.setattr(gateway_settlement, "async_session_factory", session_factory)
+    monkeypatch.setattr(db_session, "async_session_factory", session_factory)  # deduction batcher
+
+    async def broken_credential(org_id, provider):
+        raise RuntimeError("credential store unavailable")
+
+    async def no_credential(org_id, provider):
+        return None
+
+    monkeypatch.setattr(gateway_router, "resolve_credential", broken_credential)
+    body = {"model": "mock-model", "messages": [{"role": "user", "content": "hi"}]}
+    headers = {"Authorization": f"Bearer {h.plaintext_key}"}
+    async with AsyncClient(
+        transport=ASGITransport(app=app, raise_app_exceptions=False),
+        base_url="http://testserver",
+    ) as client:
+        failed = await client.post("/gateway/v1/chat/completions", json=body, headers=headers)
+        assert failed.status_code == 500
+        holds = (await db.execute(select(CreditHold.status))).scalars().all()
+        assert holds == [HoldStatus.RELEASED]
+        assert await get_available_balance(db, group_id) == 1000
+
+        # The concurrency slot came back too, so the next request is admitted
+        monkeypatch.setattr(gateway_router, "resolve_credential", no_credential)
+        ok = await client.post("/gateway/v1/chat/completions", json=body, headers=headers)
+    assert ok.status_code == 200
+
+
+async def test_gateway_charges_overruns_the_balance_can_only_partly_cover(
+    db, agent_hierarchy, session_factory, monkeypatch
+):
+    from httpx import ASGITransport, AsyncClient
+
+    from app.core import rate_limit
+    from app.gateway import router as gateway_router
+    from app.main import app
+
+    h = agent_hierarchy
+    group_id = h.billing_group.id
+    # $0.10 per token: the hold covers the prompt and one output token, the
+    # mock provider answers with 20 tokens.
+    db.add(PricingRule(
+        provider="mock",
+        model="mock-pricey",
+        input_cost_per_1k=Decimal("100"),
+        output_cost_per_1k=Decimal("100"),
+    ))
+    await append_entry(db, group_id, amount=100, type=TransactionType.CREDIT_PURCHASE)
+    await db.commit()
+    monkeypatch.setattr(rate_limit, "_limiter", rate_limit.InMemoryRateLimiter())
+    monkeypatch.setattr(gateway_router, "async_session_factory", session_factory)
+    monkeypatch.setattr(gateway_settlement, "async_session_factory", session_factory)
+    monkeypatch.setattr(db_session, "async_session_factory", session_factory)  # deduction batcher
+
+    async def no_credential(org_id, provider):
+        return None
+
+    monkeypatch.setattr(gateway_router, "resolve_credential", no_credential)
+    body = {
+        "model": "mock-pricey",
+        "messages": [{"role": "user", "content": "hi"}],
+        "max_tokens": 1,
+    }
+    headers = {"Authorization": f"Bearer {h.plaintext_key}"}
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://testserver"
+    ) as client:
+        buffered = await client.post("/gateway/v1/chat/completions", json=body, headers=headers)
+        assert buffered.status_code == 200
+        # 30 tokens cost 300 credits; the whole balance (hold included) is charged
+        assert buffered.json()["x_platform"]["credits_charged"] == 100
+        assert buffered.json()["x_platform"]["credits_shortfall"] == 200
+        assert await get_group_balance(db, group_id) == 0
+
+        await append_entry(db, group_id, amount=100, type=TransactionType.CREDIT_PURCHASE)
+        await db.commit()
+        streamed = await client.post(
+            "/gateway/v1/chat/completions", json={**body, "stream": True}, headers=headers
+        )
+    assert streamed.status_code == 200
+    payloads = [
+        json.loads(line.removeprefix("data: "))
+        for line in streamed.text.splitlines()
+        if line.startswith("data: {")
+    ]
+    assert payloads[-1]["x_platform"]["credits_charged"] == 100
+    assert payloads[-1]["x_platform"]["credits_shortfall"] == 200
+    assert await get_group_balance(db, group_id) == 0
+    assert await get_available_balance(db, group_id) == 0
+
+    events = (await db.execute(select(UsageEvent))).scalars().all()
+    assert [(e.status, e.credits_charged) for e in events] == [
+        (UsageStatus.BUDGET_EXCEEDED, 100),
+        (UsageStatus.BUDGET_EXCEEDED, 100),
+    ]
+    assert all("200 credits uncharged" in e.error_message for e in events)
+
+
+async def test_gateway_estimates_prompts_only_for_authenticated_callers(
+    db, session_factory, monkeypatch
+):
+    from httpx import ASGITransport, AsyncClient
+
+    from app.gateway import router as gateway_router
+    from app.main import app
+
+    monkeypatch.setattr(gateway_router, "async_session_factory", session_factory)
+    estimated: list[str] = []
+    monkeypatch.setattr(
+        gateway_router,
+        "estimate_prompt_tokens",
+        lambda model, messages: estimated.append(model) or 1,
+    )
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://testserver"
+    ) as client:
+        for i in range(3):
+            response = await client.post(
+                "/gateway/v1/chat/completions",
+                json={"model": f"junk-{i}", "messages": [{"role": "system", "content": "x"}]},
+                headers={"Authorization": "Bearer cpk_not-a-key"},
+            )
+            assert response.status_code == 401
+    assert estimated == []
+
+
+async def test_settle_usage_deducts_and_records(
+    db, agent_hierarchy, pricing_rule, session_factory, monkeypatch
+):
+    monkeypatch.setattr(gateway_settlement, "async_session_factory", session_factory)
+    monkeypatch.setattr(db_session, "async_session_factory", session_factory)  # deduction batcher
+    group_id = agent_hierarchy.billing_group.id
+    await append_entry(db, group_id, amount=1000, type=TransactionType.CREDIT_PURCHASE)
+    await db.commit()
+    ctx = await gateway_context.load_agent_context(db, agent_hierarchy.api_key.key_hash)
+    preflight = await load_preflight(db, agent_hierarchy.api_key.key_hash, "mock", "mock-model")
+
+    hold = await place_hold(db, group_id, amount=5, reference="gateway:req-settle")
+    await db.commit()
+
+    settlement = await settle_usage(
+        ctx,
+        hold_id=hold.id,
+        request_id="req-settle",
+        provider_name="mock",
+        model="mock-model",
+        pricing_rule=preflight.pricing_rule,
+        input_tokens=1000,
+        output_tokens=1000,
+        latency_ms=5,
+        streamed=True,
+    )
+
+    # $0.001 + $0.002 = $0.003 → 1 credit (rounded up)
+    assert settlement == Settlement(UsageStatus.SUCCESS, Decimal("0.003"), 1)
+    assert await get_group_balance(db, group_id) == 999
+    assert await get_available_balance(db, group_id) == 999  # hold closed
+    events = (await db.execute(select(UsageEvent))).scalars().all()
+    assert [(e.status, e.credits_charged) for e in events] == [(UsageStatus.SUCCESS, 1)]
+    assert (events[0].org_id, events[0].workspace_id, events[0].agent_group_id) == (
+        ctx.org_id, ctx.workspace_id, ctx.agent_group_id,
+    )
+
+    # Budget counters were bumped in the same transaction; a rebuild agrees.
+    agent_total = (BudgetLevel.AGENT, ctx.agent_id, BudgetPeriod.TOTAL, TOTAL_PERIOD_START)
+    assert await get_period_spend(db, [agent_total]) == {agent_total: 1}
+    await rebuild_spend_counters(db)
+    await db.commit()
+    assert await get_period_spend(db, [agent_total]) == {agent_total: 1}
+
+
+
+async def test_write_behind_records_after_settlement(
+    db, agent_hierarchy, pricing_rule, session_factory, monkeypatch
+):
+    from app.audit.models import AuditLog
+    from app.db.write_behind import WriteBehindBuffer
+
+    buffer = WriteBehindBuffer(
+        enabled=True, flush_interval_seconds=10, max_batch=500, session_factory=session_factory
+    )
+    monkeypatch.setattr(gateway_settlement, "async_session_factory", session_factory)
+    monkeypatch.setattr(db_session, "async_session_factory", session_factory)  # deduction batcher
+    monkeypatch.setattr(gateway_settlement, "write_behind", buffer)
+    group_id = agent_hierarchy.billing_group.id
+    await append_entry(db, group_id, amount=1000, type=TransactionType.CREDIT_PURCHASE)
+    await db.commit()
+    ctx = await gateway_context.load_agent_context(db, agent_hierarchy.api_key.key_hash)
+    preflight = await load_preflight(db, agent_hierarchy.api_key.key_hash, "mock", "mock-model")
+    hold = await place_hold(db, group_id, amount=5, reference="gateway:req-behind")
+    await db.commit()
+
+    await settle_usage(
+        ctx,
+        hold_id=hold.id,
+        request_id="req-behind",
+        provider_name="mock",
+        model="mock-model",
+        pricing_rule=preflight.pricing_rule,
+        input_tokens=1000,
+        output_tokens=1000,
+        latency_ms=5,
+    )
+    # The deduction is synchronous; usage and audit rows are still buffered
+    assert await get_group_balance(db, group_id) == 999
+    assert (await db.execute(select(UsageEvent))).scalars().all() == []
+
+    with count_statements(db.bind) as counter:
+        await buffer.flush()
+    assert counter.statements == 2  # one INSERT per table
+    assert len((await db.execute(select(UsageEvent))).scalars().all()) == 1
+    audit = (await db.execute(select(AuditLog))).scalars().all()
+    assert [a.event_type for a in audit] == ["gateway.request"]
+
+    # Backpressure: a full buffer makes put() wait for the writer, not grow
+    small = WriteBehindBuffer(
+        enabled=True, flush_interval_seconds=10, max_batch=500, max_pending=2,
+        session_factory=session_factory,
+    )
+    rows = [
+        AuditLog(org_id=ctx.org_id, event_type="test.backpressure") for _ in range(7)
+    ]
+    await asyncio.wait_for(small.put(*rows), timeout=2)
+    await small.close()
+    audit = (await db.execute(select(AuditLog))).scalars().all()
+    assert len(audit) == 8
+
+
+def test_token_estimates_per_model_family(monkeypatch):
+    from app.core.exceptions import AppError
+    from app.policies.service import EffectivePolicy, enforce_policy
+    from app.providers import tokens
+
+    english = [{"role": "user", "content": "x" * 400}]
+    # 100 text tokens + 3 framing + 3 reply primer
+    assert estimate_prompt_tokens("gpt-4o", english) == 106
+    assert estimate_prompt_tokens("claude-3-haiku", english) == 120  # 115 + 4 + 1
+    assert estimate_prompt_tokens("mock-model", english) == 100
+    # Non-ASCII characters count one token each instead of a quarter.
+    assert estimate_prompt_tokens("mock-model", [{"role": "user", "content": "日本語" * 10}]) == 30
+
+    # Pluggable per prefix; the longest prefix wins.
+    monkeypatch.setattr(tokens, "_estimators", dict(tokens._estimators))
+    counted: list[str] = []
+
+    class Exact:
+        name = "exact"
+        tokens_per_message = 0
+        tokens_per_reply = 0
+
+        def count_text(self, text: str) -> int:
+            counted.append(text)
+            return len(text.split())
+
+    tokens.register_estimator("gpt-4o-mini", Exact())
+    system = {"role": "system", "content": "You are a careful assistant."}
+    for question in ("one", "two words"):
+        assert estimate_prompt_tokens(
+            "gpt-4o-mini", [system, {"role": "user", "content": question}]
+        ) == 5 + len(question.split())
+    assert estimate_prompt_tokens("gpt-4o", english) == 106
+    # The repeated system prompt was counted once.
+    assert counted == [system["content"], "one", "two words"]
+
+    policy = EffectivePolicy(None, max_input_tokens=100, max_output_tokens=None, rpm_limit=None)
+    assert enforce_policy(policy, "gpt-4o", None, input_tokens=100) is None
+    with pytest.raises(AppError) as exc:
+        enforce_policy(policy, "gpt-4o", None, input_tokens=106)
+    assert exc.value.status_code == 403
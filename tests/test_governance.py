@@ -1,22 +1,33 @@
+import asyncio
 import uuid
 from decimal import Decimal
 
 import pytest
 from httpx import ASGITransport, AsyncClient
 from pydantic import ValidationError
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
+from app.db.session import count_statements
+
 from app.agent_groups.models import AgentGroup
 from app.agents.models import Agent, AgentStatus, ApiKey
 from app.auth.models import User
-from app.budgets.models import Budget, BudgetPeriod
-from app.budgets.service import check_budgets
+from app.budgets.models import Budget, BudgetLevel, BudgetPeriod
+from app.budgets.service import (
+    TOTAL_PERIOD_START,
+    check_budgets,
+    get_hierarchy_spend,
+    get_period_spend,
+    rebuild_spend_counters,
+    record_spend,
+)
 from app.budgets.schemas import BudgetCreate
 from app.credentials.models import CredentialMode, ProviderCredential
 from app.core.dependencies import get_current_user, get_db
 from app.core.exceptions import AppError
 from app.core.security import hash_password
-from app.groups.models import Group
+from app.groups.models import Group, MemberRole, Membership
 from app.main import app
 from app.orgs.models import Organization
 from app.policies.models import Policy
@@ -389,6 +400,9 @@ async def test_budget_auto_disable_sets_agent_status(db: AsyncSession, monkeypat
         status=UsageStatus.SUCCESS,
     )
     db.add(usage)
+    await db.flush()
+    # Budget checks read spend counters, derived here from usage_events.
+    await rebuild_spend_counters(db)
     await db.commit()
 
     session_factory = async_sessionmaker(
@@ -412,3 +426,1069 @@ async def test_budget_auto_disable_sets_agent_status(db: AsyncSession, monkeypat
 
     await db.refresh(agent)
     assert agent.status == AgentStatus.BUDGET_EXHAUSTED
+
+
+@pytest.mark.asyncio
+async def test_effective_policy_cached_until_ancestor_policy_changes(db: AsyncSession):
+    from app.policies import service as policy_service
+
+    owner = User(email="policy-cache@test.com", hashed_password=hash_password("password"))
+    db.add(owner)
+    await db.flush()
+    billing_group = Group(name="Policy Cache Billing", owner_id=owner.id)
+    db.add(billing_group)
+    await db.flush()
+    org = Organization(
+        name="Policy Cache Org",
+        slug="policy-cache-org",
+        owner_id=owner.id,
+        billing_group_id=billing_group.id,
+    )
+    db.add(org)
+    await db.flush()
+    workspace = Workspace(org_id=org.id, name="WS", slug="ws")
+    db.add(workspace)
+    await db.flush()
+    agent_group = AgentGroup(workspace_id=workspace.id, name="AG")
+    db.add(agent_group)
+    await db.flush()
+    agent = Agent(agent_group_id=agent_group.id, name="Agent")
+    db.add(agent)
+    await db.flush()
+    db.add(Policy(name="ws", workspace_id=workspace.id, allowed_models=["a", "b", "c"]))
+    db.add(Policy(name="agent", agent_id=agent.id, allowed_models=["b", "c", "d"]))
+    await db.commit()
+
+    scope = dict(
+        org_id=org.id,
+        workspace_id=workspace.id,
+        agent_group_id=agent_group.id,
+        agent_id=agent.id,
+    )
+    policy = await policy_service.get_effective_policy(db, **scope)
+    assert policy.allowed_models == frozenset({"b", "c"})
+    assert policy_service.enforce_policy(policy, "b", None) is None
+    with pytest.raises(AppError) as exc:
+        policy_service.enforce_policy(policy, "a", None)
+    assert exc.value.status_code == 403
+
+    # New org-level policy: the compiled entry is served until invalidated.
+    db.add(Policy(name="org", org_id=org.id, allowed_models=["c"]))
+    await db.commit()
+    cached = await policy_service.get_effective_policy(db, **scope)
+    assert cached.allowed_models == frozenset({"b", "c"})
+
+    policy_service.invalidate_effective_policies(org_id=org.id)
+    policy = await policy_service.get_effective_policy(db, **scope)
+    assert policy.allowed_models == frozenset({"c"})
+
+
+@pytest.mark.asyncio
+async def test_credential_cache_invalidated_on_add_and_deactivate(db: AsyncSession):
+    from app.credentials import service as cred_service
+
+    owner = User(email="cred-cache@test.com", hashed_password=hash_password("password"))
+    db.add(owner)
+    await db.flush()
+    billing_group = Group(name="Cred Billing", owner_id=owner.id)
+    db.add(billing_group)
+    await db.flush()
+    org = Organization(
+        name="Cred Org",
+        slug="cred-org",
+        owner_id=owner.id,
+        billing_group_id=billing_group.id,
+    )
+    db.add(org)
+    await db.commit()
+
+    # "No credential" is cached too.
+    assert await cred_service.get_active_credential(db, org.id, "openai") is None
+
+    cred = await cred_service.add_credential(db, org.id, "openai", "sk-first")
+    await db.commit()
+    cred_service.invalidate_credential(org.id, "openai")
+    assert await cred_service.get_active_credential(db, org.id, "openai") == "sk-first"
+
+    # Served from the cache without touching the session.
+    assert await cred_service.resolve_credential(org.id, "openai") == "sk-first"
+
+    await cred_service.deactivate_credential(db, org.id, cred.id)
+    await db.commit()
+    cred_service.invalidate_credential(org.id, "openai")
+    assert await cred_service.get_active_credential(db, org.id, "openai") is None
+
+
+@pytest.mark.asyncio
+async def test_spend_counters_back_budget_checks(db: AsyncSession):
+    owner = User(email="counter-owner@test.com", hashed_password=hash_password("password"))
+    db.add(owner)
+    await db.flush()
+    billing_group = Group(name="Counter Billing", owner_id=owner.id)
+    db.add(billing_group)
+    await db.flush()
+    org = Organization(
+        name="Counter Org",
+        slug="counter-org",
+        owner_id=owner.id,
+        billing_group_id=billing_group.id,
+    )
+    db.add(org)
+    await db.flush()
+    workspace = Workspace(org_id=org.id, name="WS", slug="ws")
+    db.add(workspace)
+    await db.flush()
+    agent_group = AgentGroup(workspace_id=workspace.id, name="AG")
+    db.add(agent_group)
+    await db.flush()
+    agent = Agent(agent_group_id=agent_group.id, name="Agent 1")
+    db.add(agent)
+    await db.flush()
+    hierarchy = dict(
+        org_id=org.id,
+        workspace_id=workspace.id,
+        agent_group_id=agent_group.id,
+        agent_id=agent.id,
+    )
+    for period in BudgetPeriod:
+        db.add(Budget(period=period, limit_credits=100, auto_disable=False, org_id=org.id))
+    db.add(Budget(period=BudgetPeriod.DAILY, limit_credits=50, auto_disable=False, agent_id=agent.id))
+    await db.commit()
+
+    await record_spend(db, credits=30, **hierarchy)
+    await record_spend(db, credits=15, **hierarchy)
+    await db.commit()
+
+    total_key = (BudgetLevel.ORG, org.id, BudgetPeriod.TOTAL, TOTAL_PERIOD_START)
+    assert await get_period_spend(db, [total_key]) == {total_key: 45}
+
+    # Four budgets: one query for budgets, one for all their counters
+    with count_statements(db.bind) as counter:
+        await check_budgets(db, required_credits=5, **hierarchy)
+    assert counter.statements == 2
+
+    with pytest.raises(AppError) as exc:
+        await check_budgets(db, required_credits=6, **hierarchy)
+    assert "agent level (DAILY): current=45, limit=50" in exc.value.message
+
+    # A rebuild from usage_events replaces the counters (no events → zero).
+    await rebuild_spend_counters(db)
+    await db.commit()
+    assert await get_period_spend(db, [total_key]) == {total_key: 0}
+
+
+@pytest.mark.asyncio
+async def test_hierarchy_spend_in_one_aggregate_query(db: AsyncSession, monkeypatch):
+    from datetime import datetime, timedelta, timezone
+
+    from app.budgets import service as budget_service
+
+    owner = User(email="agg-owner@test.com", hashed_password=hash_password("password"))
+    db.add(owner)
+    await db.flush()
+    billing_group = Group(name="Agg Billing", owner_id=owner.id)
+    db.add(billing_group)
+    await db.flush()
+    org = Organization(
+        name="Agg Org", slug="agg-org", owner_id=owner.id, billing_group_id=billing_group.id
+    )
+    db.add(org)
+    await db.flush()
+    workspace = Workspace(org_id=org.id, name="WS", slug="ws")
+    db.add(workspace)
+    await db.flush()
+    agent_group = AgentGroup(workspace_id=workspace.id, name="AG")
+    db.add(agent_group)
+    await db.flush()
+    agent = Agent(agent_group_id=agent_group.id, name="Agent 1")
+    sibling = Agent(agent_group_id=agent_group.id, name="Agent 2")
+    db.add_all([agent, sibling])
+    await db.flush()
+
+    def usage(agent_id, credits, *, age=timedelta(0), status=UsageStatus.SUCCESS):
+        return UsageEvent(
+            user_id=owner.id,
+            group_id=billing_group.id,
+            agent_id=agent_id,
+            agent_group_id=agent_group.id,
+            workspace_id=workspace.id,
+            org_id=org.id,
+            provider="mock",
+            model="mock-model",
+            input_tokens=1,
+            output_tokens=1,
+            total_tokens=2,
+            cost_usd=Decimal("0.01"),
+            credits_charged=credits,
+            status=status,
+            created_at=datetime.now(timezone.utc) - age,
+        )
+
+    db.add_all([
+        usage(agent.id, 10),
+        usage(sibling.id, 5),
+        usage(agent.id, 100, age=timedelta(days=40)),  # outside DAILY and MONTHLY
+        usage(agent.id, 1000, status=UsageStatus.ERROR),  # never counted
+    ])
+    db.add(Budget(period=BudgetPeriod.MONTHLY, limit_credits=20, auto_disable=False, agent_group_id=agent_group.id))
+    db.add(Budget(period=BudgetPeriod.TOTAL, limit_credits=200, auto_disable=False, agent_id=agent.id))
+    await db.commit()
+
+    hierarchy = dict(
+        org_id=org.id,
+        workspace_id=workspace.id,
+        agent_group_id=agent_group.id,
+        agent_id=agent.id,
+    )
+    with count_statements(db.bind) as counter:
+        spend = await get_hierarchy_spend(db, **hierarchy)
+    assert counter.statements == 1
+    by_level_period = {(level, period): value for (level, _, period, _), value in spend.items()}
+    assert by_level_period[(BudgetLevel.AGENT, BudgetPeriod.DAILY)] == 10
+    assert by_level_period[(BudgetLevel.AGENT, BudgetPeriod.TOTAL)] == 110
+    assert by_level_period[(BudgetLevel.AGENT_GROUP, BudgetPeriod.MONTHLY)] == 15
+    assert by_level_period[(BudgetLevel.ORG, BudgetPeriod.TOTAL)] == 115
+
+    # Windowed periods only: the scan is bounded by created_at (partition pruning)
+    monthly = await get_hierarchy_spend(db, periods={BudgetPeriod.MONTHLY}, **hierarchy)
+    assert {key[2] for key in monthly} == {BudgetPeriod.MONTHLY}
+    assert monthly[next(k for k in monthly if k[0] == BudgetLevel.AGENT)] == 10
+
+    monkeypatch.setattr(budget_service.settings, "budget_spend_counters", False)
+    with count_statements(db.bind) as counter:
+        await check_budgets(db, required_credits=5, **hierarchy)
+    assert counter.statements == 2
+    with pytest.raises(AppError) as exc:
+        await check_budgets(db, required_credits=6, **hierarchy)
+    assert "agent_group level (MONTHLY): current=15, limit=20" in exc.value.message
+
+
+@pytest.mark.asyncio
+async def test_rpm_limit_enforced_per_agent_with_retry_after(monkeypatch):
+    from app.core import rate_limit
+    from app.core.exceptions import RateLimitExceededError
+    from app.main import app_error_handler
+    from app.policies.service import EffectivePolicy, enforce_rate_limit
+
+    now = [100.0]
+    monkeypatch.setattr(
+        rate_limit, "_limiter", rate_limit.InMemoryRateLimiter(clock=lambda: now[0])
+    )
+    policy = EffectivePolicy(None, None, None, rpm_limit=2)
+    agent_id, other_agent_id = uuid.uuid4(), uuid.uuid4()
+
+    await enforce_rate_limit(policy, agent_id)
+    now[0] = 100.5
+    await enforce_rate_limit(policy, agent_id)
+    now[0] = 101.0
+    with pytest.raises(RateLimitExceededError) as exc:
+        await enforce_rate_limit(policy, agent_id)
+    assert exc.value.status_code == 429
+    assert exc.value.headers == {"Retry-After": "59"}
+    response = await app_error_handler(None, exc.value)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "59"
+
+    # Separate window per agent; no limit means no accounting at all.
+    await enforce_rate_limit(policy, other_agent_id)
+    await enforce_rate_limit(EffectivePolicy(None, None, None, None), agent_id)
+
+    # The oldest request slides out of the window after 60 seconds.
+    now[0] = 160.0
+    await enforce_rate_limit(policy, agent_id)
+    with pytest.raises(RateLimitExceededError):
+        await enforce_rate_limit(policy, agent_id)
+
+
+@pytest.mark.asyncio
+async def test_redis_rate_limiter_falls_back_when_unreachable():
+    from redis.exceptions import ConnectionError as RedisConnectionError
+
+    from app.core.rate_limit import RedisRateLimiter
+
+    class UnreachableRedis:
+        def register_script(self, script):
+            async def run(keys, args):
+                raise RedisConnectionError("connection refused")
+
+            return run
+
+    limiter = RedisRateLimiter(UnreachableRedis())
+    assert (await limiter.acquire("rpm:agent:a", 1)).allowed
+    decision = await limiter.acquire("rpm:agent:a", 1)
+    assert not decision.allowed
+    assert 0 < decision.retry_after <= 60
+
+
+@pytest.mark.asyncio
+async def test_redis_rate_limiter_script_shares_window():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # fakeredis needs it to run Lua scripts
+
+    from app.core.rate_limit import RedisRateLimiter
+
+    server = fakeredis.FakeServer()
+    # Two limiters on one server stand in for two worker processes.
+    first = RedisRateLimiter(fakeredis.FakeAsyncRedis(server=server))
+    second = RedisRateLimiter(fakeredis.FakeAsyncRedis(server=server))
+
+    assert (await first.acquire("rpm:agent:a", 2)).remaining == 1
+    assert (await second.acquire("rpm:agent:a", 2)).remaining == 0
+    denied = await first.acquire("rpm:agent:a", 2)
+    assert not denied.allowed
+    assert 0 < denied.retry_after <= 60
+    assert (await second.acquire("rpm:agent:b", 2)).allowed
+
+
+@pytest.mark.asyncio
+async def test_tpm_and_concurrency_limits_merge_and_admit(monkeypatch):
+    from app.core import rate_limit
+    from app.core.exceptions import RateLimitExceededError
+    from app.policies.service import EffectivePolicy, _merge_policies, admit_load
+
+    now = [0.0]
+    limiter = rate_limit.InMemoryRateLimiter(clock=lambda: now[0])
+    monkeypatch.setattr(rate_limit, "_limiter", limiter)
+    policy = _merge_policies(
+        [
+            Policy(name="org", tpm_limit=5000, max_concurrent_requests=4, is_active=True),
+            Policy(name="agent", tpm_limit=1000, max_concurrent_requests=8, is_active=True),
+            Policy(name="off", tpm_limit=1, max_concurrent_requests=1, is_active=False),
+        ]
+    )
+    assert (policy.tpm_limit, policy.max_concurrent_requests) == (1000, 4)
+    agent_id = uuid.uuid4()
+
+    # Estimates are charged up front...
+    first = await admit_load(policy, agent_id, 600)
+    with pytest.raises(RateLimitExceededError) as exc:
+        await admit_load(policy, agent_id, 600)
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) == 60
+
+    # ...and corrected to actual usage, which frees room in the window.
+    await first.finish(100)
+    await first.finish(100)  # idempotent
+    await admit_load(policy, agent_id, 600)  # window now holds 700
+
+    # Half-way through the next minute, half of the previous one still counts:
+    # 350 + 700 is 50 over, and 50 of the 700 decays away in 60 * 50/700 s.
+    now[0] = 90.0
+    with pytest.raises(RateLimitExceededError) as exc:
+        await admit_load(policy, agent_id, 700)
+    assert exc.value.retry_after == pytest.approx(60 * 50 / 700)
+    await admit_load(policy, agent_id, 600)
+
+    # Slots are held until finish(); a request rejected for concurrency
+    # gives its token estimate back.
+    slots_policy = EffectivePolicy(
+        None, None, None, None, tpm_limit=100, max_concurrent_requests=2
+    )
+    other_agent_id = uuid.uuid4()
+    held = await admit_load(slots_policy, other_agent_id, 40)
+    await admit_load(slots_policy, other_agent_id, 40)
+    with pytest.raises(RateLimitExceededError, match="Concurrency limit"):
+        await admit_load(slots_policy, other_agent_id, 20)
+    await held.finish(40)
+    await admit_load(slots_policy, other_agent_id, 20)
+
+
+@pytest.mark.asyncio
+async def test_tpm_and_concurrency_limits_shared_across_each_level(monkeypatch):
+    from app.core import rate_limit
+    from app.core.exceptions import RateLimitExceededError
+    from app.policies.service import _merge_policies, admit_load
+
+    monkeypatch.setattr(rate_limit, "_limiter", rate_limit.InMemoryRateLimiter())
+    org_id, workspace_id = uuid.uuid4(), uuid.uuid4()
+    agents = [uuid.uuid4(), uuid.uuid4()]
+
+    def policy_for(agent_id):
+        return _merge_policies(
+            [
+                Policy(name="org", org_id=org_id, tpm_limit=1000, is_active=True),
+                Policy(
+                    name="workspace", workspace_id=workspace_id,
+                    max_concurrent_requests=1, is_active=True,
+                ),
+                Policy(name="agent", agent_id=agent_id, tpm_limit=800, is_active=True),
+            ]
+        )
+
+    # The org's window is shared: two agents cannot each use 1000 tokens.
+    first = await admit_load(policy_for(agents[0]), agents[0], 600)
+    with pytest.raises(RateLimitExceededError, match=r"1000 tokens per minute \(org\)"):
+        await admit_load(policy_for(agents[1]), agents[1], 600)
+    # So is the workspace's single slot, until the first request finishes.
+    with pytest.raises(RateLimitExceededError, match=r"Concurrency.*\(workspace\)"):
+        await admit_load(policy_for(agents[1]), agents[1], 100)
+    await first.finish(100)
+    second = await admit_load(policy_for(agents[1]), agents[1], 600)
+
+    # A rejected level gives back what the levels before it admitted: the
+    # agent's own window kept nothing from the two 429s above.
+    await second.finish(600)
+    await admit_load(policy_for(agents[1]), agents[1], 200)
+
+
+@pytest.mark.asyncio
+async def test_request_larger_than_tpm_limit_is_rejected_up_front(monkeypatch):
+    from app.core import rate_limit
+    from app.core.exceptions import RateLimitExceededError
+    from app.policies.service import EffectivePolicy, admit_load
+
+    limiter = rate_limit.InMemoryRateLimiter()
+    monkeypatch.setattr(rate_limit, "_limiter", limiter)
+    policy = EffectivePolicy(None, None, None, None, tpm_limit=1000)
+    agent_id = uuid.uuid4()
+
+    with pytest.raises(AppError) as exc:
+        await admit_load(policy, agent_id, 1500)
+    # Not a 429: waiting for the window to drain would never help.
+    assert not isinstance(exc.value, RateLimitExceededError)
+    assert exc.value.status_code == 403
+    assert "lower max_tokens" in exc.value.message
+    assert limiter._token_windows == {}
+
+    await admit_load(policy, agent_id, 1000)
+
+
+@pytest.mark.asyncio
+async def test_redis_token_window_script_shares_and_corrects_usage():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # fakeredis needs it to run Lua scripts
+
+    from app.core.rate_limit import RedisRateLimiter
+
+    server = fakeredis.FakeServer()
+    first = RedisRateLimiter(fakeredis.FakeAsyncRedis(server=server))
+    second = RedisRateLimiter(fakeredis.FakeAsyncRedis(server=server))
+
+    admitted = await first.acquire_tokens("tpm:org:a", 600, 1000)
+    assert (admitted.allowed, admitted.remaining) == (True, 400)
+    denied = await second.acquire_tokens("tpm:org:a", 600, 1000)
+    assert not denied.allowed
+    assert 0 < denied.retry_after <= 60
+
+    # Actual usage was 100: the correction frees 500 for every process.
+    await first.adjust_tokens("tpm:org:a", -500)
+    admitted = await second.acquire_tokens("tpm:org:a", 600, 1000)
+    assert (admitted.allowed, admitted.remaining) == (True, 300)
+    assert (await second.acquire_tokens("tpm:org:b", 1000, 1000)).allowed
+    assert first.fallback._token_windows == {}  # Redis answered every call
+
+
+@pytest.mark.asyncio
+async def test_redis_slots_script_shares_and_expires_leases():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # fakeredis needs it to run Lua scripts
+
+    from app.core.rate_limit import SLOT_RETRY_SECONDS, RedisRateLimiter
+
+    server = fakeredis.FakeServer()
+    first = RedisRateLimiter(fakeredis.FakeAsyncRedis(server=server))
+    second = RedisRateLimiter(fakeredis.FakeAsyncRedis(server=server))
+
+    assert (await first.acquire_slot("concurrency:org:a", 2, "lease-a")).remaining == 1
+    assert (await second.acquire_slot("concurrency:org:a", 2, "lease-b")).remaining == 0
+    denied = await first.acquire_slot("concurrency:org:a", 2, "lease-c")
+    assert (denied.allowed, denied.retry_after) == (False, SLOT_RETRY_SECONDS)
+    await second.release_slot("concurrency:org:a", "lease-a")
+    assert (await first.acquire_slot("concurrency:org:a", 2, "lease-c")).allowed
+
+    # A lease nobody released (its worker died) ages out after lease_seconds.
+    short = RedisRateLimiter(fakeredis.FakeAsyncRedis(server=server), lease_seconds=0.05)
+    assert (await short.acquire_slot("concurrency:org:b", 1, "crashed")).allowed
+    assert not (await short.acquire_slot("concurrency:org:b", 1, "next")).allowed
+    await asyncio.sleep(0.1)
+    assert (await short.acquire_slot("concurrency:org:b", 1, "next")).allowed
+
+
+@pytest.mark.asyncio
+async def test_usage_history_keyset_pagination(db: AsyncSession):
+    from datetime import datetime, timedelta, timezone
+
+    from app.core.pagination import decode_cursor
+    from app.usage.service import get_usage_history
+
+    owner = User(email="page-owner@test.com", hashed_password=hash_password("password"))
+    db.add(owner)
+    await db.flush()
+    billing_group = Group(name="Page Billing", owner_id=owner.id)
+    db.add(billing_group)
+    await db.flush()
+
+    # Two pairs share a timestamp: ties are broken by id, not skipped or repeated.
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for offset in (0, 1, 1, 2, 2):
+        db.add(
+            UsageEvent(
+                user_id=owner.id,
+                group_id=billing_group.id,
+                provider="mock",
+                model="mock-model",
+                input_tokens=1,
+                output_tokens=1,
+                total_tokens=2,
+                cost_usd=Decimal("0.01"),
+                credits_charged=1,
+                status=UsageStatus.SUCCESS,
+                created_at=base + timedelta(minutes=offset),
+            )
+        )
+    await db.flush()
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = await get_usage_history(db, billing_group.id, limit=2, cursor=cursor)
+        seen.extend(page.items)
+        pages += 1
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+
+    assert pages == 3
+    assert len({event.id for event in seen}) == 5
+    keys = [(event.created_at, event.id) for event in seen]
+    assert keys == sorted(keys, reverse=True)
+
+    with pytest.raises(AppError) as exc:
+        decode_cursor("not-a-cursor")
+    assert exc.value.status_code == 400
+    with pytest.raises(AppError):
+        await get_usage_history(db, billing_group.id, limit=0)
+
+
+@pytest.mark.asyncio
+async def test_usage_rollups_match_raw_analytics(db: AsyncSession):
+    from datetime import datetime, timedelta, timezone
+
+    from sqlalchemy import func, select
+
+    from app.usage.models import UsageRollupDaily, UsageRollupHourly
+    from app.usage.rollups import rebuild_rollups, roll_up
+    from app.usage.service import get_burn_rate, get_top_users
+
+    alice = User(email="rollup-a@test.com", hashed_password=hash_password("password"))
+    bob = User(email="rollup-b@test.com", hashed_password=hash_password("password"))
+    db.add_all([alice, bob])
+    await db.flush()
+    billing_group = Group(name="Rollup Billing", owner_id=alice.id)
+    db.add(billing_group)
+    await db.flush()
+
+    now = datetime.now(timezone.utc)
+    for user, credits, age in [
+        (alice, 100, timedelta(days=10)),  # outside both windows
+        (bob, 40, timedelta(days=3)),
+        (alice, 7, timedelta(hours=24) - timedelta(minutes=1)),  # part-hour at the 24h edge
+        (bob, 5, timedelta(hours=2)),
+        (bob, 3, timedelta(minutes=30)),  # newer than the lag: stays raw
+        (alice, 1, timedelta(0)),
+    ]:
+        db.add(
+            UsageEvent(
+                user_id=user.id,
+                group_id=billing_group.id,
+                provider="mock",
+                model="mock-model",
+                input_tokens=1,
+                output_tokens=1,
+                total_tokens=2,
+                cost_usd=Decimal("0.01"),
+                credits_charged=credits,
+                latency_ms=10,
+                status=UsageStatus.SUCCESS,
+                created_at=now - age,
+            )
+        )
+    await db.flush()
+
+    expected_burn = (7 + 5 + 3 + 1, 40 + 7 + 5 + 3 + 1)
+    expected_top = [(alice.id, 108), (bob.id, 48)]
+    assert await get_burn_rate(db, billing_group.id) == expected_burn
+    assert await get_top_users(db, billing_group.id) == expected_top
+
+    run = await roll_up(db, now=now, lag_seconds=3600)
+    assert run is not None and run.start is None
+    assert run.events == 4
+    assert await roll_up(db, now=now, lag_seconds=3600) is None  # nothing new yet
+    assert await get_burn_rate(db, billing_group.id) == expected_burn
+    assert await get_top_users(db, billing_group.id) == expected_top
+
+    daily = await db.execute(
+        select(func.sum(UsageRollupDaily.request_count), func.sum(UsageRollupDaily.latency_ms_sum))
+    )
+    assert tuple(daily.one()) == (4, 40)
+
+    # Tailing picks up exactly where the last run stopped
+    run = await roll_up(db, now=now + timedelta(hours=2), lag_seconds=3600)
+    assert run.events == 2
+    assert await get_burn_rate(db, billing_group.id) == expected_burn
+    assert await get_top_users(db, billing_group.id) == expected_top
+
+    run = await rebuild_rollups(db, now=now + timedelta(hours=2), lag_seconds=3600)
+    assert run.events == 6
+    hourly = await db.execute(select(func.sum(UsageRollupHourly.credits_charged)))
+    assert hourly.scalar_one() == 156
+    assert await get_top_users(db, billing_group.id) == expected_top
+
+
+@pytest.mark.asyncio
+async def test_org_forecast_projects_balance_and_budget_exhaustion(
+    db: AsyncSession, agent_hierarchy, monkeypatch
+):
+    from datetime import datetime, timedelta, timezone
+
+    from app.budgets import service as budget_service
+    from app.ledger.models import TransactionType
+    from app.ledger.service import append_entry
+    from app.usage.forecast import compute_org_forecast, ewma, get_org_forecast
+    from app.usage.rollups import roll_up
+
+    h = agent_hierarchy
+    monkeypatch.setattr(budget_service.settings, "budget_spend_counters", False)
+    now = datetime.now(timezone.utc)
+    current_hour = now.replace(minute=0, second=0, microsecond=0)
+
+    # 10 credits in each of the last 48 complete hours
+    for hours_back in range(1, 49):
+        db.add(
+            UsageEvent(
+                user_id=h.user.id,
+                group_id=h.billing_group.id,
+                agent_id=h.agent.id,
+                agent_group_id=h.agent_group.id,
+                workspace_id=h.workspace.id,
+                org_id=h.org.id,
+                provider="mock",
+                model="mock-model",
+                input_tokens=1,
+                output_tokens=1,
+                total_tokens=2,
+                cost_usd=Decimal("0.01"),
+                credits_charged=10,
+                status=UsageStatus.SUCCESS,
+                created_at=current_hour - timedelta(hours=hours_back, minutes=-30),
+            )
+        )
+    await append_entry(db, h.billing_group.id, 1000, TransactionType.CREDIT_PURCHASE)
+    workspace_budget = Budget(
+        period=BudgetPeriod.TOTAL, limit_credits=600, auto_disable=False,
+        workspace_id=h.workspace.id,
+    )
+    daily_budget = Budget(
+        period=BudgetPeriod.DAILY, limit_credits=1000, auto_disable=False, agent_id=h.agent.id,
+    )
+    db.add_all([workspace_budget, daily_budget])
+    await db.flush()
+    # Older half from the rollups, newer half raw
+    await roll_up(db, now=now - timedelta(hours=24), lag_seconds=0)
+    await db.commit()
+
+    forecast = await compute_org_forecast(db, h.org, now=now)
+
+    assert forecast.balance.available_credits == 1000
+    assert forecast.balance.credits_per_hour == pytest.approx(10)
+    assert forecast.balance.exhausts_at == now + timedelta(hours=100)
+
+    budgets = {b.budget_id: b for b in forecast.budgets}
+    total = budgets[workspace_budget.id]
+    assert (total.spent_credits, total.remaining_credits) == (480, 120)
+    assert total.period_ends_at is None
+    assert total.exhausts_at == now + timedelta(hours=12)
+    daily = budgets[daily_budget.id]
+    assert daily.period_ends_at == current_hour.replace(hour=0) + timedelta(days=1)
+    assert daily.exhausts_at is None  # resets at midnight first
+
+    # Recent hours weigh more than old ones
+    assert ewma([0] * 24 + [10] * 24, half_life=6) > 9
+    assert ewma([10] * 24 + [0] * 24, half_life=6) < 1
+
+    cached = await get_org_forecast(db, h.org)
+    app.dependency_overrides[get_db] = _override_db(db)
+    app.dependency_overrides[get_current_user] = _override_user(h.user)
+    try:
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://testserver"
+        ) as client:
+            with count_statements(db.bind) as counter:
+                response = await client.get(f"/orgs/{h.org.id}/forecast")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert counter.statements == 1  # the ownership check; the forecast is cached
+    body = response.json()
+    assert body["generated_at"].startswith(cached.generated_at.isoformat()[:19])
+    assert len(body["budgets"]) == 2
+
+
+def test_space_saving_error_bounds_and_merge():
+    import random
+
+    from app.core.sketch import SpaceSaving
+
+    rng = random.Random(7)
+    truth: dict[str, int] = {}
+    halves = [SpaceSaving(10), SpaceSaving(10)]
+    for i in range(5000):
+        key = f"k{min(int(rng.paretovariate(1.2)), 200)}"
+        weight = rng.randint(1, 5)
+        truth[key] = truth.get(key, 0) + weight
+        halves[i % 2].add(key, weight)
+    merged = SpaceSaving.from_dict(halves[0].to_dict()).merge(halves[1])
+
+    total = sum(truth.values())
+    assert merged.total == total
+    assert len(merged) == 10
+    for hit in merged.top():
+        assert hit.count - hit.error <= truth[hit.key] <= hit.count
+        assert hit.error <= total / merged.capacity
+    # Anything dropped weighs no more than the smallest kept counter
+    kept = {hit.key for hit in merged.top()}
+    assert max(v for k, v in truth.items() if k not in kept) <= merged.min_count()
+    assert [hit.key for hit in merged.top(3)] == sorted(truth, key=truth.get, reverse=True)[:3]
+
+
+@pytest.mark.asyncio
+async def test_heavy_hitters_flush_merge_and_top_users_endpoint(
+    db: AsyncSession, session_factory, agent_hierarchy
+):
+    from datetime import datetime, timedelta, timezone
+
+    from app.usage.heavy_hitters import HeavyHitterTracker, heavy_hitters
+    from app.usage.models import HeavyHitterSlot
+
+    h = agent_hierarchy
+    group_id = h.billing_group.id
+    # Two "processes" sharing the database
+    first = HeavyHitterTracker(capacity=4, session_factory=session_factory)
+    second = HeavyHitterTracker(capacity=4, session_factory=session_factory)
+    users = [uuid.uuid4() for _ in range(3)]
+    for tracker, credits in ((first, 10), (second, 5)):
+        for rank, user_id in enumerate(users):
+            tracker.record(
+                group_id, credits=credits * (rank + 1), user_id=user_id,
+                agent_id=h.agent.id, model="mock-model",
+            )
+    first.record(
+        group_id, credits=99, user_id=users[0],
+        at=datetime.now(timezone.utc) - timedelta(hours=200),  # past retention
+    )
+
+    # Unflushed deltas already count locally
+    top = await first.top(db, group_id, "user", 2, window_hours=24)
+    assert [(hit.key, hit.count) for hit in top] == [(str(users[2]), 30), (str(users[1]), 20)]
+
+    assert await first.flush() == 4
+    assert await second.flush() == 3
+    assert await first.flush() == 0
+    top = await first.top(db, group_id, "user", 3, window_hours=24)
+    assert [(hit.key, hit.count, hit.error) for hit in top] == [
+        (str(users[2]), 45, 0), (str(users[1]), 30, 0), (str(users[0]), 15, 0),
+    ]
+    models = await second.top(db, group_id, "model", 5, window_hours=1)
+    assert [(hit.key, hit.count) for hit in models] == [("mock-model", 90)]
+    remaining = await db.execute(select(HeavyHitterSlot.dimension))
+    assert sorted(remaining.scalars()) == ["agent", "model", "user"]  # expired slot deleted
+
+    with pytest.raises(AppError):
+        await first.top(db, group_id, "user", 3, window_hours=0)
+
+    # The endpoint answers from the process-wide tracker, or exactly on request
+    heavy_hitters.record(group_id, credits=12, user_id=h.user.id, agent_id=h.agent.id)
+    db.add(Membership(user_id=h.user.id, group_id=group_id, role=MemberRole.ADMIN))
+    db.add(
+        UsageEvent(
+            user_id=h.user.id,
+            group_id=group_id,
+            provider="mock",
+            model="mock-model",
+            input_tokens=1,
+            output_tokens=1,
+            total_tokens=2,
+            cost_usd=Decimal("0.01"),
+            credits_charged=7,
+            status=UsageStatus.SUCCESS,
+        )
+    )
+    await db.commit()
+    app.dependency_overrides[get_db] = _override_db(db)
+    app.dependency_overrides[get_current_user] = _override_user(h.user)
+    try:
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://testserver"
+        ) as client:
+            sketched = await client.get(f"/usage/top-users/{group_id}")
+            exact = await client.get(f"/usage/top-users/{group_id}?exact=true")
+            agents = await client.get(f"/usage/heavy-hitters/{group_id}?dimension=agent")
+            bad = await client.get(f"/usage/heavy-hitters/{group_id}?dimension=org")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert [(u["user_id"], u["total_credits"]) for u in sketched.json()] == [
+        (str(users[2]), 45), (str(users[1]), 30), (str(users[0]), 15), (str(h.user.id), 12),
+    ]
+    assert exact.json() == [{"user_id": str(h.user.id), "total_credits": 7, "error": 0}]
+    assert agents.json() == [{"key": str(h.agent.id), "credits": 102, "error": 0}]
+    assert bad.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_cancelled_heavy_hitter_flush_keeps_its_deltas(
+    db: AsyncSession, session_factory, agent_hierarchy
+):
+    from app.usage.heavy_hitters import HeavyHitterTracker
+
+    group_id = agent_hierarchy.billing_group.id
+    user_id = uuid.uuid4()
+    tracker = HeavyHitterTracker(capacity=4, session_factory=session_factory)
+    tracker.record(group_id, credits=10, user_id=user_id)
+    merge_into_slots = tracker._merge_into_slots
+
+    async def cancelled(db, deltas):
+        tracker.record(group_id, credits=5, user_id=user_id)  # recorded mid-flush
+        raise asyncio.CancelledError
+
+    tracker._merge_into_slots = cancelled
+    with pytest.raises(asyncio.CancelledError):
+        await tracker.flush()
+
+    tracker._merge_into_slots = merge_into_slots
+    assert await tracker.flush() == 1
+    tracker._deltas.clear()
+    top = await tracker.top(db, group_id, "user", 1, window_hours=1)
+    assert [(hit.key, hit.count) for hit in top] == [(str(user_id), 15)]
+    await tracker.close()
+
+
+@pytest.mark.asyncio
+async def test_export_query_filters_and_endpoint_without_pyarrow(db: AsyncSession, agent_hierarchy):
+    from datetime import datetime, timedelta, timezone
+
+    from app.exports import service as export_service
+
+    h = agent_hierarchy
+    now = datetime.now(timezone.utc)
+    other_org = uuid.uuid4()
+    for org_id, age_hours, credits in ((h.org.id, 1, 5), (h.org.id, 30, 7), (other_org, 1, 11)):
+        db.add(
+            UsageEvent(
+                user_id=h.user.id,
+                group_id=h.billing_group.id,
+                org_id=org_id,
+                provider="mock",
+                model="mock-model",
+                input_tokens=1,
+                output_tokens=1,
+                total_tokens=2,
+                cost_usd=Decimal("0.01"),
+                credits_charged=credits,
+                status=UsageStatus.SUCCESS,
+                created_at=now - timedelta(hours=age_hours),
+            )
+        )
+    await db.commit()
+
+    async def credits(**filters) -> list[int]:
+        stmt = export_service.build_query("usage", **filters)
+        rows = (await db.execute(stmt)).mappings().all()
+        return sorted(row["credits_charged"] for row in rows)
+
+    assert await credits() == [5, 7, 11]
+    assert await credits(group_id=h.billing_group.id) == [5, 7, 11]
+    # org_id wins over group_id where the table has one
+    assert await credits(org_id=h.org.id, group_id=h.billing_group.id) == [5, 7]
+    assert await credits(org_id=h.org.id, start=now - timedelta(hours=24)) == [5]
+    assert await credits(org_id=h.org.id, end=now - timedelta(hours=24)) == [7]
+    # The ledger has no org column; it is scoped by billing group
+    ledger = export_service.build_query("ledger", org_id=h.org.id, group_id=h.billing_group.id)
+    assert "ledger.group_id = " in str(ledger)
+
+    if export_service.pyarrow_available():
+        return
+    app.dependency_overrides[get_db] = _override_db(db)
+    app.dependency_overrides[get_current_user] = _override_user(h.user)
+    try:
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://testserver"
+        ) as client:
+            response = await client.get(f"/exports/usage?org_id={h.org.id}")
+    finally:
+        app.dependency_overrides.clear()
+    assert response.status_code == 501
+    assert "pyarrow" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_export_streams_parquet_and_arrow_in_chunks(
+    db: AsyncSession, session_factory, agent_hierarchy
+):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    import io
+
+    from app.exports.service import stream_export
+    from app.ledger.models import LedgerEntry, TransactionType
+
+    h = agent_hierarchy
+    for credits in range(1, 6):
+        db.add(
+            UsageEvent(
+                user_id=h.user.id,
+                group_id=h.billing_group.id,
+                org_id=h.org.id,
+                provider="mock",
+                model="mock-model",
+                input_tokens=credits,
+                output_tokens=1,
+                total_tokens=credits + 1,
+                cost_usd=Decimal("0.01") * credits,
+                credits_charged=credits,
+                status=UsageStatus.SUCCESS,
+            )
+        )
+    db.add(
+        LedgerEntry(
+            group_id=h.billing_group.id,
+            amount=100,
+            type=TransactionType.CREDIT_PURCHASE,
+            metadata_={"source": "test"},
+        )
+    )
+    await db.commit()
+
+    chunks = [
+        chunk
+        async for chunk in stream_export(
+            "usage", "parquet", org_id=h.org.id, chunk_rows=2, session_factory=session_factory
+        )
+    ]
+    parquet = pq.ParquetFile(io.BytesIO(b"".join(chunks)))
+    assert parquet.metadata.num_row_groups == 3  # 2 + 2 + 1 rows
+    table = parquet.read()
+    assert sorted(table.column("credits_charged").to_pylist()) == [1, 2, 3, 4, 5]
+    assert set(table.column("org_id").to_pylist()) == {str(h.org.id)}
+    assert set(table.column("status").to_pylist()) == {"SUCCESS"}
+    assert sum(table.column("cost_usd").to_pylist()) == Decimal("0.15")
+
+    chunks = [
+        chunk
+        async for chunk in stream_export(
+            "ledger", "arrow", group_id=h.billing_group.id, session_factory=session_factory
+        )
+    ]
+    ledger = pa.ipc.open_stream(b"".join(chunks)).read_all()
+    assert ledger.column("amount").to_pylist() == [100]
+    assert ledger.column("type").to_pylist() == ["CREDIT_PURCHASE"]
+    assert ledger.column("metadata").to_pylist() == ['{"source": "test"}']
+
+
+@pytest.mark.asyncio
+async def test_abandoned_export_closes_its_writer(
+    db: AsyncSession, session_factory, agent_hierarchy, monkeypatch
+):
+    pa = pytest.importorskip("pyarrow")
+
+    from app.exports.service import stream_export
+
+    h = agent_hierarchy
+    for credits in range(1, 4):
+        db.add(
+            UsageEvent(
+                user_id=h.user.id,
+                group_id=h.billing_group.id,
+                provider="mock",
+                model="mock-model",
+                input_tokens=credits,
+                output_tokens=1,
+                total_tokens=credits + 1,
+                cost_usd=Decimal("0.01"),
+                credits_charged=credits,
+                status=UsageStatus.SUCCESS,
+            )
+        )
+    await db.commit()
+
+    closed: list[bool] = []
+    new_stream = pa.ipc.new_stream
+
+    class RecordingWriter:
+        def __init__(self, sink, schema):
+            self.writer = new_stream(sink, schema)
+
+        def write_batch(self, batch):
+            self.writer.write_batch(batch)
+
+        def close(self):
+            closed.append(True)
+            self.writer.close()
+
+    monkeypatch.setattr(pa.ipc, "new_stream", RecordingWriter)
+    export = stream_export(
+        "usage", "arrow", group_id=h.billing_group.id, chunk_rows=1,
+        session_factory=session_factory,
+    )
+    assert await anext(export)
+    await export.aclose()  # client disconnected after the first batch
+
+    assert closed == [True]
+
+
+@pytest.mark.asyncio
+async def test_revoke_key_endpoint_drops_cached_context_after_commit(
+    db: AsyncSession, agent_hierarchy
+):
+    from app.gateway import context as gateway_context
+
+    h = agent_hierarchy
+    url = f"/agents/{h.agent.id}/keys/{h.api_key.id}"
+    assert await gateway_context.resolve_agent_context(db, h.plaintext_key) is not None
+    await db.commit()  # the endpoint begins its own transaction
+    app.dependency_overrides[get_db] = _override_db(db)
+    app.dependency_overrides[get_current_user] = _override_user(h.user)
+    try:
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://testserver"
+        ) as client:
+            response = await client.delete(url)
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 204
+    assert len(gateway_context._context_cache) == 0
+    assert await gateway_context.resolve_agent_context(db, h.plaintext_key) is None
+
+
+@pytest.mark.asyncio
+async def test_credential_endpoints_drop_cached_key_after_commit(
+    db: AsyncSession, agent_hierarchy
+):
+    from app.credentials import service as cred_service
+
+    h = agent_hierarchy
+    org_id = h.org.id
+    # "No credential" is cached before the key is added.
+    assert await cred_service.get_active_credential(db, org_id, "openai") is None
+    await db.commit()  # the endpoint commits its own transaction
+    app.dependency_overrides[get_db] = _override_db(db)
+    app.dependency_overrides[get_current_user] = _override_user(h.user)
+    try:
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://testserver"
+        ) as client:
+            created = await client.post(
+                f"/orgs/{org_id}/credentials",
+                json={"provider": "openai", "api_key": "sk-added"},
+            )
+            assert created.status_code == 201
+            assert await cred_service.get_active_credential(db, org_id, "openai") == "sk-added"
+
+            deleted = await client.delete(f"/orgs/{org_id}/credentials/{created.json()['id']}")
+            assert deleted.status_code == 204
+            assert len(cred_service._credential_cache) == 0
+    finally:
+        app.dependency_overrides.clear()
+
+    assert await cred_service.get_active_credential(db, org_id, "openai") is None
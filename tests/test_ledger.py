@@ -1,10 +1,34 @@
 """Tests for ledger correctness — the financial core."""
 import uuid
+from datetime import datetime, timedelta, timezone
 
 import pytest
+from sqlalchemy import select, update
 
-from app.ledger.models import TransactionType
-from app.ledger.service import append_entry, get_group_balance
+from app.core.exceptions import InsufficientCreditsError
+from app.ledger.models import (
+    CreditHold,
+    HoldStatus,
+    LedgerCheckpoint,
+    LedgerEntry,
+    TransactionType,
+)
+from app.ledger.service import (
+    append_entry,
+    create_checkpoint,
+    deduct_credits,
+    expire_holds,
+    get_available_balance,
+    get_group_balance,
+    get_shard_balances,
+    place_hold,
+    rebalance_shards,
+    release_hold,
+    set_shard_count,
+    settle_hold,
+    verify_balance,
+    _lock_key,
+)
 
 
 @pytest.mark.asyncio
@@ -99,3 +123,424 @@ async def test_balance_isolated_per_group(db):
 
     assert await get_group_balance(db, g1.id) == 500
     assert await get_group_balance(db, g2.id) == 300
+
+
+@pytest.mark.asyncio
+async def test_holds_reduce_available_balance_not_ledger(db, sample_group):
+    """A hold reserves credits without writing to the ledger."""
+    group_id, _ = sample_group
+    await append_entry(db, group_id, amount=1000, type=TransactionType.CREDIT_PURCHASE)
+    await place_hold(db, group_id, amount=700, reference="req-a")
+    await db.commit()
+
+    assert await get_group_balance(db, group_id) == 1000
+    assert await get_available_balance(db, group_id) == 300
+
+    # A second reservation — or a plain deduction — cannot spend held credits.
+    with pytest.raises(InsufficientCreditsError):
+        await place_hold(db, group_id, amount=400, reference="req-b")
+    with pytest.raises(InsufficientCreditsError):
+        await deduct_credits(db, group_id, amount=400, idempotency_key="direct")
+
+
+@pytest.mark.asyncio
+async def test_settle_hold_charges_actual_amount(db, sample_group):
+    """Settlement appends the actual cost, which may exceed the hold and even the balance."""
+    group_id, _ = sample_group
+    await append_entry(db, group_id, amount=1000, type=TransactionType.CREDIT_PURCHASE)
+    hold = await place_hold(db, group_id, amount=100, reference="req-a")
+    other = await place_hold(db, group_id, amount=800, reference="req-b")
+    await db.commit()
+
+    # 150 > 100 held, but the other 100 unreserved credits cover the difference
+    entry = await settle_hold(db, hold.id, amount=150, idempotency_key="gateway:req-a")
+    await db.commit()
+    assert entry.amount == -150
+    assert hold.status == HoldStatus.SETTLED
+    assert await get_group_balance(db, group_id) == 850
+    assert await get_available_balance(db, group_id) == 50
+
+    # Idempotent replay returns the same entry
+    again = await settle_hold(db, hold.id, amount=150, idempotency_key="gateway:req-a")
+    assert again.id == entry.id
+
+    # Only 50 unreserved credits are left for the other request to overrun
+    # its hold by 100: delivered work is charged as far as the balance goes.
+    capped = await settle_hold(db, other.id, amount=900, idempotency_key="gateway:req-b")
+    await db.commit()
+    assert capped.amount == -850
+    assert capped.metadata_["shortfall"] == 50
+    assert other.status == HoldStatus.SETTLED
+    assert await get_group_balance(db, group_id) == 0
+    assert await get_available_balance(db, group_id) == 0
+    entries = (await db.execute(select(LedgerEntry))).scalars().all()
+    assert sorted(e.amount for e in entries) == [-850, -150, 1000]
+
+
+@pytest.mark.asyncio
+async def test_abandoned_holds_expire(db, sample_group):
+    """Expired holds stop counting immediately; the sweep marks them EXPIRED."""
+    group_id, _ = sample_group
+    await append_entry(db, group_id, amount=1000, type=TransactionType.CREDIT_PURCHASE)
+    stale = await place_hold(db, group_id, amount=600, reference="req-a", ttl_seconds=-1)
+    await place_hold(db, group_id, amount=100, reference="req-b")
+    await db.commit()
+
+    assert await get_available_balance(db, group_id) == 900
+    assert await expire_holds(db) == 1
+    await db.commit()
+    await db.refresh(stale)
+    assert stale.status == HoldStatus.EXPIRED
+
+
+@pytest.mark.asyncio
+async def test_checkpoint_plus_tail_equals_full_sum(db, sample_group):
+    """Balance = latest checkpoint + entries after it; verifier agrees."""
+    group_id, _ = sample_group
+    old = datetime.now(timezone.utc) - timedelta(hours=1)
+    for amount in (1000, -200, -50):
+        entry = await append_entry(db, group_id, amount=amount, type=TransactionType.ADJUSTMENT)
+        entry.created_at = old
+    await db.commit()
+
+    checkpoint = await create_checkpoint(db, group_id, min_entries=0)
+    await db.commit()
+    assert (checkpoint.balance, checkpoint.entry_count) == (750, 3)
+
+    # Recent entries are inside the lag window: they stay in the tail.
+    await append_entry(db, group_id, amount=-25, type=TransactionType.USAGE_DEDUCTION)
+    await db.commit()
+    assert await create_checkpoint(db, group_id, min_entries=0) is None
+    assert await get_group_balance(db, group_id) == 725
+
+    result = await verify_balance(db, group_id)
+    assert result.consistent
+    assert (result.balance, result.recomputed_balance, result.checkpoints_checked) == (725, 725, 1)
+
+
+@pytest.mark.asyncio
+async def test_verifier_detects_bad_checkpoint(db, sample_group):
+    """A checkpoint that disagrees with the raw ledger is reported."""
+    group_id, _ = sample_group
+    entry = await append_entry(db, group_id, amount=500, type=TransactionType.CREDIT_PURCHASE)
+    entry.created_at = datetime.now(timezone.utc) - timedelta(hours=1)
+    await db.commit()
+    checkpoint = await create_checkpoint(db, group_id, min_entries=0)
+    await db.commit()
+
+    await db.execute(
+        update(LedgerCheckpoint)
+        .where(LedgerCheckpoint.id == checkpoint.id)
+        .values(balance=9999)
+    )
+    await db.commit()
+
+    result = await verify_balance(db, group_id)
+    assert not result.consistent
+    assert (result.balance, result.recomputed_balance) == (9999, 500)
+    assert [(m.stored_balance, m.actual_balance) for m in result.mismatches] == [(9999, 500)]
+
+
+def test_lock_keys_use_64_bit_space():
+    group_id = uuid.uuid4()
+    keys = {_lock_key(group_id, shard) for shard in range(8)}
+    assert len(keys) == 8
+    assert all(-(2**63) <= k < 2**63 for k in keys)
+    assert _lock_key(group_id, 3) == _lock_key(uuid.UUID(str(group_id)), 3)
+    # Groups whose ids agree modulo 2**31 no longer share a lock.
+    other = uuid.UUID(int=group_id.int ^ (1 << 64))
+    assert _lock_key(group_id) != _lock_key(other)
+
+
+@pytest.mark.asyncio
+async def test_sharded_group_spreads_consolidates_and_merges(db, sample_group):
+    """Shards split the balance; transfers never change the group total."""
+    group_id, _ = sample_group
+    await append_entry(db, group_id, amount=1000, type=TransactionType.CREDIT_PURCHASE)
+    assert await set_shard_count(db, group_id, 4) == 750
+    await db.commit()
+    assert await get_shard_balances(db, group_id, range(4)) == [250, 250, 250, 250]
+    assert await rebalance_shards(db, group_id) == 0
+
+    await deduct_credits(db, group_id, amount=100, idempotency_key="shard-1")
+    hold = await place_hold(db, group_id, amount=200, reference="shard-hold")
+    await db.commit()
+    hold_id = hold.id
+    balances = await get_shard_balances(db, group_id, range(4))
+    assert sum(balances) == 700
+    assert balances[hold.shard] <= 50
+
+    # No single shard holds 600: the fullest one is topped up from the others.
+    entry = await deduct_credits(db, group_id, amount=600, idempotency_key="shard-2")
+    await db.commit()
+    assert await get_group_balance(db, group_id) == 300
+    assert await get_available_balance(db, group_id) == 100
+    assert await get_available_balance(db, group_id, shard=entry.shard) == 0
+    with pytest.raises(InsufficientCreditsError):
+        await deduct_credits(db, group_id, amount=150, idempotency_key="shard-3")
+    await db.rollback()
+
+    # Settling may overrun the hold's shard into another one.
+    settled = await settle_hold(db, hold_id, amount=250, idempotency_key="shard-settle")
+    await db.commit()
+    assert settled.amount == -250
+    assert await get_group_balance(db, group_id) == 50
+
+    transfers = (
+        await db.execute(
+            select(LedgerEntry.amount).where(
+                LedgerEntry.group_id == group_id,
+                LedgerEntry.type == TransactionType.SHARD_TRANSFER,
+            )
+        )
+    ).scalars().all()
+    assert transfers and sum(transfers) == 0
+
+    # Per-shard checkpoints verify against the ledger like whole-group ones.
+    old = datetime.now(timezone.utc) - timedelta(hours=1)
+    await db.execute(update(LedgerEntry).values(created_at=old))
+    await db.commit()
+    for shard in (None, 0, 1, 2, 3):
+        assert await create_checkpoint(db, group_id, min_entries=0, shard=shard) is not None
+    await db.commit()
+    result = await verify_balance(db, group_id)
+    assert result.consistent and result.checkpoints_checked == 5
+
+    # Merging back drains the extra shards into shard 0.
+    await set_shard_count(db, group_id, 1)
+    await db.commit()
+    assert await get_shard_balances(db, group_id, range(4)) == [50, 0, 0, 0]
+    assert await get_group_balance(db, group_id) == 50
+
+
+@pytest.mark.asyncio
+async def test_stale_cached_shard_count_is_corrected_under_the_lock(db, sample_group):
+    """A count changed by another process is caught before the balance check."""
+    from app.ledger.service import _shard_counts, get_shard_count
+
+    group_id, _ = sample_group
+    await append_entry(db, group_id, amount=100, type=TransactionType.CREDIT_PURCHASE)
+    await set_shard_count(db, group_id, 4)
+    await db.commit()
+    _shard_counts.set(group_id, 1)  # this process has not seen the split
+
+    # Checked against shard 0 alone as if unsharded, 30 would overdraw it.
+    await deduct_credits(db, group_id, amount=30, idempotency_key="stale-split")
+    await db.commit()
+    assert await get_shard_count(db, group_id) == 4
+    balances = await get_shard_balances(db, group_id, range(4))
+    assert sum(balances) == 70 and min(balances) >= 0
+
+    await set_shard_count(db, group_id, 1)
+    await db.commit()
+    _shard_counts.set(group_id, 4)  # ...nor the merge
+    hold = await place_hold(db, group_id, amount=70, reference="stale-merge")
+    await db.commit()
+    assert hold.shard == 0
+    assert await get_shard_count(db, group_id) == 1
+    assert await get_available_balance(db, group_id) == 0
+
+
+@pytest.mark.asyncio
+async def test_batched_deductions_share_one_transaction(db, sample_group, session_factory):
+    """Concurrent deductions settle together; each caller gets its own outcome."""
+    import asyncio
+
+    from app.db.session import count_statements
+    from app.ledger.service import DeductionBatcher
+    from app.usage.models import UsageEvent
+    from app.usage.service import build_usage_event
+
+    group_id, user_id = sample_group
+    await append_entry(db, group_id, amount=1000, type=TransactionType.CREDIT_PURCHASE)
+    await db.commit()
+
+    batcher = DeductionBatcher(window_seconds=0.01, session_factory=session_factory)
+    events = [
+        build_usage_event(
+            user_id=user_id, group_id=group_id, provider="mock", model="mock",
+            input_tokens=1, output_tokens=1, cost_usd=0, credits_charged=300,
+        )
+        for _ in range(5)
+    ]
+    with count_statements(db.bind) as counter:
+        results = await asyncio.gather(
+            *(
+                batcher.deduct(group_id, 300, f"batch-{i}", attach=[events[i]])
+                for i in range(5)
+            ),
+            batcher.deduct(group_id, 300, "batch-0"),  # replay inside the batch
+            return_exceptions=True,
+        )
+    # Existing keys, shard count, balance, then one INSERT per table
+    assert counter.statements <= 6
+
+    ok = [r for r in results[:5] if isinstance(r, LedgerEntry)]
+    failed = [r for r in results[:5] if isinstance(r, InsufficientCreditsError)]
+    assert [e.idempotency_key for e in ok] == ["batch-0", "batch-1", "batch-2"]
+    assert [(e.balance, e.required) for e in failed] == [(100, 300), (100, 300)]
+    assert results[5].id == results[0].id
+    assert await get_group_balance(db, group_id) == 100
+    # Usage events only exist for the deductions that went through
+    recorded = (await db.execute(select(UsageEvent.id))).scalars().all()
+    assert sorted(recorded) == sorted(e.id for e in events[:3])
+
+    # A later replay outside the batch returns the stored entry
+    replay = await batcher.deduct(group_id, 300, "batch-1")
+    assert replay.id == ok[1].id
+    await batcher.drain()
+
+
+@pytest.mark.asyncio
+async def test_batched_hold_settlements_share_one_transaction(db, sample_group, session_factory):
+    """Gateway settlements group-commit too, keeping each hold's reservation intact."""
+    import asyncio
+
+    from app.core.exceptions import AppError
+    from app.db.session import count_statements
+    from app.ledger.service import DeductionBatcher
+
+    group_id, _ = sample_group
+    await append_entry(db, group_id, amount=1000, type=TransactionType.CREDIT_PURCHASE)
+    holds = [await place_hold(db, group_id, amount=200, reference=f"req-{i}") for i in range(4)]
+    released = await place_hold(db, group_id, amount=100, reference="req-released")
+    await release_hold(db, released.id)
+    await db.commit()
+    hold_ids = [h.id for h in holds]
+
+    batcher = DeductionBatcher(window_seconds=0.01, session_factory=session_factory)
+    hooked: list[int] = []
+
+    async def on_settled(session, entry):
+        hooked.append(-entry.amount)
+
+    def settle(i, amount):
+        return batcher.settle_hold(
+            group_id, hold_ids[i], amount, f"gateway:req-{i}", on_settled=on_settled
+        )
+
+    with count_statements(db.bind) as counter:
+        results = await asyncio.gather(
+            settle(0, 100),
+            settle(1, 300),  # overrun into the 200 unreserved credits
+            settle(2, 500),  # overrun past the balance: capped
+            settle(3, 200),  # its own hold still covers it
+            batcher.settle_hold(group_id, released.id, 50, "gateway:req-released"),
+            settle(0, 100),  # replay inside the batch
+            return_exceptions=True,
+        )
+    # Existing keys, holds, shard count and balance, one INSERT per table,
+    # one UPDATE of the holds
+    assert counter.statements <= 7
+
+    assert [-e.amount for e in results[:4]] == [100, 300, 400, 200]
+    assert results[2].metadata_["shortfall"] == 100
+    assert isinstance(results[4], AppError) and results[4].status_code == 409
+    assert results[5].id == results[0].id
+    assert hooked == [100, 300, 400, 200]  # once per settlement, not on replay
+    assert await get_group_balance(db, group_id) == 0
+    assert await get_available_balance(db, group_id) == 0
+    statuses = (
+        await db.execute(select(CreditHold.status).where(CreditHold.id.in_(hold_ids)))
+    ).scalars().all()
+    assert statuses == [HoldStatus.SETTLED] * 4
+    await batcher.drain()
+
+
+@pytest.mark.asyncio
+async def test_worker_shutdown_drains_queued_deductions(
+    db, sample_group, session_factory, monkeypatch
+):
+    """Deductions still waiting for their batch window settle before the worker exits."""
+    import asyncio
+
+    from app.ledger.service import DeductionBatcher
+    from app.workflows import worker
+
+    group_id, _ = sample_group
+    await append_entry(db, group_id, amount=100, type=TransactionType.CREDIT_PURCHASE)
+    await db.commit()
+    batcher = DeductionBatcher(window_seconds=60, session_factory=session_factory)
+    monkeypatch.setattr(worker, "deduction_batcher", batcher)
+
+    pending = asyncio.create_task(
+        batcher.deduct(group_id, amount=40, idempotency_key="worker-shutdown")
+    )
+    await asyncio.sleep(0)  # queued, window not yet elapsed
+    await worker.shutdown()
+
+    assert (await pending).amount == -40
+    assert await get_group_balance(db, group_id) == 60
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key_unique_across_partitions(db, sample_group, session_factory):
+    """A key claimed in one month cannot be reused by an entry in another."""
+    from sqlalchemy.exc import IntegrityError
+
+    from app.ledger.models import LedgerIdempotencyKey
+    from app.ledger.service import _new_entry
+
+    group_id, _ = sample_group
+    first = await append_entry(
+        db, group_id, amount=100, type=TransactionType.CREDIT_PURCHASE, idempotency_key="once"
+    )
+    replay = await append_entry(
+        db, group_id, amount=100, type=TransactionType.CREDIT_PURCHASE, idempotency_key="once"
+    )
+    assert replay.id == first.id
+    claim = await db.get(LedgerIdempotencyKey, "once")
+    assert claim.ledger_entry_id == first.id
+    await db.commit()
+
+    rows = _new_entry(group_id, 100, TransactionType.CREDIT_PURCHASE, "once", None, 0)
+    rows[0].created_at = first.created_at - timedelta(days=62)
+    rows[1].entry_created_at = rows[0].created_at
+    async with session_factory() as other:
+        other.add_all(rows)
+        with pytest.raises(IntegrityError):
+            await other.flush()
+    assert await get_group_balance(db, group_id) == 100
+
+
+@pytest.mark.asyncio
+async def test_monthly_partition_bounds(db):
+    from app.db.partitions import add_months, create_partitions, partition_for
+
+    est = timezone(timedelta(hours=-5))
+    partition = partition_for("usage_events", datetime(2026, 12, 31, 22, 0, tzinfo=est))
+    assert partition.name == "usage_events_y2027m01"
+    assert partition.start == datetime(2027, 1, 1, tzinfo=timezone.utc)
+    assert partition.end == datetime(2027, 2, 1, tzinfo=timezone.utc)
+    assert add_months(partition.start, -13) == datetime(2025, 12, 1, tzinfo=timezone.utc)
+
+    with pytest.raises(RuntimeError):
+        await create_partitions(db)
+
+
+@pytest.mark.asyncio
+async def test_keyed_append_needs_no_lookup(db, sample_group, session_factory):
+    """The key claim is the replay check; replays return the stored entry."""
+    from app.db.session import count_statements
+
+    group_id, _ = sample_group
+    with count_statements(db.bind) as counter:
+        first = await append_entry(
+            db, group_id, amount=100, type=TransactionType.CREDIT_PURCHASE, idempotency_key="topup"
+        )
+    assert counter.statements == 2  # claim + insert (one statement on PostgreSQL)
+    await db.commit()
+
+    async with session_factory() as other:
+        replay = await append_entry(
+            other, group_id, amount=100, type=TransactionType.CREDIT_PURCHASE,
+            idempotency_key="topup",
+        )
+        await other.commit()
+    assert replay.id == first.id
+
+    # A replayed deduction still returns its entry once the balance is spent
+    spent = await deduct_credits(db, group_id, amount=100, idempotency_key="spend")
+    await db.commit()
+    assert (await deduct_credits(db, group_id, amount=100, idempotency_key="spend")).id == spent.id
+    assert await get_group_balance(db, group_id) == 0